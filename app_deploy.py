@@ -3,12 +3,12 @@ Virtual Try-On Web UI - Deployment Version
 Optimized for Hugging Face Spaces deployment
 """
 
+import startup  # first, so startup timings cover every other import
+
 import os
 import sys
-from datetime import datetime
+import threading
 from pathlib import Path
-import gradio as gr
-from PIL import Image
 
 # Set environment variables from Hugging Face Secrets
 os.environ['GOOGLE_CLOUD_PROJECT'] = os.getenv('GOOGLE_CLOUD_PROJECT', 'renderedfitsnew')
@@ -23,149 +23,282 @@ if CREDENTIALS_JSON:
         f.write(CREDENTIALS_JSON)
     os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = creds_path
 
-from virtual_tryon import VirtualTryOn
+from job_queue import JobQueue, QueueFull
+from result_tiers import ResultTiers
+from session_cache import SessionPayloadCache
 import config
+import metrics
 
 
-# Initialize Virtual Try-On client
-print("Initializing Virtual Try-On client...")
-try:
-    vto = VirtualTryOn(project_id='renderedfitsnew', location='us-central1')
-    print("✅ Client initialized successfully!")
-    AUTH_SUCCESS = True
-except Exception as e:
-    print(f"❌ Error initializing client: {e}")
-    vto = None
-    AUTH_SUCCESS = False
+def _build_client():
+    """Create the Virtual Try-On client and export its stats on /metrics."""
+    # Imported here so that with VTO_LAZY_STARTUP=1 google.genai loads
+    # alongside gradio instead of before it
+    from virtual_tryon import VirtualTryOn
+    from result_cache import ResultCache
+    from image_preprocess import ImagePreprocessor
+    from outfit_cache import OutfitPrefixCache
 
+    print("Initializing Virtual Try-On client...")
+    try:
+        vto = VirtualTryOn(
+            project_id='renderedfitsnew',
+            location='us-central1',
+            cache=ResultCache(),
+            preprocessor=ImagePreprocessor(),
+            outfit_cache=OutfitPrefixCache(),
+            priority="interactive"
+        )
+    except Exception as e:
+        print(f"❌ Error initializing client: {e}")
+        raise
+    # Fetch tokens and open connections now rather than in the first request
+    if vto.warm():
+        print("✅ Client initialized successfully!")
+    else:
+        print("⚠️ Client initialized, but Vertex AI could not be reached yet")
 
-def virtual_tryon_single(person_image, clothing_image, num_images, safety_level, progress=gr.Progress()):
-    """Perform virtual try-on with a single clothing item."""
-    if vto is None:
-        error_msg = "❌ Authentication not configured.\n\n"
-        error_msg += "This app requires Google Cloud credentials to be set up.\n"
-        error_msg += "Please contact the administrator."
-        return None, error_msg
+    metrics.registry.register_collector("singleflight", vto.single_flight.stats)
+    metrics.registry.register_collector("retries", vto.retrier.stats)
+    vto.pool.register_metrics()
+    metrics.registry.register_collector("warmup", vto.pool.keep_warm_stats)
+    return vto
 
-    if person_image is None:
-        return None, "❌ Please upload a person image."
 
-    if clothing_image is None:
-        return None, "❌ Please upload a clothing image."
+client = startup.LazyInit("client", _build_client)
 
+
+def get_vto():
+    """The Virtual Try-On client (waiting for it if still starting), or None if it failed."""
     try:
-        progress(0, desc="Preparing images...")
+        return client.get()
+    except Exception:
+        return None
 
-        # Save temporary files
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        temp_person = f"/tmp/temp_person_{timestamp}.png"
-        temp_clothing = f"/tmp/temp_clothing_{timestamp}.png"
 
-        person_image.save(temp_person)
-        clothing_image.save(temp_clothing)
+def client_ready() -> bool:
+    """True once the client is built and warmed; never waits."""
+    vto = get_vto() if client.done() else None
+    return vto is not None and vto.ready()
 
-        progress(0.3, desc="Sending to Virtual Try-On API...")
 
-        # Perform virtual try-on
-        results = vto.try_on_single_item(
-            person_image_path=temp_person,
-            clothing_image_path=temp_clothing,
-            number_of_images=num_images,
-            safety_filter_level=safety_level
-        )
+def _build_tiers():
+    """Open the preview tiers and export their stats on /metrics."""
+    # Small previews go to the browser at once; full-resolution files on demand
+    result_tiers = ResultTiers()
+    metrics.registry.register_collector("previews", result_tiers.stats)
+    return result_tiers
 
-        progress(0.8, desc="Loading results...")
 
-        # Load generated images
-        generated_images = []
-        for result_path in results:
-            img = Image.open(result_path)
-            generated_images.append(img)
+# Creates and scans its directory, so it is built with the client (in the
+# background with VTO_LAZY_STARTUP=1), not on import
+previews = startup.LazyInit("previews", _build_tiers)
 
-        # Clean up temp files
-        try:
-            os.remove(temp_person)
-            os.remove(temp_clothing)
-        except:
-            pass
 
-        progress(1.0, desc="Complete!")
+# Initialize Virtual Try-On client and previews, in the background with VTO_LAZY_STARTUP=1
+if config.LAZY_STARTUP:
+    client.start()
+    previews.start()
+else:
+    get_vto()
+    previews.get()
 
-        success_msg = f"✅ Success! Generated {len(generated_images)} image(s)."
+import gradio as gr
+startup.mark("gradio_imported")
 
-        if len(generated_images) == 1:
-            return generated_images[0], success_msg
-        else:
-            return generated_images, success_msg
+# Try-ons run on a fixed worker pool sized to our quota; UI handlers only wait
+job_queue = JobQueue()
+# Each session's person photo is preprocessed once and reused for every try-on
+session_cache = SessionPayloadCache()
 
-    except Exception as e:
-        # Clean up temp files if they exist
-        try:
-            if os.path.exists(temp_person):
-                os.remove(temp_person)
-            if os.path.exists(temp_clothing):
-                os.remove(temp_clothing)
-        except:
-            pass
+# Per-stage timings plus queue, coalescing, retry, limiter and startup state on /metrics
+metrics.registry.register_collector("jobs", job_queue.stats)
+metrics.registry.register_collector("startup", startup.phases)
+metrics.registry.register_collector("session_cache", session_cache.stats)
+# /ready stays 503 until the client is built and warmed
+metrics.registry.register_readiness("client", client_ready)
+metrics.start_http_server()
 
-        error_msg = f"❌ Error: {str(e)}\n\n"
-        error_msg += "This might be a temporary issue. Please try again."
-        return None, error_msg
 
+def _user_id(request: gr.Request) -> str:
+    """Queue fairness key: one per browser session."""
+    return getattr(request, "session_hash", None) or "anonymous"
 
-def virtual_tryon_multiple(person_image, clothing_images, safety_level, progress=gr.Progress()):
-    """Perform virtual try-on with multiple clothing items sequentially."""
+
+def _person_payload(vto, user: str, person_image):
+    """The session's prepared person image, built on its first try-on."""
+    return session_cache.get_or_prepare(user, person_image, vto.prepare_input)
+
+
+def _end_session(request: gr.Request):
+    """Free the closed tab's cached payloads."""
+    session_cache.drop(_user_id(request))
+
+
+def _full_resolution_button(full_path):
+    """Download button for one result; the browser only fetches the file when clicked."""
+    return gr.update(value=full_path, visible=full_path is not None)
+
+
+def show_full_resolution(full_paths, evt: gr.SelectData):
+    """Point the download button at the full-resolution file of the clicked result."""
+    if not full_paths or evt.index >= len(full_paths):
+        return _full_resolution_button(None)
+    return _full_resolution_button(full_paths[evt.index])
+
+
+def virtual_tryon_single(person_image, clothing_image, num_images, safety_level, request: gr.Request):
+    """Perform virtual try-on with a single clothing item."""
+    vto = get_vto()
     if vto is None:
-        return None, "❌ Authentication not configured. Please contact the administrator."
+        error_msg = "❌ Authentication not configured.\n\n"
+        error_msg += "This app requires Google Cloud credentials to be set up.\n"
+        error_msg += "Please contact the administrator."
+        yield None, error_msg, [], _full_resolution_button(None)
+        return
 
     if person_image is None:
-        return None, "❌ Please upload a person image."
+        yield None, "❌ Please upload a person image.", [], _full_resolution_button(None)
+        return
 
-    if not clothing_images or len(clothing_images) == 0:
-        return None, "❌ Please upload at least one clothing image."
+    if clothing_image is None:
+        yield None, "❌ Please upload a clothing image.", [], _full_resolution_button(None)
+        return
+    result_tiers = previews.get()
+
+    try:
+        # Perform virtual try-on on a queue worker
+        # Results come back encoded; only the preview and full-resolution tiers are stored
+        job = job_queue.submit(
+            _user_id(request),
+            _try_on_single,
+            user=_user_id(request),
+            person_image=person_image,
+            clothing_image_path=clothing_image,
+            number_of_images=num_images,
+            safety_filter_level=safety_level,
+            return_type="bytes"
+        )
+    except QueueFull as e:
+        yield None, f"❌ {e}", [], _full_resolution_button(None)
+        return
 
     try:
-        progress(0, desc="Preparing images...")
+        for status in job_queue.progress(job):
+            yield gr.update(), status, gr.update(), gr.update()
+        generated_images = job.result()
 
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        temp_person = f"/tmp/temp_person_{timestamp}.png"
-        person_image.save(temp_person)
+        success_msg = f"✅ Success! Generated {len(generated_images)} image(s)."
 
-        temp_clothing_paths = []
-        for idx, clothing_img in enumerate(clothing_images):
-            temp_path = f"/tmp/temp_clothing_{timestamp}_{idx}.png"
-            clothing_img.save(temp_path)
-            temp_clothing_paths.append(temp_path)
+        # Previews are encoded once and served as files; Gradio doesn't re-encode them
+        with metrics.stage("ui_postprocess", method="single"):
+            tiers = [result_tiers.add(image) for image in generated_images]
+            full_paths = [t.full for t in tiers]
+            yield (
+                [t.preview for t in tiers],
+                success_msg,
+                full_paths,
+                _full_resolution_button(full_paths[0] if full_paths else None),
+            )
 
-        progress(0.3, desc=f"Processing {len(temp_clothing_paths)} items...")
+    except Exception as e:
+        error_msg = f"❌ Error: {str(e)}\n\n"
+        error_msg += "This might be a temporary issue. Please try again."
+        yield None, error_msg, [], _full_resolution_button(None)
+    finally:
+        # Cancel button or closed tab: give the slot to the next user
+        job.cancel()
 
-        results = vto.try_on_multiple_items(
-            person_image_path=temp_person,
-            clothing_items=temp_clothing_paths,
-            number_of_images=1,
-            safety_filter_level=safety_level
-        )
 
-        progress(0.9, desc="Loading result...")
+def _try_on_single(user, person_image, **kwargs):
+    """Job body for the single-item tab; the person photo is prepared on the worker."""
+    vto = get_vto()
+    return vto.try_on_single_item(person_image_path=_person_payload(vto, user, person_image), **kwargs)
 
-        final_image = Image.open(results[-1])
 
-        # Clean up temp files
-        try:
-            os.remove(temp_person)
-            for temp_path in temp_clothing_paths:
-                os.remove(temp_path)
-        except:
-            pass
+def _run_chain(steps, stop, user, person_image, **kwargs):
+    """Job body for the multi-item tab: collect each step's image as it lands."""
+    vto = get_vto()
+    person_image_path = _person_payload(vto, user, person_image)
+    for outputs in vto.iter_multiple_items(person_image_path=person_image_path, **kwargs):
+        steps.append(outputs[0])
+        if stop.is_set():
+            # Cancelled from the UI; don't pay for the remaining garments
+            break
+    return steps
 
-        progress(1.0, desc="Complete!")
 
-        success_msg = f"✅ Success! Tried on {len(temp_clothing_paths)} items sequentially."
-        return final_image, success_msg
+def virtual_tryon_multiple(person_image, clothing_images, safety_level, request: gr.Request):
+    """Perform virtual try-on with multiple clothing items sequentially."""
+    if get_vto() is None:
+        yield None, "❌ Authentication not configured. Please contact the administrator.", _full_resolution_button(None)
+        return
+
+    if person_image is None:
+        yield None, "❌ Please upload a person image.", _full_resolution_button(None)
+        return
+
+    if not clothing_images or len(clothing_images) == 0:
+        yield None, "❌ Please upload at least one clothing image.", _full_resolution_button(None)
+        return
+    result_tiers = previews.get()
+
+    steps = []
+    stop = threading.Event()
+    try:
+        job = job_queue.submit(
+            _user_id(request),
+            _run_chain,
+            steps=steps,
+            stop=stop,
+            user=_user_id(request),
+            person_image=person_image,
+            clothing_items=clothing_images,
+            number_of_images=1,
+            safety_filter_level=safety_level,
+            return_type="bytes"
+        )
+    except QueueFull as e:
+        yield None, f"❌ {e}", _full_resolution_button(None)
+        return
+
+    try:
+        shown = 0
+        for status in job_queue.progress(job):
+            # Show each garment as soon as its step is done
+            image = gr.update()
+            if len(steps) > shown:
+                shown = len(steps)
+                image = result_tiers.add(steps[-1]).preview
+            if steps:
+                status = f"🧩 {len(steps)}/{len(clothing_images)} items done. {status}"
+            yield image, status, gr.update()
+        final = result_tiers.add(job.result()[-1])
+
+        success_msg = f"✅ Success! Tried on {len(clothing_images)} items sequentially."
+        with metrics.stage("ui_postprocess", method="multiple"):
+            yield final.preview, success_msg, _full_resolution_button(final.full)
 
     except Exception as e:
         error_msg = f"❌ Error: {str(e)}"
-        return None, error_msg
+        yield None, error_msg, _full_resolution_button(None)
+    finally:
+        stop.set()
+        job.cancel()
+
+
+def connection_status() -> str:
+    """Markdown for the status banner at the top of the page."""
+    vto = get_vto()
+    if vto is None or not vto.ready():
+        return """
+        ### ⚠️ Configuration Required
+        This application requires Google Cloud authentication to be configured by the administrator.
+        """
+    return """
+        ### ✅ Ready to Use
+        Start uploading your images below!
+        """
 
 
 # Create Gradio interface
@@ -179,17 +312,15 @@ with gr.Blocks(title="Virtual Try-On", theme=gr.themes.Soft()) as app:
     **Supported Clothing:** Tops, bottoms, dresses, footwear, and more.
     """)
 
-    # Status indicator
-    if not AUTH_SUCCESS:
-        gr.Markdown("""
-        ### ⚠️ Configuration Required
-        This application requires Google Cloud authentication to be configured by the administrator.
-        """)
-    else:
-        gr.Markdown("""
-        ### ✅ Ready to Use
-        Start uploading your images below!
-        """)
+    # Status indicator; filled in on page load if the client is still starting
+    status_banner = gr.Markdown(
+        connection_status() if client.done() else "### ⏳ Starting up..."
+    )
+    if not client.done():
+        app.load(connection_status, outputs=status_banner)
+    # Gradio releases before unload() was added keep a closed tab's payloads until evicted
+    if hasattr(app, "unload"):
+        app.unload(_end_session)
 
     with gr.Tabs():
 
@@ -235,18 +366,26 @@ with gr.Blocks(title="Virtual Try-On", theme=gr.themes.Soft()) as app:
                     label="Safety Filter Level"
                 )
 
-            generate_btn = gr.Button("✨ Generate Virtual Try-On", variant="primary", size="lg")
+            with gr.Row():
+                generate_btn = gr.Button("✨ Generate Virtual Try-On", variant="primary", size="lg", scale=4)
+                cancel_btn = gr.Button("Cancel", size="lg", scale=1)
 
             with gr.Row():
-                output_image = gr.Image(label="Result", height=500)
+                # Previews of every variation; the full-resolution file is fetched on download
+                output_gallery = gr.Gallery(label="Result(s)", height=500)
+
+            full_paths = gr.State([])
+            download_btn = gr.DownloadButton("⬇️ Download full resolution", visible=False)
 
             status_text = gr.Textbox(label="Status", lines=3, max_lines=10)
 
-            generate_btn.click(
+            generate_event = generate_btn.click(
                 fn=virtual_tryon_single,
                 inputs=[person_input, clothing_input, num_images, safety_level],
-                outputs=[output_image, status_text]
+                outputs=[output_gallery, status_text, full_paths, download_btn]
             )
+            output_gallery.select(show_full_resolution, inputs=full_paths, outputs=download_btn)
+            cancel_btn.click(fn=None, cancels=[generate_event])
 
             gr.Markdown("""
             ### 💡 Tips for Best Results
@@ -289,27 +428,28 @@ with gr.Blocks(title="Virtual Try-On", theme=gr.themes.Soft()) as app:
                 label="Safety Filter Level"
             )
 
-            generate_btn_multi = gr.Button("✨ Generate Sequential Try-On", variant="primary", size="lg")
+            with gr.Row():
+                generate_btn_multi = gr.Button("✨ Generate Sequential Try-On", variant="primary", size="lg", scale=4)
+                cancel_btn_multi = gr.Button("Cancel", size="lg", scale=1)
 
             output_image_multi = gr.Image(label="Final Result", height=500)
+            download_btn_multi = gr.DownloadButton("⬇️ Download full resolution", visible=False)
             status_text_multi = gr.Textbox(label="Status", lines=3, max_lines=10)
 
-            def process_multiple_images(person_img, clothing_files, safety):
+            def process_multiple_images(person_img, clothing_files, safety, request: gr.Request):
                 if clothing_files is None or len(clothing_files) == 0:
-                    return None, "Please upload clothing images"
+                    yield None, "Please upload clothing images", _full_resolution_button(None)
+                    return
 
-                clothing_images = []
-                for file_path in clothing_files:
-                    img = Image.open(file_path)
-                    clothing_images.append(img)
+                # Uploaded files are already encoded; send them as-is
+                yield from virtual_tryon_multiple(person_img, list(clothing_files), safety, request)
 
-                return virtual_tryon_multiple(person_img, clothing_images, safety)
-
-            generate_btn_multi.click(
+            generate_event_multi = generate_btn_multi.click(
                 fn=process_multiple_images,
                 inputs=[person_input_multi, clothing_input_multi, safety_level_multi],
-                outputs=[output_image_multi, status_text_multi]
+                outputs=[output_image_multi, status_text_multi, download_btn_multi]
             )
+            cancel_btn_multi.click(fn=None, cancels=[generate_event_multi])
 
         # Tab 3: About
         with gr.Tab("ℹ️ About"):
@@ -344,10 +484,20 @@ with gr.Blocks(title="Virtual Try-On", theme=gr.themes.Soft()) as app:
     Made with Gradio and Google Vertex AI
     """)
 
+# Handlers mostly wait on the job queue, so let Gradio run as many as can be
+# queued (launch's max_threads below must allow it too); the job queue's
+# workers decide how many try-ons actually run
+app.queue(default_concurrency_limit=config.JOB_QUEUE_MAX_SIZE)
+startup.mark("ui_built")
+
 
 if __name__ == "__main__":
     app.launch(
         server_name="0.0.0.0",
         server_port=7860,
-        share=False
+        share=False,
+        # Gradio's worker threads otherwise cap waiting handlers at 40
+        max_threads=config.JOB_QUEUE_MAX_SIZE,
+        # Previews and full-resolution files are served from the tier store
+        allowed_paths=[str(config.RESULT_TIERS_DIR)]
     )
@@ -0,0 +1,310 @@
+"""
+Asyncio-native Virtual Try-On
+Runs many try-ons concurrently from one event loop using the genai client's async surface.
+"""
+
+import asyncio
+from typing import AsyncIterator, Optional
+
+from google.genai.types import Image
+
+import config
+import metrics
+import rate_limiter
+from backends import Backend
+from image_preprocess import ImagePreprocessor
+from output_sinks import OutputSink
+from result_cache import ResultCache
+from virtual_tryon import ImageSource, VirtualTryOn, describe_image
+
+
+class AsyncVirtualTryOn:
+    """Async counterpart of VirtualTryOn.
+
+    Upstream calls go through ``client.aio``, are bounded by a semaphore and
+    draw from the same client pool and rate limiters as the wrapped
+    VirtualTryOn; file reads, cache access and saving run in worker threads
+    so the event loop never blocks on disk I/O.
+    """
+
+    def __init__(
+        self,
+        project_id: Optional[str] = None,
+        location: Optional[str] = None,
+        cache: Optional[ResultCache] = None,
+        sink: Optional[OutputSink] = None,
+        preprocessor: Optional[ImagePreprocessor] = None,
+        max_concurrency: Optional[int] = None,
+        vto: Optional[VirtualTryOn] = None,
+        backend: Optional[Backend] = None
+    ):
+        """Initialize the async Virtual Try-On client.
+
+        Args:
+            project_id: Google Cloud Project ID
+            location: Google Cloud region (default: us-central1)
+            cache: Optional result cache shared with synchronous callers
+            sink: Optional default sink that persists generated images
+            preprocessor: Optional input normalization applied before upload
+            max_concurrency: Maximum number of recontext_image calls in flight
+                (default: config.MAX_CONCURRENT_REQUESTS)
+            vto: Existing VirtualTryOn to reuse instead of creating a new client
+            backend: Service client to call instead of Vertex AI (see VirtualTryOn)
+        """
+        self.vto = vto or VirtualTryOn(
+            project_id=project_id,
+            location=location,
+            cache=cache,
+            sink=sink,
+            preprocessor=preprocessor,
+            backend=backend
+        )
+        self.max_concurrency = max_concurrency or config.MAX_CONCURRENT_REQUESTS
+        # Created lazily so it binds to the loop that actually runs the requests
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def warm(self) -> bool:
+        """Pre-warm tokens and the async client's connections; see VirtualTryOn.warm."""
+        ready = await self.vto.pool.warm_async()
+        self.vto.pool.start_keep_warm()
+        return ready
+
+    def ready(self) -> bool:
+        """True once at least one endpoint has been warmed."""
+        return self.vto.ready()
+
+    async def _recontext(
+        self,
+        person_image: Image,
+        clothing_image: Image,
+        number_of_images: int,
+        safety_filter_level: str,
+        stage_person: bool
+    ) -> list:
+        # Staging lookups hit the SQLite index; keep them off the loop
+        request_kwargs = await asyncio.to_thread(
+            self.vto._request_kwargs,
+            person_image, clothing_image, number_of_images, safety_filter_level, stage_person,
+        )
+
+        async def attempt():
+            async with self.semaphore:
+                return await self.vto.pool.recontext_image_async(**request_kwargs)
+
+        with rate_limiter.priority(rate_limiter.current_priority(self.vto.priority)):
+            response = await self.vto.retrier.call_async(attempt)
+        return [generated_image.image for generated_image in response.generated_images]
+
+    async def _try_on(
+        self,
+        person_image: Image,
+        clothing_image: Image,
+        number_of_images: int,
+        safety_filter_level: str,
+        stage_person: bool = True
+    ) -> list:
+        cache_key, images = await asyncio.to_thread(
+            self.vto._cache_lookup,
+            person_image, clothing_image, number_of_images, safety_filter_level,
+        )
+        if images is not None:
+            return images
+
+        async def generate() -> list:
+            generated = await self._recontext(
+                person_image, clothing_image, number_of_images, safety_filter_level, stage_person
+            )
+            await asyncio.to_thread(self.vto._cache_store, cache_key, generated)
+            return generated
+
+        # Shares in-flight calls with synchronous callers of the same VirtualTryOn
+        return list(await self.vto.single_flight.do_async(
+            self.vto._flight_key(person_image, clothing_image, number_of_images, safety_filter_level),
+            generate,
+        ))
+
+    @metrics.instrument("single")
+    async def try_on_single_item(
+        self,
+        person_image_path: ImageSource,
+        clothing_image_path: ImageSource,
+        output_path: Optional[str] = None,
+        number_of_images: int = 1,
+        safety_filter_level: str = "BLOCK_LOW_AND_ABOVE",
+        return_type: str = "path",
+        sink: Optional[OutputSink] = None
+    ) -> list:
+        """Try on a single clothing item.
+
+        Args:
+            person_image_path: Path to the person image, or the image itself
+                (PIL image, encoded bytes or memoryview)
+            clothing_image_path: Path to the clothing item image, or the image itself
+            output_path: Optional output path for the generated image
+            number_of_images: Number of images to generate (1-4)
+            safety_filter_level: Safety filter level
+            return_type: "path", "bytes" or "pil" (see VirtualTryOn.try_on_single_item)
+            sink: Optional sink that persists the images
+
+        Returns:
+            List of generated images
+        """
+        self.vto._check_return_type(return_type)
+        person_image, clothing_image = await asyncio.gather(
+            asyncio.to_thread(self.vto._prepare_input, person_image_path),
+            asyncio.to_thread(self.vto._prepare_input, clothing_image_path, garment=True),
+        )
+
+        images = await self._try_on(
+            person_image, clothing_image, number_of_images, safety_filter_level
+        )
+        return await asyncio.to_thread(
+            self.vto._deliver,
+            images, output_path, "tryon", return_type, sink, safety_filter_level,
+            (person_image, clothing_image, person_image),
+        )
+
+    async def try_on_multiple_items(
+        self,
+        person_image_path: ImageSource,
+        clothing_items: list[ImageSource],
+        output_prefix: Optional[str] = None,
+        number_of_images: int = 1,
+        safety_filter_level: str = "BLOCK_LOW_AND_ABOVE",
+        return_type: str = "path",
+        sink: Optional[OutputSink] = None
+    ) -> list:
+        """Try on multiple clothing items sequentially.
+
+        The steps of one outfit depend on each other and run in order;
+        concurrency comes from running many outfits at once.
+
+        Args:
+            person_image_path: Path to the initial person image, or the image itself
+            clothing_items: List of clothing item images (paths or in-memory images)
+            output_prefix: Optional prefix for output files
+            number_of_images: Number of images to generate per item
+            safety_filter_level: Safety filter level
+            return_type: "path", "bytes" or "pil" (see VirtualTryOn.try_on_single_item)
+            sink: Optional sink that persists the images of every step
+
+        Returns:
+            List of generated images
+        """
+        all_outputs = []
+        async for outputs in self.iter_multiple_items(
+            person_image_path,
+            clothing_items,
+            output_prefix=output_prefix,
+            number_of_images=number_of_images,
+            safety_filter_level=safety_filter_level,
+            return_type=return_type,
+            sink=sink
+        ):
+            all_outputs.extend(outputs)
+        return all_outputs
+
+    @metrics.instrument("multiple")
+    async def iter_multiple_items(
+        self,
+        person_image_path: ImageSource,
+        clothing_items: list[ImageSource],
+        output_prefix: Optional[str] = None,
+        number_of_images: int = 1,
+        safety_filter_level: str = "BLOCK_LOW_AND_ABOVE",
+        return_type: str = "path",
+        sink: Optional[OutputSink] = None
+    ) -> AsyncIterator[list]:
+        """Streaming form of try_on_multiple_items.
+
+        Yields each step's generated images as soon as that step finishes.
+        Arguments are the same as for try_on_multiple_items.
+
+        Yields:
+            One list of generated images per clothing item, in order
+        """
+        self.vto._check_return_type(return_type)
+        person_image, *clothing_images = await asyncio.gather(
+            asyncio.to_thread(self.vto._prepare_input, person_image_path),
+            *[asyncio.to_thread(self.vto._prepare_input, item, garment=True) for item in clothing_items],
+        )
+
+        current_person_image = person_image
+        outfit_cache = self.vto.outfit_cache
+        keys = None
+        cached_steps = []
+        if outfit_cache is not None:
+            keys = await asyncio.to_thread(
+                self.vto._chain_keys,
+                current_person_image, clothing_images, number_of_images, safety_filter_level,
+            )
+            cached_steps = outfit_cache.longest_prefix(keys)
+
+        for idx, (clothing_item, clothing_image) in enumerate(zip(clothing_items, clothing_images), 1):
+            print(f"[{idx}/{len(clothing_items)}] Trying on: {describe_image(clothing_item)}")
+            if idx <= len(cached_steps):
+                images = cached_steps[idx - 1]
+            else:
+                images = await self._try_on(
+                    current_person_image, clothing_image, number_of_images, safety_filter_level,
+                    stage_person=current_person_image is person_image,
+                )
+                if keys is not None:
+                    outfit_cache.put(keys[idx - 1], images)
+
+            outputs = await asyncio.to_thread(
+                self.vto._deliver,
+                images,
+                self.vto._chain_output_path(output_prefix, idx),
+                "multi_tryon",
+                return_type,
+                sink,
+                safety_filter_level,
+                (current_person_image, clothing_image, person_image),
+            )
+
+            # Use the output of this try-on as input for the next one
+            current_person_image = images[0]
+            yield outputs
+
+    @metrics.instrument("gcs")
+    async def try_on_from_gcs(
+        self,
+        person_image_path: ImageSource,
+        clothing_gcs_uri: str,
+        output_path: Optional[str] = None,
+        number_of_images: int = 1,
+        safety_filter_level: str = "BLOCK_LOW_AND_ABOVE",
+        return_type: str = "path",
+        sink: Optional[OutputSink] = None
+    ) -> list:
+        """Try on a clothing item from Google Cloud Storage.
+
+        Args:
+            person_image_path: Path to the person image (local or GCS), or the image itself
+            clothing_gcs_uri: GCS URI of the clothing item (gs://...)
+            output_path: Optional output path for the generated image
+            number_of_images: Number of images to generate (1-4)
+            safety_filter_level: Safety filter level
+            return_type: "path", "bytes" or "pil" (see VirtualTryOn.try_on_single_item)
+            sink: Optional sink that persists the images
+
+        Returns:
+            List of generated images
+        """
+        self.vto._check_return_type(return_type)
+        person_img = await asyncio.to_thread(self.vto._prepare_input, person_image_path)
+
+        clothing_image = Image(gcs_uri=clothing_gcs_uri)
+        images = await self._try_on(person_img, clothing_image, number_of_images, safety_filter_level)
+        return await asyncio.to_thread(
+            self.vto._deliver,
+            images, output_path, "tryon_gcs", return_type, sink, safety_filter_level,
+            (person_img, clothing_image, person_img),
+        )
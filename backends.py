@@ -0,0 +1,253 @@
+"""
+Service backends for Virtual Try-On
+The real Vertex AI client and a local fake with configurable latency, errors
+and quota, so the whole pipeline can be load-tested offline.
+"""
+
+import asyncio
+import hashlib
+import io
+import math
+import random
+import threading
+import time
+from typing import Optional, Protocol
+
+import httpx
+from google import genai
+from google.genai import errors
+from google.genai.types import (
+    GeneratedImage,
+    HttpOptions,
+    Image,
+    Model,
+    RecontextImageResponse,
+)
+from PIL import Image as PIL_Image
+from PIL import ImageDraw as PIL_ImageDraw
+
+import config
+
+
+class Backend(Protocol):
+    """The part of ``genai.Client`` that VirtualTryOn uses.
+
+    ``models.recontext_image(model=..., source=..., config=...)`` and its
+    async twin ``aio.models.recontext_image`` must return a
+    RecontextImageResponse or raise ``google.genai.errors.APIError``.
+    ``models.get(model=...)`` (and ``aio.models.get``) is used to pre-warm
+    connections.
+    """
+
+    models: object
+    aio: object
+
+
+def genai_backend(project_id: str, location: str, credentials=None) -> genai.Client:
+    """The real backend: a Vertex AI genai client."""
+    # httpx closes idle connections after 5s by default, so a call after a
+    # short pause would pay for a new TLS handshake
+    limits = httpx.Limits(
+        max_connections=100,
+        max_keepalive_connections=max(20, config.MAX_CONCURRENT_REQUESTS),
+        keepalive_expiry=config.CONNECTION_KEEPALIVE_SECONDS,
+    )
+    return genai.Client(
+        vertexai=True,
+        project=project_id,
+        location=location,
+        credentials=credentials,
+        http_options=HttpOptions(
+            client_args={"limits": limits},
+            async_client_args={"limits": limits},
+        )
+    )
+
+
+class _FakeModels:
+    def __init__(self, backend: "FakeBackend"):
+        self._backend = backend
+
+    def get(self, model: str, config=None) -> Model:
+        return Model(name=model)
+
+    def recontext_image(self, model: str, source, config=None) -> RecontextImageResponse:
+        delay, error = self._backend._admit()
+        try:
+            time.sleep(delay)
+            if error is not None:
+                raise error
+            return self._backend._respond(source, config)
+        finally:
+            self._backend._leave()
+
+
+class _FakeAsyncModels:
+    def __init__(self, backend: "FakeBackend"):
+        self._backend = backend
+
+    async def get(self, model: str, config=None) -> Model:
+        return Model(name=model)
+
+    async def recontext_image(self, model: str, source, config=None) -> RecontextImageResponse:
+        delay, error = self._backend._admit()
+        try:
+            await asyncio.sleep(delay)
+            if error is not None:
+                raise error
+            # Encoding the synthetic JPEGs is CPU work; keep it off the loop
+            return await asyncio.to_thread(self._backend._respond, source, config)
+        finally:
+            self._backend._leave()
+
+
+class _FakeAio:
+    def __init__(self, backend: "FakeBackend"):
+        self.models = _FakeAsyncModels(backend)
+
+
+class FakeBackend:
+    """Deterministic local stand-in for the Vertex AI try-on endpoint.
+
+    Latency is drawn from a log-normal distribution. Calls fail with a 503
+    with probability ``error_rate``, with a 429 when a ``quota_rpm`` token
+    bucket runs dry, and with a 429 for every call inside a burst window
+    (``burst_duration`` seconds out of every ``burst_every``). Generated
+    images are synthetic JPEGs derived from a hash of the inputs, so the
+    same request always yields the same bytes. Given the same ``seed`` and
+    call order, the random latencies and 503s repeat exactly too.
+    """
+
+    def __init__(
+        self,
+        latency_median: Optional[float] = None,
+        latency_sigma: float = 0.35,
+        error_rate: Optional[float] = None,
+        quota_rpm: Optional[float] = None,
+        burst_every: float = 0.0,
+        burst_duration: float = 0.0,
+        image_size: tuple[int, int] = (768, 1024),
+        seed: Optional[int] = None
+    ):
+        """Create a fake backend.
+
+        Args:
+            latency_median: Median call latency in seconds (default: config.FAKE_LATENCY_MEDIAN)
+            latency_sigma: Log-normal shape; 0.35 puts p99 at about 2.3x the median
+            error_rate: Probability of a 503 per call (default: config.FAKE_ERROR_RATE)
+            quota_rpm: Requests per minute before 429s; 0 for unlimited
+                (default: config.FAKE_QUOTA_RPM)
+            burst_every: Period in seconds of 429 bursts; 0 disables bursts
+            burst_duration: Length in seconds of each 429 burst
+            image_size: Width and height of the generated images
+            seed: Random seed (default: config.FAKE_SEED)
+        """
+        self.latency_median = config.FAKE_LATENCY_MEDIAN if latency_median is None else latency_median
+        self.latency_sigma = latency_sigma
+        self.error_rate = config.FAKE_ERROR_RATE if error_rate is None else error_rate
+        self.quota_rpm = config.FAKE_QUOTA_RPM if quota_rpm is None else quota_rpm
+        self.burst_every = burst_every
+        self.burst_duration = burst_duration
+        self.image_size = image_size
+
+        self.models = _FakeModels(self)
+        self.aio = _FakeAio(self)
+
+        self._lock = threading.Lock()
+        self._random = random.Random(config.FAKE_SEED if seed is None else seed)
+        self._started = time.monotonic()
+        self._tokens = self.quota_rpm / 6 if self.quota_rpm else 0.0
+        self._refilled_at = self._started
+        self._in_flight = 0
+        self._stats = {
+            "calls": 0, "ok": 0, "errors": 0, "throttled": 0, "peak_in_flight": 0,
+            # CPU spent drawing and encoding the synthetic outputs; a real
+            # endpoint does this remotely, so benchmarks subtract it
+            "render_cpu_seconds": 0.0,
+        }
+
+    # -- behaviour ----------------------------------------------------------
+
+    def _admit(self) -> tuple[float, Optional[errors.APIError]]:
+        """Decide this call's latency and failure (if any) and count it in flight."""
+        with self._lock:
+            now = time.monotonic()
+            self._stats["calls"] += 1
+            self._in_flight += 1
+            self._stats["peak_in_flight"] = max(self._stats["peak_in_flight"], self._in_flight)
+
+            latency = self.latency_median * math.exp(self._random.gauss(0, self.latency_sigma))
+            failed = self._random.random() < self.error_rate
+
+            if self._in_burst(now) or not self._take_token(now):
+                self._stats["throttled"] += 1
+                # Quota errors come back fast
+                return min(latency, 0.05), errors.ClientError(429, {"error": {
+                    "code": 429,
+                    "message": "Quota exceeded for aiplatform.googleapis.com (fake backend)",
+                    "status": "RESOURCE_EXHAUSTED",
+                }})
+            if failed:
+                self._stats["errors"] += 1
+                return latency, errors.ServerError(503, {"error": {
+                    "code": 503,
+                    "message": "The service is currently unavailable (fake backend)",
+                    "status": "UNAVAILABLE",
+                }})
+            self._stats["ok"] += 1
+            return latency, None
+
+    def _leave(self) -> None:
+        with self._lock:
+            self._in_flight -= 1
+
+    def _in_burst(self, now: float) -> bool:
+        if not self.burst_every or not self.burst_duration:
+            return False
+        return (now - self._started) % self.burst_every < self.burst_duration
+
+    def _take_token(self, now: float) -> bool:
+        if not self.quota_rpm:
+            return True
+        capacity = max(1.0, self.quota_rpm / 6)
+        self._tokens = min(capacity, self._tokens + (now - self._refilled_at) * self.quota_rpm / 60)
+        self._refilled_at = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def _respond(self, source, request_config) -> RecontextImageResponse:
+        count = getattr(request_config, "number_of_images", None) or 1
+        cpu_start = time.thread_time()
+        digest = hashlib.sha256()
+        for image in [source.person_image] + [p.product_image for p in source.product_images or []]:
+            digest.update(image.image_bytes or (image.gcs_uri or "").encode())
+        response = RecontextImageResponse(generated_images=[
+            GeneratedImage(image=Image(
+                image_bytes=self._render(digest.digest(), idx),
+                mime_type="image/jpeg",
+            ))
+            for idx in range(count)
+        ])
+        with self._lock:
+            self._stats["render_cpu_seconds"] += time.thread_time() - cpu_start
+        return response
+
+    def _render(self, digest: bytes, idx: int) -> bytes:
+        """Synthetic JPEG whose colours are derived from the request digest."""
+        seed = hashlib.sha256(digest + bytes([idx])).digest()
+        img = PIL_Image.new("RGB", self.image_size, tuple(seed[:3]))
+        draw = PIL_ImageDraw.Draw(img)
+        width, height = self.image_size
+        # A "figure" and a "garment" block so outputs look different per input
+        draw.rectangle((width // 3, height // 8, 2 * width // 3, 7 * height // 8), fill=tuple(seed[3:6]))
+        draw.rectangle((width // 3, height // 4, 2 * width // 3, height // 2), fill=tuple(seed[6:9]))
+        buffer = io.BytesIO()
+        img.save(buffer, format="JPEG", quality=85)
+        return buffer.getvalue()
+
+    def stats(self) -> dict:
+        """Call, outcome and peak-concurrency counters."""
+        with self._lock:
+            return {**self._stats, "in_flight": self._in_flight}
@@ -0,0 +1,266 @@
+"""
+Batch Virtual Try-On runner
+Streams a JSONL manifest through a bounded worker pool and writes a results JSONL.
+
+Each manifest line describes one request:
+
+    {"request_id": "look-0001",
+     "person": "input_images/person/model.jpg",
+     "garments": ["input_images/clothing/top.jpg", "gs://bucket/bottom.jpg"],
+     "variations": 1,
+     "safety_level": "BLOCK_LOW_AND_ABOVE"}
+
+Finished request IDs are checkpointed in an SQLite file next to the results,
+so re-running the same command after a crash skips everything that already
+succeeded instead of paying for it again.
+
+Calls run as the "bulk" priority class by default, so a web UI sharing the
+process-wide rate limiter is served ahead of the batch.
+
+Usage:
+    python batch_runner.py manifest.jsonl --output results.jsonl --workers 8
+"""
+
+import argparse
+import json
+import re
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterator, Optional
+
+import config
+import metrics
+import rate_limiter
+from image_preprocess import ImagePreprocessor
+from virtual_tryon import VirtualTryOn
+
+
+class Checkpoint:
+    """Persistent set of finished request IDs.
+
+    Backed by SQLite so membership checks stay O(log n) on disk and memory
+    does not grow with the size of the manifest.
+    """
+
+    def __init__(self, path: Path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS done (request_id TEXT PRIMARY KEY, finished REAL NOT NULL)"
+        )
+
+    def __contains__(self, request_id: str) -> bool:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM done WHERE request_id = ?", (request_id,)
+            ).fetchone() is not None
+
+    def add(self, request_id: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO done (request_id, finished) VALUES (?, ?)",
+                (request_id, time.time()),
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def iter_manifest(manifest_path: Path) -> Iterator[tuple[int, Optional[dict], Optional[str]]]:
+    """Yield ``(line_number, request, error)`` for each non-blank manifest line."""
+    with open(manifest_path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                request = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_number, None, f"invalid JSON: {e}"
+                continue
+            if not isinstance(request, dict) or not request.get("person") or not request.get("garments"):
+                yield line_number, None, "each line needs 'person' and 'garments'"
+                continue
+            yield line_number, request, None
+
+
+def run_request(vto: VirtualTryOn, request: dict, output_dir: Path) -> list:
+    """Run one manifest request and return the generated image paths."""
+    request_id = str(request["request_id"])
+    person = request["person"]
+    garments = request["garments"]
+    if isinstance(garments, str):
+        garments = [garments]
+    number_of_images = int(request.get("variations", config.DEFAULT_NUMBER_OF_IMAGES))
+    safety_filter_level = request.get("safety_level", config.DEFAULT_SAFETY_LEVEL)
+
+    output_prefix = str(output_dir / re.sub(r"[^A-Za-z0-9_.-]", "_", request_id))
+
+    if len(garments) == 1 and garments[0].startswith("gs://"):
+        return vto.try_on_from_gcs(
+            person_image_path=person,
+            clothing_gcs_uri=garments[0],
+            output_path=f"{output_prefix}.jpeg",
+            number_of_images=number_of_images,
+            safety_filter_level=safety_filter_level
+        )
+    if len(garments) == 1:
+        return vto.try_on_single_item(
+            person_image_path=person,
+            clothing_image_path=garments[0],
+            output_path=f"{output_prefix}.jpeg",
+            number_of_images=number_of_images,
+            safety_filter_level=safety_filter_level
+        )
+    return vto.try_on_multiple_items(
+        person_image_path=person,
+        clothing_items=garments,
+        output_prefix=output_prefix,
+        number_of_images=number_of_images,
+        safety_filter_level=safety_filter_level
+    )
+
+
+def run_manifest(
+    manifest_path: Path,
+    results_path: Path,
+    checkpoint_path: Optional[Path] = None,
+    output_dir: Optional[Path] = None,
+    workers: int = 4,
+    vto: Optional[VirtualTryOn] = None,
+    priority: str = "bulk"
+) -> dict:
+    """Process every pending request in a manifest.
+
+    Lines are read lazily and at most ``2 * workers`` requests are queued or
+    running at any time, so memory use does not depend on the manifest size.
+
+    Args:
+        manifest_path: JSONL manifest to process
+        results_path: JSONL file results are appended to
+        checkpoint_path: SQLite checkpoint file (default: ``<results>.checkpoint``)
+        output_dir: Directory for generated images (default: OUTPUT_DIR/batch)
+        workers: Number of concurrent requests
+        vto: VirtualTryOn instance to use (created if omitted)
+        priority: Priority class of the batch's calls on the shared rate limiter
+
+    Returns:
+        Counts of succeeded, failed and skipped requests
+    """
+    # Outputs are flushed before each checkpoint, so writes needn't block workers
+    vto = vto or VirtualTryOn(write_behind=True)
+    output_dir = Path(output_dir or config.OUTPUT_DIR / "batch")
+    output_dir.mkdir(parents=True, exist_ok=True)
+    checkpoint = Checkpoint(Path(checkpoint_path or f"{results_path}.checkpoint"))
+
+    summary = {"succeeded": 0, "failed": 0, "skipped": 0}
+    summary_lock = threading.Lock()
+    write_lock = threading.Lock()
+    slots = threading.BoundedSemaphore(workers * 2)
+
+    results_file = open(results_path, "a", encoding="utf-8")
+
+    def record(result: dict, outcome: str) -> None:
+        with write_lock:
+            results_file.write(json.dumps(result) + "\n")
+            results_file.flush()
+        with summary_lock:
+            summary[outcome] += 1
+
+    def work(request_id: str, request: dict) -> None:
+        start = time.perf_counter()
+        try:
+            # Recorded with the outputs by sinks that index metadata (OutputStore)
+            with metrics.request_id(request_id), rate_limiter.priority(priority):
+                outputs = run_request(vto, request, output_dir)
+            # Images are written in the background; only checkpoint what is on disk
+            vto.flush(outputs)
+        except Exception as e:
+            record({
+                "request_id": request_id,
+                "status": "error",
+                "error": str(e),
+                "elapsed_seconds": round(time.perf_counter() - start, 3),
+            }, "failed")
+        else:
+            # Write the result before checkpointing so a crash in between
+            # at worst repeats a request, never loses one
+            record({
+                "request_id": request_id,
+                "status": "ok",
+                "outputs": outputs,
+                "elapsed_seconds": round(time.perf_counter() - start, 3),
+            }, "succeeded")
+            checkpoint.add(request_id)
+        finally:
+            slots.release()
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for line_number, request, error in iter_manifest(manifest_path):
+                if error:
+                    record({"line": line_number, "status": "error", "error": error}, "failed")
+                    continue
+
+                request_id = str(request.setdefault("request_id", f"line-{line_number}"))
+                if request_id in checkpoint:
+                    with summary_lock:
+                        summary["skipped"] += 1
+                    continue
+
+                slots.acquire()
+                pool.submit(work, request_id, request)
+    finally:
+        results_file.close()
+        checkpoint.close()
+
+    return summary
+
+
+def main():
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Run Virtual Try-On over a JSONL manifest.")
+    parser.add_argument("manifest", type=Path, help="JSONL manifest, one request per line")
+    parser.add_argument("--output", type=Path, default=Path("results.jsonl"),
+                        help="Results JSONL (appended to; default: results.jsonl)")
+    parser.add_argument("--checkpoint", type=Path, default=None,
+                        help="Checkpoint file (default: <output>.checkpoint)")
+    parser.add_argument("--output-dir", type=Path, default=None,
+                        help="Directory for generated images (default: output_images/batch)")
+    parser.add_argument("--workers", type=int, default=4,
+                        help="Number of concurrent requests (default: 4)")
+    parser.add_argument("--priority", choices=rate_limiter.PRIORITIES, default="bulk",
+                        help="Priority class on the shared rate limiter (default: bulk)")
+    args = parser.parse_args()
+
+    try:
+        vto = VirtualTryOn(preprocessor=ImagePreprocessor(), write_behind=True)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    summary = run_manifest(
+        args.manifest,
+        args.output,
+        checkpoint_path=args.checkpoint,
+        output_dir=args.output_dir,
+        workers=args.workers,
+        vto=vto,
+        priority=args.priority
+    )
+
+    print(f"\n{'='*60}")
+    print(f"Batch complete: {summary['succeeded']} succeeded, "
+          f"{summary['failed']} failed, {summary['skipped']} skipped (already done)")
+    print(f"{'='*60}\n")
+    sys.exit(1 if summary["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+"""
+End-to-end Virtual Try-On benchmark
+Drives the try-on pipeline against the local fake backend and sweeps input
+image size, variation count and concurrency.
+
+For every combination it reports throughput, p50/p95/p99 latency, CPU time per
+request and peak RSS, and writes everything as JSON so runs of different
+versions can be diffed.
+
+Usage:
+    python benchmark.py --scenarios single multiple ui --sizes 512 1024 2048 \\
+        --variations 1 4 --concurrency 1 4 16 --requests 32 --output bench.json
+"""
+
+import argparse
+import io
+import json
+import math
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Optional
+
+from PIL import Image as PIL_Image
+
+
+SCENARIOS = ("single", "multiple", "ui")
+
+
+def percentile(values: list[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile of ``values`` (None if empty)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    # Rounded first so e.g. 0.95 * 100 isn't taken for slightly more than 95
+    rank = math.ceil(round(q * len(ordered), 9))
+    return ordered[min(len(ordered) - 1, max(0, rank - 1))]
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far, in MiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def make_inputs(count: int, size: int) -> list[tuple[bytes, bytes, bytes]]:
+    """Distinct (person, top, bottom) JPEGs per request, so nothing is served
+    from caches or coalesced and every request reaches the backend."""
+    inputs = []
+    for i in range(count):
+        images = []
+        for j, aspect in enumerate((4 / 3, 1, 1)):
+            img = PIL_Image.new("RGB", (size, int(size * aspect)), ((i * 7 + j) % 256, (i * 13) % 256, j * 90))
+            buffer = io.BytesIO()
+            img.save(buffer, format="JPEG", quality=90)
+            images.append(buffer.getvalue())
+        inputs.append(tuple(images))
+    return inputs
+
+
+def git_version() -> str:
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            cwd=Path(__file__).parent, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+class Harness:
+    """Builds the system under test for each benchmark cell."""
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self._app = None
+        self._backend = None
+
+    def backend(self):
+        from backends import FakeBackend
+        return FakeBackend(
+            latency_median=self.args.latency,
+            latency_sigma=self.args.latency_sigma,
+            error_rate=self.args.error_rate,
+            seed=self.args.seed,
+        )
+
+    def vto(self, concurrency: int):
+        from image_preprocess import ImagePreprocessor
+        from rate_limiter import AdaptiveLimiter
+        from virtual_tryon import VirtualTryOn
+
+        # Quota is not what is being measured: let every worker through
+        limiter = AdaptiveLimiter(
+            requests_per_minute=1e9,
+            initial_concurrency=concurrency,
+            max_concurrency=concurrency,
+        )
+        self._backend = self.backend()
+        return VirtualTryOn(
+            preprocessor=ImagePreprocessor(),
+            limiter=limiter,
+            backend=self._backend,
+        )
+
+    def app(self):
+        """The Gradio app module, imported once against the fake backend."""
+        if self._app is None:
+            os.environ["VTO_BACKEND"] = "fake"
+            os.environ["VTO_FAKE_LATENCY_MEDIAN"] = str(self.args.latency)
+            os.environ["VTO_FAKE_ERROR_RATE"] = str(self.args.error_rate)
+            os.environ["VTO_FAKE_SEED"] = str(self.args.seed)
+            os.environ["VTO_RATE_LIMIT_RPM"] = "1e9"
+            os.environ["VTO_RATE_LIMIT_INITIAL_CONCURRENCY"] = str(max(self.args.concurrency))
+            os.environ["VTO_JOB_WORKERS"] = str(max(self.args.concurrency))
+            os.environ["VTO_JOB_QUEUE_MAX_PER_USER"] = str(self.args.requests)
+            os.environ["VTO_METRICS_PORT"] = "0"
+            import app_deploy
+            # Every request must reach the backend, as in the library scenarios
+            vto = app_deploy.get_vto()
+            vto.cache = None
+            vto.outfit_cache = None
+            self._app = app_deploy
+        return self._app
+
+    def request_fn(self, scenario: str, concurrency: int, variations: int) -> Callable:
+        """Return ``fn(inputs, idx)`` that performs one request of ``scenario``."""
+        if scenario == "ui":
+            # The job queue has max(--concurrency) workers; the driver's
+            # thread count is what limits concurrency here
+            app = self.app()
+            self._backend = app.get_vto().pool.endpoints[0].client
+
+            def run_ui(inputs: tuple, idx: int):
+                person, top, _ = inputs
+                request = types.SimpleNamespace(session_hash=f"bench-{idx}")
+                last = None
+                for last in app.virtual_tryon_single(
+                    PIL_Image.open(io.BytesIO(person)),
+                    PIL_Image.open(io.BytesIO(top)),
+                    variations,
+                    "BLOCK_LOW_AND_ABOVE",
+                    request,
+                ):
+                    pass
+                if last is None or last[0] is None:
+                    raise RuntimeError(last[1] if last else "no output")
+            return run_ui
+
+        vto = self.vto(concurrency)
+        if scenario == "single":
+            def run_single(inputs: tuple, idx: int):
+                person, top, _ = inputs
+                vto.try_on_single_item(
+                    person, top, number_of_images=variations, return_type=self.args.return_type
+                )
+            return run_single
+
+        def run_multiple(inputs: tuple, idx: int):
+            person, top, bottom = inputs
+            vto.try_on_multiple_items(
+                person, [top, bottom], number_of_images=variations, return_type=self.args.return_type
+            )
+        return run_multiple
+
+    def simulator_cpu(self) -> float:
+        """CPU seconds the current cell's fake backend has spent rendering outputs."""
+        return self._backend.stats()["render_cpu_seconds"] if self._backend else 0.0
+
+
+def run_cell(fn: Callable, inputs: list, concurrency: int,
+             simulator_cpu: Callable[[], float] = lambda: 0.0) -> dict:
+    """Run every input through ``fn`` with ``concurrency`` workers and measure it.
+
+    ``simulator_cpu`` reports the fake backend's own CPU time, which runs in
+    this process but stands in for remote work, so it is left out of
+    ``cpu_ms_per_request``.
+    """
+    def timed(idx: int) -> Optional[float]:
+        start = time.perf_counter()
+        try:
+            fn(inputs[idx], idx)
+        except Exception:
+            return None
+        return time.perf_counter() - start
+
+    cpu_start = time.process_time()
+    simulator_start = simulator_cpu()
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(timed, range(len(inputs))))
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start - (simulator_cpu() - simulator_start)
+    latencies = [latency for latency in outcomes if latency is not None]
+    errors = len(outcomes) - len(latencies)
+
+    def ms(value: Optional[float]) -> Optional[float]:
+        return None if value is None else round(value * 1000, 2)
+
+    return {
+        "requests": len(inputs),
+        "errors": errors,
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(len(latencies) / wall, 3) if wall else None,
+        "latency_p50_ms": ms(percentile(latencies, 0.50)),
+        "latency_p95_ms": ms(percentile(latencies, 0.95)),
+        "latency_p99_ms": ms(percentile(latencies, 0.99)),
+        "cpu_ms_per_request": round(cpu / len(inputs) * 1000, 2),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def main():
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Benchmark the Virtual Try-On pipeline offline.")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=["single", "multiple"],
+                        help="What to drive: the library methods and/or the Gradio handler")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[512, 1024, 2048],
+                        help="Long edge of the generated input images in pixels")
+    parser.add_argument("--variations", nargs="+", type=int, default=[1, 4],
+                        help="number_of_images values to sweep")
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4, 16],
+                        help="Concurrent request levels to sweep")
+    parser.add_argument("--requests", type=int, default=32,
+                        help="Requests per combination (default: 32)")
+    parser.add_argument("--latency", type=float, default=0.2,
+                        help="Median fake backend latency in seconds (default: 0.2)")
+    parser.add_argument("--latency-sigma", type=float, default=0.35,
+                        help="Log-normal spread of the fake latency (default: 0.35)")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="Fraction of fake calls failing with 503 (default: 0)")
+    parser.add_argument("--return-type", choices=("path", "bytes", "pil"), default="pil",
+                        help="return_type for the library scenarios (default: pil)")
+    parser.add_argument("--seed", type=int, default=0, help="Fake backend random seed")
+    parser.add_argument("--output", type=Path, default=Path("benchmark_results.json"),
+                        help="JSON results file (default: benchmark_results.json)")
+    args = parser.parse_args()
+
+    os.environ.setdefault("VTO_CACHE_DIR", str(Path(__file__).parent / "cache" / "benchmark"))
+    harness = Harness(args)
+    results = []
+    stdout = sys.stdout
+    for size in args.sizes:
+        inputs = make_inputs(args.requests, size)
+        for scenario in args.scenarios:
+            for variations in args.variations:
+                for concurrency in args.concurrency:
+                    # Keep the pipeline's progress prints out of the report
+                    sys.stdout = open(os.devnull, "w")
+                    try:
+                        fn = harness.request_fn(scenario, concurrency, variations)
+                        cell = run_cell(fn, inputs, concurrency, harness.simulator_cpu)
+                    finally:
+                        sys.stdout.close()
+                        sys.stdout = stdout
+                    cell = {
+                        "scenario": scenario,
+                        "image_size": size,
+                        "variations": variations,
+                        "concurrency": concurrency,
+                        **cell,
+                    }
+                    results.append(cell)
+                    print(f"{scenario:>8} size={size:<5} n={variations} c={concurrency:<3} "
+                          f"{cell['throughput_rps']:>8} req/s  p50={cell['latency_p50_ms']}ms "
+                          f"p99={cell['latency_p99_ms']}ms  cpu={cell['cpu_ms_per_request']}ms/req "
+                          f"rss={cell['peak_rss_mb']}MB  errors={cell['errors']}")
+
+    report = {
+        "version": git_version(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "settings": {
+            "requests": args.requests,
+            "latency_median": args.latency,
+            "latency_sigma": args.latency_sigma,
+            "error_rate": args.error_rate,
+            "return_type": args.return_type,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    args.output.write_text(json.dumps(report, indent=2))
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,376 @@
+"""
+Multi-region / multi-project client pool for Vertex AI
+Spreads try-on calls over several (project, region) endpoints, routing each
+call to the endpoint expected to answer fastest and failing over when one degrades.
+"""
+
+import asyncio
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Optional
+
+import google.auth
+from google.auth.exceptions import DefaultCredentialsError
+from google.auth.transport.requests import Request
+
+import config
+import metrics
+from backends import Backend, genai_backend
+from rate_limiter import AdaptiveLimiter, default_limiter
+from retries import classify_error
+
+
+# Weight of the newest sample in the latency and error-rate averages
+EWMA_ALPHA = 0.2
+
+# Seconds an endpoint is avoided after a failure; doubles per consecutive failure
+FAILURE_COOLDOWN = 5.0
+MAX_FAILURE_COOLDOWN = 60.0
+
+# How often the keep-warm thread checks tokens and idle connections
+_KEEP_WARM_TICK = 15.0
+
+_SCOPES = ["https://www.googleapis.com/auth/cloud-platform"]
+
+
+def _load_credentials(credentials_file: Optional[str]):
+    """Service account credentials from a key file, or application default credentials.
+
+    Returns None if no default credentials are configured; the genai client
+    then reports that on the first call, as it always has.
+    """
+    if credentials_file:
+        from google.oauth2 import service_account
+
+        return service_account.Credentials.from_service_account_file(credentials_file, scopes=_SCOPES)
+    try:
+        credentials, _ = google.auth.default(scopes=_SCOPES)
+    except DefaultCredentialsError:
+        return None
+    return credentials
+
+
+class Endpoint:
+    """One (project, region) target with its own client, quota and health stats."""
+
+    def __init__(
+        self,
+        project_id: str,
+        location: str,
+        credentials_file: Optional[str] = None,
+        limiter: Optional[AdaptiveLimiter] = None,
+        backend: Optional[Backend] = None
+    ):
+        """Create an endpoint.
+
+        Args:
+            project_id: Google Cloud Project ID
+            location: Google Cloud region
+            credentials_file: Optional service account key for this project
+                (default: application default credentials)
+            limiter: Rate limiter for this endpoint's quota (default: a
+                process-wide limiter per project and region)
+            backend: Client to call instead of a Vertex AI genai client,
+                e.g. a FakeBackend
+        """
+        self.project_id = project_id
+        self.location = location
+        self.credentials_file = credentials_file
+        self.limiter = limiter or default_limiter(f"{project_id}/{location}")
+
+        # Owned here rather than by the genai client so tokens can be
+        # fetched and refreshed ahead of calls (see warm/refresh_token)
+        self.credentials = None
+        if backend is None:
+            self.credentials = _load_credentials(credentials_file)
+            backend = genai_backend(project_id, location, self.credentials)
+        self.client = backend
+
+        self._lock = threading.Lock()
+        self.latency_ewma: Optional[float] = None
+        self.error_rate = 0.0
+        self.consecutive_failures = 0
+        self.unhealthy_until = 0.0
+        self.warmed = False
+        self.last_used = 0.0
+
+    @property
+    def name(self) -> str:
+        return f"{self.project_id}/{self.location}"
+
+    def record_success(self, latency: float) -> None:
+        with self._lock:
+            if self.latency_ewma is None:
+                self.latency_ewma = latency
+            else:
+                self.latency_ewma += EWMA_ALPHA * (latency - self.latency_ewma)
+            self.error_rate *= 1 - EWMA_ALPHA
+            self.consecutive_failures = 0
+            self.unhealthy_until = 0.0
+            self.last_used = time.monotonic()
+
+    def record_failure(self, error: BaseException) -> None:
+        if classify_error(error) is None:
+            # The request itself was bad; says nothing about the endpoint
+            return
+        with self._lock:
+            self.error_rate += EWMA_ALPHA * (1 - self.error_rate)
+            self.consecutive_failures += 1
+            cooldown = FAILURE_COOLDOWN * 2 ** (self.consecutive_failures - 1)
+            self.unhealthy_until = time.monotonic() + min(cooldown, MAX_FAILURE_COOLDOWN)
+
+    def token_expires_in(self) -> Optional[float]:
+        """Seconds until the access token expires (None without a fetched, expiring token)."""
+        credentials = self.credentials
+        if credentials is None or not credentials.token or credentials.expiry is None:
+            return None
+        # google-auth keeps expiry as a naive UTC datetime
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        return (credentials.expiry.replace(tzinfo=None) - now).total_seconds()
+
+    def refresh_token(self) -> None:
+        """Fetch a new access token now, so no call has to wait for one."""
+        if self.credentials is not None:
+            self.credentials.refresh(Request())
+
+    def warm(self) -> None:
+        """Fetch an access token and open a pooled connection before the first call.
+
+        The model lookup is a cheap authenticated request to the same host as
+        try-ons; it fails here, rather than in a user's request, if
+        credentials or the API are misconfigured.
+        """
+        if self.token_expires_in() is None:
+            self.refresh_token()
+        self.client.models.get(model=config.VIRTUAL_TRY_ON_MODEL)
+        with self._lock:
+            self.warmed = True
+            self.last_used = time.monotonic()
+
+    async def warm_async(self) -> None:
+        """Async version of warm(); opens a connection in the async client's pool."""
+        if self.token_expires_in() is None:
+            await asyncio.to_thread(self.refresh_token)
+        await self.client.aio.models.get(model=config.VIRTUAL_TRY_ON_MODEL)
+        with self._lock:
+            self.warmed = True
+            self.last_used = time.monotonic()
+
+    def score(self, default_latency: float) -> float:
+        """Expected seconds until a new call here completes (lower is better)."""
+        limits = self.limiter.snapshot()
+        with self._lock:
+            latency = self.latency_ewma if self.latency_ewma is not None else default_latency
+            error_rate = self.error_rate
+        # Calls ahead of us share the concurrency limit...
+        backlog = limits["in_flight"] + limits["queue_depth"]
+        wait = backlog / max(1.0, limits["concurrency_limit"]) * latency
+        # ...and when the token bucket is empty we also wait for quota
+        if limits["tokens"] < 1:
+            wait += (1 - limits["tokens"] + limits["queue_depth"]) * 60 / limits["requests_per_minute"]
+        # A call that fails has to be repeated somewhere else
+        return (latency + wait) / (1 - min(error_rate, 0.9))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "endpoint": self.name,
+                "latency_ewma": round(self.latency_ewma, 3) if self.latency_ewma is not None else None,
+                "error_rate": round(self.error_rate, 3),
+                "healthy": time.monotonic() >= self.unhealthy_until,
+                "warmed": self.warmed,
+                "token_expires_in": self.token_expires_in(),
+            }
+
+
+class ClientPool:
+    """Routes recontext_image calls across endpoints.
+
+    Each call goes to the healthy endpoint with the lowest expected completion
+    time, estimated from its latency EWMA, error rate and how much of its
+    concurrency and quota is already spoken for. An endpoint that returns
+    overload, server or network errors is skipped for a growing cooldown, so
+    retries fail over to another region; if every endpoint is cooling down the
+    least bad one is used anyway.
+    """
+
+    def __init__(self, endpoints: list[Endpoint]):
+        if not endpoints:
+            raise ValueError("ClientPool needs at least one endpoint")
+        self.endpoints = list(endpoints)
+        self._routed = {endpoint.name: 0 for endpoint in self.endpoints}
+        self._lock = threading.Lock()
+        self._keep_warm: Optional[threading.Thread] = None
+        self._keep_warm_stats = {"token_refreshes": 0, "keepalive_pings": 0, "keep_warm_errors": 0}
+
+    @classmethod
+    def from_spec(cls, spec: str) -> "ClientPool":
+        """Build a pool from a comma-separated endpoint list.
+
+        Each entry is ``project:location`` with an optional service account
+        key for that project appended as ``@/path/key.json``, e.g.
+        ``proj-a:us-central1,proj-a:europe-west4,proj-b:us-east4@/keys/b.json``.
+        """
+        endpoints = []
+        for entry in spec.split(","):
+            entry = entry.strip()
+            if not entry:
+                continue
+            target, _, credentials_file = entry.partition("@")
+            project_id, sep, location = target.partition(":")
+            if not sep or not project_id or not location:
+                raise ValueError(f"Invalid endpoint {entry!r}; expected project:location[@key.json]")
+            endpoints.append(Endpoint(project_id, location, credentials_file or None))
+        return cls(endpoints)
+
+    def choose(self) -> Endpoint:
+        """Pick the endpoint for the next call."""
+        now = time.monotonic()
+        known = [e.latency_ewma for e in self.endpoints if e.latency_ewma is not None]
+        # Untried endpoints are assumed to be as fast as the best one so they get probed
+        default_latency = min(known) if known else 1.0
+        healthy = [e for e in self.endpoints if now >= e.unhealthy_until]
+        candidates = healthy or sorted(self.endpoints, key=lambda e: e.unhealthy_until)[:1]
+        # On a tie an untried endpoint goes first, or it would never be probed
+        endpoint = min(candidates, key=lambda e: (e.score(default_latency), e.latency_ewma is not None))
+        with self._lock:
+            self._routed[endpoint.name] += 1
+        return endpoint
+
+    def recontext_image(self, **request_kwargs):
+        """Make one recontext_image call on the best endpoint."""
+        endpoint = self.choose()
+        with endpoint.limiter.slot():
+            start = time.monotonic()
+            try:
+                with metrics.stage("upstream", region=endpoint.location):
+                    response = endpoint.client.models.recontext_image(**request_kwargs)
+            except Exception as e:
+                endpoint.record_failure(e)
+                raise
+        endpoint.record_success(time.monotonic() - start)
+        return response
+
+    async def recontext_image_async(self, **request_kwargs):
+        """Async version of recontext_image()."""
+        endpoint = self.choose()
+        async with endpoint.limiter.aslot():
+            start = time.monotonic()
+            try:
+                with metrics.stage("upstream", region=endpoint.location):
+                    response = await endpoint.client.aio.models.recontext_image(**request_kwargs)
+            except Exception as e:
+                endpoint.record_failure(e)
+                raise
+        endpoint.record_success(time.monotonic() - start)
+        return response
+
+    def warm(self) -> bool:
+        """Warm every endpoint in parallel; returns ready().
+
+        An endpoint that fails to warm is reported and left cold; it is
+        still used, and warmed by its first call.
+        """
+        with ThreadPoolExecutor(max_workers=len(self.endpoints), thread_name_prefix="vto-warm") as executor:
+            futures = [(endpoint, executor.submit(endpoint.warm)) for endpoint in self.endpoints]
+        for endpoint, future in futures:
+            if future.exception() is not None:
+                print(f"⚠️ Could not pre-warm {endpoint.name}: {future.exception()}")
+        return self.ready()
+
+    async def warm_async(self) -> bool:
+        """Async version of warm()."""
+        results = await asyncio.gather(
+            *(endpoint.warm_async() for endpoint in self.endpoints), return_exceptions=True
+        )
+        for endpoint, result in zip(self.endpoints, results):
+            if isinstance(result, BaseException):
+                print(f"⚠️ Could not pre-warm {endpoint.name}: {result}")
+        return self.ready()
+
+    def ready(self) -> bool:
+        """True once at least one endpoint has a token and an open connection."""
+        return any(endpoint.warmed for endpoint in self.endpoints)
+
+    def start_keep_warm(self) -> None:
+        """Keep tokens and connections warm from a background thread (idempotent).
+
+        Tokens are refreshed config.TOKEN_REFRESH_MARGIN_SECONDS before they
+        expire, and warmed endpoints idle for config.KEEPALIVE_INTERVAL_SECONDS
+        are pinged so their pooled connection isn't closed.
+        """
+        with self._lock:
+            if self._keep_warm is not None:
+                return
+            self._keep_warm = threading.Thread(target=self._keep_warm_loop, name="vto-keep-warm", daemon=True)
+        self._keep_warm.start()
+
+    def _keep_warm_loop(self) -> None:
+        while True:
+            time.sleep(_KEEP_WARM_TICK)
+            for endpoint in self.endpoints:
+                try:
+                    expires_in = endpoint.token_expires_in()
+                    # A tick of slack so the refresh always lands inside the margin
+                    refresh_at = config.TOKEN_REFRESH_MARGIN_SECONDS + _KEEP_WARM_TICK
+                    if expires_in is not None and expires_in < refresh_at:
+                        endpoint.refresh_token()
+                        self._count("token_refreshes")
+                    interval = config.KEEPALIVE_INTERVAL_SECONDS
+                    if endpoint.warmed and interval and time.monotonic() - endpoint.last_used >= interval:
+                        endpoint.warm()
+                        self._count("keepalive_pings")
+                except Exception as e:
+                    self._count("keep_warm_errors")
+                    print(f"⚠️ Keep-warm for {endpoint.name} failed: {e}")
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._keep_warm_stats[name] += 1
+
+    def keep_warm_stats(self) -> dict:
+        """Background token refresh and keepalive counters."""
+        with self._lock:
+            return {**self._keep_warm_stats, "warmed": sum(e.warmed for e in self.endpoints)}
+
+    def busy(self) -> bool:
+        """True while every endpoint's limiter has callers waiting for a slot."""
+        return all(endpoint.limiter.queued() for endpoint in self.endpoints)
+
+    def limiters(self) -> dict[str, AdaptiveLimiter]:
+        """Each endpoint's rate limiter, keyed by endpoint name (endpoints may share one)."""
+        return {endpoint.name: endpoint.limiter for endpoint in self.endpoints}
+
+    def limiter_snapshot(self) -> dict:
+        """Numeric values of every distinct limiter in the pool, summed."""
+        distinct = {id(limiter): limiter for limiter in self.limiters().values()}
+        totals = {}
+        for limiter in distinct.values():
+            for key, value in limiter.snapshot().items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def register_metrics(self) -> None:
+        """Export the limiters as gauges.
+
+        ``limiter`` covers the whole pool; with several endpoints each one is
+        also exported as ``limiter_<project>_<region>``.
+        """
+        metrics.registry.register_collector("limiter", self.limiter_snapshot)
+        if len(self.endpoints) > 1:
+            for name, limiter in self.limiters().items():
+                prefix = "limiter_" + re.sub(r"\W", "_", name)
+                metrics.registry.register_collector(prefix, limiter.snapshot)
+
+    def stats(self) -> list[dict]:
+        """Health, latency and routing counts per endpoint."""
+        with self._lock:
+            routed = dict(self._routed)
+        return [
+            {**endpoint.stats(), "routed": routed[endpoint.name], "limiter": endpoint.limiter.snapshot()}
+            for endpoint in self.endpoints
+        ]
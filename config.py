@@ -5,6 +5,18 @@ from pathlib import Path
 PROJECT_ID = os.environ.get("GOOGLE_CLOUD_PROJECT", "")
 LOCATION = os.environ.get("GOOGLE_CLOUD_REGION", "us-central1")
 
+# Multi-region routing: comma-separated project:location[@service-account.json]
+# entries. When set, calls are spread over these endpoints instead of
+# PROJECT_ID/LOCATION.
+ENDPOINTS = os.environ.get("VTO_ENDPOINTS", "")
+
+# Backend: "genai" calls Vertex AI; "fake" uses a local simulator (see backends.py)
+BACKEND = os.environ.get("VTO_BACKEND", "genai")
+FAKE_LATENCY_MEDIAN = float(os.environ.get("VTO_FAKE_LATENCY_MEDIAN", 2.0))
+FAKE_ERROR_RATE = float(os.environ.get("VTO_FAKE_ERROR_RATE", 0.0))
+FAKE_QUOTA_RPM = float(os.environ.get("VTO_FAKE_QUOTA_RPM", 0))
+FAKE_SEED = int(os.environ.get("VTO_FAKE_SEED", 0))
+
 # Model Configuration
 VIRTUAL_TRY_ON_MODEL = "virtual-try-on-preview-08-04"
 IMAGE_GENERATION_MODEL = "imagen-4.0-generate-001"
@@ -14,13 +26,135 @@ DEFAULT_OUTPUT_FORMAT = "image/jpeg"
 DEFAULT_NUMBER_OF_IMAGES = 1
 DEFAULT_SAFETY_LEVEL = "BLOCK_LOW_AND_ABOVE"
 
+# Input Preprocessing
+# Inputs larger than this are downsized before upload; the model works at
+# roughly 1K resolution, so extra pixels only add upload time.
+INPUT_MAX_EDGE = int(os.environ.get("VTO_INPUT_MAX_EDGE", 1024))
+INPUT_JPEG_QUALITY = int(os.environ.get("VTO_INPUT_JPEG_QUALITY", 90))
+
+# Concurrency
+MAX_CONCURRENT_REQUESTS = int(os.environ.get("VTO_MAX_CONCURRENT_REQUESTS", 16))
+
+# Rate Limiting (shared by every VirtualTryOn in the process)
+RATE_LIMIT_RPM = float(os.environ.get("VTO_RATE_LIMIT_RPM", 60))
+RATE_LIMIT_INITIAL_CONCURRENCY = float(os.environ.get("VTO_RATE_LIMIT_INITIAL_CONCURRENCY", 4))
+
+# Priority Scheduling
+# Every call carries a class: "interactive" (web UI), "near_line" or "bulk"
+# (batch runs). "strict" always serves the highest waiting class first;
+# "weighted" shares slots between waiting classes by PRIORITY_WEIGHTS
+PRIORITY_POLICY = os.environ.get("VTO_PRIORITY_POLICY", "strict")
+DEFAULT_PRIORITY = os.environ.get("VTO_DEFAULT_PRIORITY", "interactive")
+PRIORITY_WEIGHTS = {
+    "interactive": float(os.environ.get("VTO_PRIORITY_WEIGHT_INTERACTIVE", 8)),
+    "near_line": float(os.environ.get("VTO_PRIORITY_WEIGHT_NEAR_LINE", 3)),
+    "bulk": float(os.environ.get("VTO_PRIORITY_WEIGHT_BULK", 1)),
+}
+# Starvation protection: a call queued this long goes next regardless of class
+PRIORITY_MAX_WAIT_SECONDS = float(os.environ.get("VTO_PRIORITY_MAX_WAIT_SECONDS", 30))
+# Bulk calls never hold more than this share of the concurrency limit, so a
+# shopper's request finds a free slot; 1 lets bulk use every slot
+PRIORITY_BULK_SHARE = float(os.environ.get("VTO_PRIORITY_BULK_SHARE", 0.75))
+
+# Web UI Job Queue
+# Workers bound concurrent try-ons from the UI; size them to quota, not UI threads
+JOB_WORKERS = int(os.environ.get("VTO_JOB_WORKERS", MAX_CONCURRENT_REQUESTS))
+JOB_QUEUE_MAX_SIZE = int(os.environ.get("VTO_JOB_QUEUE_MAX_SIZE", 100))
+JOB_QUEUE_MAX_PER_USER = int(os.environ.get("VTO_JOB_QUEUE_MAX_PER_USER", 3))
+
+# Web UI Session Cache
+# Prepared person payloads kept per browser session, so repeated try-ons with
+# the same photo skip preprocessing; the byte budget is shared by all sessions
+SESSION_CACHE_MAX_BYTES = int(os.environ.get("VTO_SESSION_CACHE_MAX_BYTES", 128 * 1024**2))
+SESSION_CACHE_PER_SESSION = int(os.environ.get("VTO_SESSION_CACHE_PER_SESSION", 4))
+
+# Startup
+# Set VTO_LAZY_STARTUP=1 to build the Vertex AI client in the background so the
+# web UI starts serving (and answering health checks) before it is ready
+LAZY_STARTUP = os.environ.get("VTO_LAZY_STARTUP", "0") == "1"
+
+# Pre-warming
+# Access tokens are refreshed in the background this long before they expire
+TOKEN_REFRESH_MARGIN_SECONDS = float(os.environ.get("VTO_TOKEN_REFRESH_MARGIN_SECONDS", 300))
+# Idle endpoints are pinged this often so pooled connections stay open; 0 disables
+KEEPALIVE_INTERVAL_SECONDS = float(os.environ.get("VTO_KEEPALIVE_INTERVAL_SECONDS", 60))
+# How long idle pooled HTTP connections are kept before being closed
+CONNECTION_KEEPALIVE_SECONDS = float(os.environ.get("VTO_CONNECTION_KEEPALIVE_SECONDS", 120))
+
+# Metrics
+# Prometheus text endpoint served next to the web UI; 0 disables it
+METRICS_PORT = int(os.environ.get("VTO_METRICS_PORT", 9464))
+
+# Retries and Hedging
+# Total time one try-on step may take, including retries and backoff
+REQUEST_DEADLINE_SECONDS = float(os.environ.get("VTO_REQUEST_DEADLINE_SECONDS", 120))
+# Set VTO_HEDGE_REQUESTS=1 to duplicate requests that run past the p95 latency
+HEDGE_REQUESTS = os.environ.get("VTO_HEDGE_REQUESTS", "0") == "1"
+HEDGE_BUDGET_RATIO = float(os.environ.get("VTO_HEDGE_BUDGET_RATIO", 0.1))
+
 # Directory Configuration
 BASE_DIR = Path(__file__).parent
 INPUT_DIR = BASE_DIR / "input_images"
 OUTPUT_DIR = BASE_DIR / "output_images"
+CACHE_DIR = Path(os.environ.get("VTO_CACHE_DIR", BASE_DIR / "cache"))
+
+# Output Writing
+# "original" writes the API's bytes untouched; "jpeg", "webp" or "avif" re-encode
+# at OUTPUT_QUALITY (WebP is typically much smaller at the same visual quality)
+OUTPUT_FORMAT = os.environ.get("VTO_OUTPUT_FORMAT", "original")
+OUTPUT_QUALITY = int(os.environ.get("VTO_OUTPUT_QUALITY", 85))
+OUTPUT_WRITE_WORKERS = int(os.environ.get("VTO_OUTPUT_WRITE_WORKERS", 2))
+# Queued writes before saving blocks the request thread (backpressure)
+OUTPUT_MAX_PENDING = int(os.environ.get("VTO_OUTPUT_MAX_PENDING", 64))
+# Content-addressed output store (output_store.OutputStore) and its SQLite index
+OUTPUT_STORE_DIR = Path(os.environ.get("VTO_OUTPUT_STORE_DIR", OUTPUT_DIR / "store"))
+
+# Result Cache
+RESULT_CACHE_DIR = CACHE_DIR / "results"
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("VTO_RESULT_CACHE_MAX_BYTES", 2 * 1024**3))
+RESULT_CACHE_MAX_AGE_SECONDS = float(os.environ.get("VTO_RESULT_CACHE_MAX_AGE_SECONDS", 7 * 24 * 3600))
+
+# Result Previews (web UI)
+# The browser first gets a small preview; the full-resolution file is only
+# fetched when a result is clicked or downloaded
+RESULT_TIERS_DIR = CACHE_DIR / "tiers"
+RESULT_TIERS_MAX_BYTES = int(os.environ.get("VTO_RESULT_TIERS_MAX_BYTES", 1024**3))
+PREVIEW_MAX_EDGE = int(os.environ.get("VTO_PREVIEW_MAX_EDGE", 512))
+PREVIEW_QUALITY = int(os.environ.get("VTO_PREVIEW_QUALITY", 70))
+PREVIEW_FORMAT = os.environ.get("VTO_PREVIEW_FORMAT", "webp")
+
+# Garment Catalog
+# Pack of preprocessed garment images built by garment_catalog.py; when it exists,
+# garments under its directory are sent from it instead of being re-encoded
+CATALOG_PATH = Path(os.environ.get("VTO_CATALOG_PATH", CACHE_DIR / "catalog.pack"))
+# Colour distance from the corner colour still trimmed as background border
+CATALOG_TRIM_TOLERANCE = int(os.environ.get("VTO_CATALOG_TRIM_TOLERANCE", 12))
+
+# Input Staging
+# Set VTO_STAGING_URI to gs://bucket/prefix to upload each person and garment
+# image once and refer to it by URI afterwards (a local directory stands in for
+# the bucket in offline tests with VTO_BACKEND=fake)
+STAGING_URI = os.environ.get("VTO_STAGING_URI", "")
+STAGING_INDEX_PATH = CACHE_DIR / "staging.sqlite3"
+# Keep this below the bucket's lifecycle delete age so staged URIs never dangle
+STAGING_TTL_SECONDS = float(os.environ.get("VTO_STAGING_TTL_SECONDS", 23 * 3600))
+
+# Outfit Prefix Cache (in memory)
+OUTFIT_CACHE_MAX_BYTES = int(os.environ.get("VTO_OUTFIT_CACHE_MAX_BYTES", 256 * 1024**2))
+
+_directories_created = False
+
+
+def ensure_directories() -> None:
+    """Create the input/output directories if they don't exist.
 
-# Create directories if they don't exist
-INPUT_DIR.mkdir(exist_ok=True)
-OUTPUT_DIR.mkdir(exist_ok=True)
-(INPUT_DIR / "person").mkdir(exist_ok=True)
-(INPUT_DIR / "clothing").mkdir(exist_ok=True)
+    Called where the directories are first needed rather than at import, so
+    importing config stays free of filesystem side effects.
+    """
+    global _directories_created
+    if _directories_created:
+        return
+    OUTPUT_DIR.mkdir(exist_ok=True)
+    (INPUT_DIR / "person").mkdir(parents=True, exist_ok=True)
+    (INPUT_DIR / "clothing").mkdir(parents=True, exist_ok=True)
+    _directories_created = True
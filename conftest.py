@@ -0,0 +1,53 @@
+"""
+Shared pytest setup
+Points the pipeline at the local fake backend and a throwaway cache directory,
+so tests never call Vertex AI or write into the repository.
+"""
+
+import io
+import os
+import tempfile
+
+# config reads these at import, so they must be set before any test imports it
+os.environ.setdefault("VTO_BACKEND", "fake")
+os.environ.setdefault("VTO_FAKE_LATENCY_MEDIAN", "0.01")
+os.environ.setdefault("VTO_FAKE_ERROR_RATE", "0")
+os.environ.setdefault("VTO_METRICS_PORT", "0")
+os.environ.setdefault("VTO_CACHE_DIR", tempfile.mkdtemp(prefix="vto-test-cache-"))
+
+import pytest
+from PIL import Image as PIL_Image
+
+
+@pytest.fixture
+def make_jpeg():
+    """Factory for small distinct JPEGs: make_jpeg(colour=(r, g, b), size=(w, h))."""
+    def make(colour=(200, 30, 30), size=(64, 80)) -> bytes:
+        buffer = io.BytesIO()
+        PIL_Image.new("RGB", size, colour).save(buffer, format="JPEG", quality=90)
+        return buffer.getvalue()
+    return make
+
+
+@pytest.fixture
+def fake_backend():
+    from backends import FakeBackend
+    return FakeBackend(latency_median=0.01, latency_sigma=0.1, error_rate=0, quota_rpm=0, seed=0)
+
+
+@pytest.fixture
+def limiter():
+    from rate_limiter import AdaptiveLimiter
+    return AdaptiveLimiter(requests_per_minute=60000, initial_concurrency=8, max_concurrency=8)
+
+
+@pytest.fixture
+def make_vto(fake_backend, limiter):
+    """Factory for a VirtualTryOn on the fake backend; keyword arguments are passed through."""
+    from virtual_tryon import VirtualTryOn
+
+    def make(**kwargs):
+        kwargs.setdefault("backend", fake_backend)
+        kwargs.setdefault("limiter", limiter)
+        return VirtualTryOn(**kwargs)
+    return make
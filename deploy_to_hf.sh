@@ -47,12 +47,44 @@ echo ""
 cp ../app_deploy.py app.py
 cp ../virtual_tryon.py .
 cp ../config.py .
+cp ../result_cache.py .
+cp ../output_sinks.py .
+cp ../image_preprocess.py .
+cp ../outfit_cache.py .
+cp ../rate_limiter.py .
+cp ../retries.py .
+cp ../client_pool.py .
+cp ../singleflight.py .
+cp ../job_queue.py .
+cp ../metrics.py .
+cp ../backends.py .
+cp ../startup.py .
+cp ../image_staging.py .
+cp ../result_tiers.py .
+cp ../garment_catalog.py .
+cp ../session_cache.py .
 cp ../requirements.txt .
 
 echo "✅ Files copied:"
 echo "   - app.py"
 echo "   - virtual_tryon.py"
 echo "   - config.py"
+echo "   - result_cache.py"
+echo "   - output_sinks.py"
+echo "   - image_preprocess.py"
+echo "   - outfit_cache.py"
+echo "   - rate_limiter.py"
+echo "   - retries.py"
+echo "   - client_pool.py"
+echo "   - singleflight.py"
+echo "   - job_queue.py"
+echo "   - metrics.py"
+echo "   - backends.py"
+echo "   - startup.py"
+echo "   - image_staging.py"
+echo "   - result_tiers.py"
+echo "   - garment_catalog.py"
+echo "   - session_cache.py"
 echo "   - requirements.txt"
 echo ""
 
@@ -133,7 +165,7 @@ echo ""
 # Remove credentials from git
 echo "credentials.json" >> .gitignore
 
-git add app.py virtual_tryon.py config.py requirements.txt .gitignore
+git add app.py virtual_tryon.py config.py result_cache.py output_sinks.py image_preprocess.py outfit_cache.py rate_limiter.py retries.py client_pool.py singleflight.py job_queue.py metrics.py backends.py startup.py image_staging.py result_tiers.py garment_catalog.py session_cache.py requirements.txt .gitignore
 git commit -m "Add Virtual Try-On application"
 
 echo "Pushing to Hugging Face..."
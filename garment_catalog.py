@@ -0,0 +1,332 @@
+"""
+Preprocessed garment catalog for Virtual Try-On
+Ingests a directory of garment images once (orient, trim background borders,
+resize, encode), stores each distinct payload in a single pack file and serves
+them to requests as slices of a memory map, so catalog garments are never
+re-read or re-encoded.
+
+Usage:
+    python garment_catalog.py input_images/clothing --workers 8
+"""
+
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional, Union
+
+from google.genai.types import Image
+from PIL import Image as PIL_Image
+from PIL import ImageChops as PIL_ImageChops
+from PIL import ImageOps as PIL_ImageOps
+
+import config
+from image_preprocess import ImagePreprocessor
+
+
+# Pack layout: MAGIC, payloads, JSON index, then a footer of
+# <index offset><index length> (little-endian u64) and MAGIC again
+MAGIC = b"VTOPACK1"
+_FOOTER = struct.Struct("<QQ")
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tif", ".tiff"}
+
+
+def trim_borders(img: PIL_Image.Image, tolerance: int) -> PIL_Image.Image:
+    """Crop a uniform background border (or transparent margin) off a garment photo.
+
+    The background colour is taken from the top-left pixel and only trimmed
+    if all four corners share it, so photos without a plain background are
+    left alone.
+    """
+    if img.mode in ("RGBA", "LA"):
+        bbox = img.getchannel("A").getbbox()
+        return img.crop(bbox) if bbox else img
+
+    rgb = img.convert("RGB")
+    width, height = rgb.size
+    corners = [rgb.getpixel(xy) for xy in ((0, 0), (width - 1, 0), (0, height - 1), (width - 1, height - 1))]
+    background = corners[0]
+    if any(max(abs(a - b) for a, b in zip(corner, background)) > tolerance for corner in corners):
+        return img
+    diff = PIL_ImageChops.difference(rgb, PIL_Image.new("RGB", rgb.size, background))
+    # Drop differences within the tolerance (JPEG noise) before taking the bounding box
+    bbox = diff.convert("L").point(lambda value: 255 if value > tolerance else 0).getbbox()
+    if bbox is None or bbox == (0, 0, width, height):
+        return img
+    return img.crop(bbox)
+
+
+class GarmentCatalog:
+    """Read-only view of a catalog pack.
+
+    The pack is memory-mapped; ``payload()`` returns a memoryview into the
+    map without copying. Replacing the pack on disk (re-ingesting) does not
+    affect an open catalog, which keeps the file it mapped.
+    """
+
+    def __init__(self, path: Optional[Path] = None):
+        """Open the pack at ``path`` (default: config.CATALOG_PATH)."""
+        self.path = Path(path or config.CATALOG_PATH)
+        with open(self.path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._map)
+
+        if bytes(self._view[:len(MAGIC)]) != MAGIC or bytes(self._view[-len(MAGIC):]) != MAGIC:
+            raise ValueError(f"{self.path} is not a garment catalog pack")
+        footer_start = len(self._view) - len(MAGIC) - _FOOTER.size
+        index_offset, index_length = _FOOTER.unpack(self._view[footer_start:footer_start + _FOOTER.size])
+        index = json.loads(bytes(self._view[index_offset:index_offset + index_length]))
+
+        self.root = Path(index["root"])
+        self.settings = index["settings"]
+        self.created = index["created"]
+        # digest -> (offset, length, mime type)
+        self._payloads = {digest: tuple(entry) for digest, entry in index["payloads"].items()}
+        # relative path -> {"digest", "size", "mtime"}
+        self._garments = index["garments"]
+        self._hits = 0
+        self._misses = 0
+
+    @classmethod
+    def open(cls, path: Optional[Path] = None) -> Optional["GarmentCatalog"]:
+        """The catalog at ``path`` (default: config.CATALOG_PATH), or None if there is none."""
+        path = Path(path or config.CATALOG_PATH)
+        if not path.exists():
+            return None
+        return cls(path)
+
+    def __len__(self) -> int:
+        return len(self._garments)
+
+    def names(self) -> list[str]:
+        """Ingested garments, as paths relative to the catalog root."""
+        return sorted(self._garments)
+
+    def _entry(self, source: Union[str, Path]) -> Optional[dict]:
+        """Index entry for a garment file under the catalog root, if it hasn't changed since ingestion."""
+        path = Path(source).resolve()
+        try:
+            name = path.relative_to(self.root).as_posix()
+        except ValueError:
+            # Outside the root: never substitute an ingested file for it
+            return None
+        entry = self._garments.get(name)
+        if entry is None:
+            return None
+        try:
+            stat = path.stat()
+        except OSError:
+            # Source removed; the ingested payload is still valid
+            return entry
+        if stat.st_size != entry["size"] or stat.st_mtime_ns != entry["mtime"]:
+            return None
+        return entry
+
+    def payload(self, source: Union[str, Path]) -> Optional[tuple[memoryview, str]]:
+        """Zero-copy ``(bytes view, mime type)`` of a catalog garment, or None.
+
+        ``source`` is a garment file path (absolute or relative to the working
+        directory). Files outside the catalog root or changed since ingestion
+        are treated as missing.
+        """
+        entry = self._entry(source)
+        if entry is None:
+            self._misses += 1
+            return None
+        offset, length, mime_type = self._payloads[entry["digest"]]
+        self._hits += 1
+        return self._view[offset:offset + length], mime_type
+
+    def image(self, source: Union[str, Path]) -> Optional[Image]:
+        """A catalog garment as a genai Image ready to send, or None.
+
+        The genai Image model only accepts ``bytes``, so this copies the
+        payload once; nothing is decoded or re-encoded.
+        """
+        found = self.payload(source)
+        if found is None:
+            return None
+        view, mime_type = found
+        return Image(image_bytes=bytes(view), mime_type=mime_type)
+
+    def stats(self) -> dict:
+        """Garments, distinct payloads, pack size and lookup counters."""
+        return {
+            "garments": len(self._garments),
+            "payloads": len(self._payloads),
+            "bytes": len(self._view),
+            "hits": self._hits,
+            "misses": self._misses,
+        }
+
+
+def _prepare(path: Path, preprocessor: ImagePreprocessor, trim_tolerance: Optional[int]) -> tuple[bytes, str]:
+    """Orient, trim, resize and encode one garment file."""
+    with PIL_Image.open(path) as img:
+        img = PIL_ImageOps.exif_transpose(img)
+        img.load()
+    if trim_tolerance is not None:
+        img = trim_borders(img, trim_tolerance)
+    image = preprocessor.process(img)
+    return image.image_bytes, image.mime_type
+
+
+def ingest(
+    directory: Optional[Path] = None,
+    output: Optional[Path] = None,
+    max_edge: Optional[int] = None,
+    jpeg_quality: Optional[int] = None,
+    trim_tolerance: Optional[int] = None,
+    trim: bool = True,
+    workers: int = 4,
+    rebuild: bool = False
+) -> dict:
+    """Preprocess every image under ``directory`` into a catalog pack.
+
+    Unchanged files (same size and modification time) are taken from the
+    existing pack instead of being processed again, unless ``rebuild`` is set
+    or the preprocessing settings changed. Identical payloads are stored once.
+    The new pack is written next to the old one and renamed over it.
+
+    Args:
+        directory: Garment images (default: INPUT_DIR/clothing)
+        output: Pack file (default: config.CATALOG_PATH)
+        max_edge: Longest edge after resizing (default: config.INPUT_MAX_EDGE)
+        jpeg_quality: JPEG quality (default: config.INPUT_JPEG_QUALITY)
+        trim_tolerance: Colour distance still counted as background
+            (default: config.CATALOG_TRIM_TOLERANCE)
+        trim: Crop uniform background borders
+        workers: Images processed in parallel
+        rebuild: Process every file even if it is unchanged
+
+    Returns:
+        Counts of processed, reused, duplicate and failed files plus the pack size
+    """
+    root = Path(directory or config.INPUT_DIR / "clothing").resolve()
+    output = Path(output or config.CATALOG_PATH)
+    preprocessor = ImagePreprocessor(max_edge=max_edge, jpeg_quality=jpeg_quality)
+    tolerance = config.CATALOG_TRIM_TOLERANCE if trim_tolerance is None else trim_tolerance
+    settings = {
+        "max_edge": preprocessor.max_edge,
+        "jpeg_quality": preprocessor.jpeg_quality,
+        "trim_tolerance": tolerance if trim else None,
+    }
+
+    previous = None if rebuild else GarmentCatalog.open(output)
+    if previous is not None and (previous.settings != settings or previous.root != root):
+        previous = None
+
+    files = sorted(
+        path for path in root.rglob("*") if path.is_file() and path.suffix.lower() in IMAGE_SUFFIXES
+    )
+    summary = {"processed": 0, "reused": 0, "duplicates": 0, "failed": 0}
+    garments: dict[str, dict] = {}
+    # digest -> payload bytes or a view into the previous pack
+    payloads: dict[str, tuple] = {}
+    todo = []
+    for path in files:
+        name = path.relative_to(root).as_posix()
+        stat = path.stat()
+        entry = {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+        found = previous.payload(path) if previous is not None else None
+        if found is not None:
+            entry["digest"] = previous._garments[name]["digest"]
+            payloads.setdefault(entry["digest"], found)
+            garments[name] = entry
+            summary["reused"] += 1
+        else:
+            todo.append((name, path, entry))
+
+    def work(item):
+        name, path, entry = item
+        try:
+            return item, _prepare(path, preprocessor, settings["trim_tolerance"])
+        except Exception as e:
+            print(f"⚠️ Skipping {name}: {e}")
+            return item, None
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for (name, path, entry), prepared in pool.map(work, todo):
+            if prepared is None:
+                summary["failed"] += 1
+                continue
+            data, mime_type = prepared
+            entry["digest"] = hashlib.sha256(data).hexdigest()
+            if entry["digest"] in payloads:
+                summary["duplicates"] += 1
+            else:
+                payloads[entry["digest"]] = (data, mime_type)
+            garments[name] = entry
+            summary["processed"] += 1
+
+    output.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=output.parent, prefix=".tmp_")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(MAGIC)
+            index_payloads = {}
+            for digest, (data, mime_type) in payloads.items():
+                index_payloads[digest] = (f.tell(), len(data), mime_type)
+                f.write(data)
+            index = json.dumps({
+                "root": str(root),
+                "settings": settings,
+                "created": time.time(),
+                "payloads": index_payloads,
+                "garments": garments,
+            }).encode()
+            index_offset = f.tell()
+            f.write(index)
+            f.write(_FOOTER.pack(index_offset, len(index)))
+            f.write(MAGIC)
+        os.replace(tmp_path, output)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+    summary.update(garments=len(garments), payloads=len(payloads), bytes=output.stat().st_size)
+    return summary
+
+
+def main():
+    """Command-line entry point: ingest a garment directory."""
+    parser = argparse.ArgumentParser(description="Preprocess garment images into a catalog pack.")
+    parser.add_argument("directory", nargs="?", type=Path, default=None,
+                        help="Garment images (default: input_images/clothing)")
+    parser.add_argument("--output", type=Path, default=None,
+                        help="Pack file (default: VTO_CATALOG_PATH or cache/catalog.pack)")
+    parser.add_argument("--max-edge", type=int, default=None, help="Longest edge after resizing")
+    parser.add_argument("--quality", type=int, default=None, help="JPEG quality")
+    parser.add_argument("--no-trim", action="store_true", help="Keep background borders")
+    parser.add_argument("--workers", type=int, default=4, help="Parallel workers (default: 4)")
+    parser.add_argument("--rebuild", action="store_true", help="Reprocess unchanged files too")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    summary = ingest(
+        args.directory,
+        args.output,
+        max_edge=args.max_edge,
+        jpeg_quality=args.quality,
+        trim=not args.no_trim,
+        workers=args.workers,
+        rebuild=args.rebuild,
+    )
+    print(f"✅ {summary['garments']} garments ({summary['payloads']} distinct, "
+          f"{summary['bytes'] / 1024**2:.1f} MiB) in {time.perf_counter() - start:.1f}s: "
+          f"{summary['processed']} processed, {summary['reused']} unchanged, "
+          f"{summary['duplicates']} duplicates, {summary['failed']} failed")
+
+
+if __name__ == "__main__":
+    main()
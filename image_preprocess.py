@@ -0,0 +1,126 @@
+"""
+Client-side input normalization for Virtual Try-On
+Orients, downsizes and re-encodes input images before they are uploaded.
+"""
+
+import io
+import threading
+import time
+from typing import Optional, Union
+
+from google.genai.types import Image
+from PIL import Image as PIL_Image
+from PIL import ImageOps as PIL_ImageOps
+
+import config
+
+
+# EXIF tag holding the camera orientation
+_EXIF_ORIENTATION = 0x0112
+
+
+class ImagePreprocessor:
+    """Normalize input images so only what the model uses goes over the wire.
+
+    Each image is decoded (using JPEG draft mode to skip most of the work for
+    large photos), rotated according to its EXIF orientation, shrunk so its
+    longest edge is at most ``max_edge`` and re-encoded. Images that are
+    already small, upright JPEGs (or PNGs with alpha) are passed through
+    untouched, so a payload prepared once can be sent again without cost.
+    """
+
+    def __init__(self, max_edge: Optional[int] = None, jpeg_quality: Optional[int] = None):
+        """Create a preprocessor.
+
+        Args:
+            max_edge: Longest edge in pixels after resizing (default: config.INPUT_MAX_EDGE)
+            jpeg_quality: JPEG quality for re-encoded images (default: config.INPUT_JPEG_QUALITY)
+        """
+        self.max_edge = max_edge or config.INPUT_MAX_EDGE
+        self.jpeg_quality = jpeg_quality or config.INPUT_JPEG_QUALITY
+
+        self._lock = threading.Lock()
+        self._stats = {
+            "images": 0,
+            "passthrough": 0,
+            "bytes_in": 0,
+            "bytes_out": 0,
+            "decode_seconds": 0.0,
+            "transform_seconds": 0.0,
+            "encode_seconds": 0.0,
+        }
+
+    def process(self, source: Union[Image, PIL_Image.Image]) -> Image:
+        """Normalize one image.
+
+        Args:
+            source: Encoded genai Image or an already decoded PIL image.
+                Images referenced by GCS URI are returned unchanged.
+
+        Returns:
+            genai Image ready to be sent to the API
+        """
+        if isinstance(source, Image) and not source.image_bytes:
+            return source
+
+        timings = {}
+        start = time.perf_counter()
+        if isinstance(source, PIL_Image.Image):
+            bytes_in = 0
+            img = source
+        else:
+            bytes_in = len(source.image_bytes)
+            img = PIL_Image.open(io.BytesIO(source.image_bytes))
+            if self._is_passthrough(img):
+                self._record(bytes_in, bytes_in, {}, passthrough=True)
+                return source
+            if img.format == "JPEG":
+                # Let libjpeg decode at a reduced scale (1/2, 1/4, 1/8) that is
+                # still at least max_edge on the long side
+                img.draft("RGB", (self.max_edge, self.max_edge))
+            img.load()
+        timings["decode_seconds"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        img = PIL_ImageOps.exif_transpose(img)
+        if max(img.size) > self.max_edge:
+            img = img.copy() if img is source else img
+            img.thumbnail((self.max_edge, self.max_edge), PIL_Image.LANCZOS)
+        timings["transform_seconds"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        buffer = io.BytesIO()
+        if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+            # Keep the alpha channel (e.g. cut-out garments); JPEG would drop it
+            img.save(buffer, format="PNG")
+            mime_type = "image/png"
+        else:
+            img.convert("RGB").save(buffer, format="JPEG", quality=self.jpeg_quality)
+            mime_type = "image/jpeg"
+        timings["encode_seconds"] = time.perf_counter() - start
+
+        data = buffer.getvalue()
+        self._record(bytes_in, len(data), timings)
+        return Image(image_bytes=data, mime_type=mime_type)
+
+    def _is_passthrough(self, img: PIL_Image.Image) -> bool:
+        """True for JPEGs, and PNGs with alpha (which would stay PNG), that
+        need neither rotation nor resizing."""
+        if img.format != "JPEG" and not (img.format == "PNG" and img.mode in ("RGBA", "LA")):
+            return False
+        orientation = img.getexif().get(_EXIF_ORIENTATION, 1)
+        return orientation == 1 and max(img.size) <= self.max_edge
+
+    def _record(self, bytes_in: int, bytes_out: int, timings: dict, passthrough: bool = False) -> None:
+        with self._lock:
+            self._stats["images"] += 1
+            self._stats["passthrough"] += int(passthrough)
+            self._stats["bytes_in"] += bytes_in
+            self._stats["bytes_out"] += bytes_out
+            for stage, seconds in timings.items():
+                self._stats[stage] += seconds
+
+    def stats(self) -> dict:
+        """Cumulative per-stage byte and time totals."""
+        with self._lock:
+            return dict(self._stats)
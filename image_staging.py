@@ -0,0 +1,220 @@
+"""
+Upload-once staging of input images for Virtual Try-On
+Person and garment images are uploaded to a bucket once, under a content-hash
+name, and later requests refer to them by URI instead of sending the bytes again.
+"""
+
+import mimetypes
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional, Protocol
+
+from google.genai.types import Image
+
+import config
+from outfit_cache import image_digest
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS staged (
+    digest TEXT PRIMARY KEY,
+    uri TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    uploaded REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS staged_uploaded ON staged (uploaded);
+"""
+
+
+class StagingStore(Protocol):
+    """Where staged images are uploaded."""
+
+    def upload(self, name: str, data: bytes, mime_type: Optional[str]) -> str:
+        """Store ``data`` as object ``name`` and return its URI."""
+        ...
+
+
+class GCSStagingStore:
+    """Stage images in a Cloud Storage bucket (needs google-cloud-storage).
+
+    Objects are never deleted from here: give the bucket a lifecycle rule
+    that deletes objects some time after config.STAGING_TTL_SECONDS. An image
+    still in use is re-uploaded when its index entry expires, which rewrites
+    the object and restarts its lifecycle age, so live URIs never dangle.
+    """
+
+    def __init__(self, uri: str):
+        """Create a store for ``gs://bucket[/prefix]``."""
+        try:
+            from google.cloud import storage
+        except ImportError as e:
+            raise ImportError(
+                "GCS staging needs google-cloud-storage: pip install google-cloud-storage"
+            ) from e
+        bucket, _, prefix = uri[len("gs://"):].partition("/")
+        self.bucket = storage.Client().bucket(bucket)
+        self.prefix = prefix.strip("/")
+
+    def upload(self, name: str, data: bytes, mime_type: Optional[str]) -> str:
+        blob = self.bucket.blob(f"{self.prefix}/{name}" if self.prefix else name)
+        blob.upload_from_string(data, content_type=mime_type or "application/octet-stream")
+        return f"gs://{self.bucket.name}/{blob.name}"
+
+
+class LocalStagingStore:
+    """Stand-in for a bucket on the local filesystem, for offline tests.
+
+    Vertex AI can't read the ``file://`` URIs it returns; use it with a fake
+    backend only. Like a bucket without a lifecycle rule, it never deletes files.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def upload(self, name: str, data: bytes, mime_type: Optional[str]) -> str:
+        path = self.directory / name
+        path.write_bytes(data)
+        return path.resolve().as_uri()
+
+
+class ImageStaging:
+    """Content-hash index of staged images in front of a StagingStore.
+
+    The first time an image is seen it is sent inline as usual and uploaded
+    in the background; once the upload is done, requests refer to it by URI.
+    Entries older than ``ttl_seconds`` are treated as missing (the image is
+    uploaded again) and evicted from the index; the objects themselves are
+    left to the bucket's lifecycle rule. The SQLite index is shared by every
+    process using the same index path.
+    """
+
+    def __init__(
+        self,
+        store: StagingStore,
+        index_path: Optional[Path] = None,
+        ttl_seconds: Optional[float] = None,
+        upload_workers: int = 2
+    ):
+        """Create a staging layer.
+
+        Args:
+            store: Bucket (or stand-in) to upload to
+            index_path: SQLite index of staged images (default: config.STAGING_INDEX_PATH)
+            ttl_seconds: Age after which a staged image is re-uploaded
+                (default: config.STAGING_TTL_SECONDS)
+            upload_workers: Concurrent background uploads
+        """
+        self.store = store
+        self.index_path = Path(index_path or config.STAGING_INDEX_PATH)
+        self.ttl_seconds = config.STAGING_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._executor = ThreadPoolExecutor(max_workers=upload_workers, thread_name_prefix="vto-staging")
+        self._lock = threading.Lock()
+        self._pending: set[str] = set()
+        self._stats = {"hits": 0, "misses": 0, "uploads": 0, "upload_errors": 0, "evictions": 0}
+
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    @classmethod
+    def from_uri(cls, uri: str, **kwargs) -> "ImageStaging":
+        """Staging in ``gs://bucket/prefix``, or in a local directory for any other value."""
+        if uri.startswith("gs://"):
+            return cls(GCSStagingStore(uri), **kwargs)
+        return cls(LocalStagingStore(Path(uri)), **kwargs)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(str(self.index_path), timeout=30, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            self._stats[counter] += 1
+
+    def lookup(self, digest: str) -> Optional[str]:
+        """URI of a staged, unexpired image, or None."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT uri, uploaded FROM staged WHERE digest = ?", (digest,)).fetchone()
+        if row is None or (self.ttl_seconds and time.time() - row[1] > self.ttl_seconds):
+            return None
+        return row[0]
+
+    def resolve(self, image: Image) -> Image:
+        """The image to send: a URI reference if it is staged, else ``image`` itself.
+
+        An inline image that isn't staged yet is queued for upload, so the
+        next request for it can use the URI.
+        """
+        if not image.image_bytes:
+            return image
+        digest = image_digest(image)
+        uri = self.lookup(digest)
+        if uri is not None:
+            self._count("hits")
+            return Image(gcs_uri=uri, mime_type=image.mime_type)
+
+        self._count("misses")
+        with self._lock:
+            if digest in self._pending:
+                return image
+            self._pending.add(digest)
+        self._executor.submit(self._upload, digest, image.image_bytes, image.mime_type)
+        return image
+
+    def stage(self, image: Image) -> Image:
+        """Upload ``image`` now if needed and return its URI reference."""
+        if not image.image_bytes:
+            return image
+        digest = image_digest(image)
+        uri = self.lookup(digest) or self._upload(digest, image.image_bytes, image.mime_type)
+        return Image(gcs_uri=uri, mime_type=image.mime_type)
+
+    def _upload(self, digest: str, data: bytes, mime_type: Optional[str]) -> str:
+        extension = mimetypes.guess_extension(mime_type or "") or ""
+        try:
+            uri = self.store.upload(f"{digest}{extension}", data, mime_type)
+            now = time.time()
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO staged (digest, uri, size, uploaded) VALUES (?, ?, ?, ?)",
+                    (digest, uri, len(data), now),
+                )
+        except Exception as e:
+            self._count("upload_errors")
+            print(f"⚠️ Staging upload failed: {e}")
+            raise
+        finally:
+            # Only after the index row exists, so nobody queues a second upload
+            with self._lock:
+                self._pending.discard(digest)
+        self._count("uploads")
+        self.evict_expired(now)
+        return uri
+
+    def evict_expired(self, now: Optional[float] = None) -> int:
+        """Drop index entries older than the TTL; returns how many."""
+        if not self.ttl_seconds:
+            return 0
+        cutoff = (now or time.time()) - self.ttl_seconds
+        with self._connect() as conn:
+            evicted = conn.execute("DELETE FROM staged WHERE uploaded < ?", (cutoff,)).rowcount
+        with self._lock:
+            self._stats["evictions"] += evicted
+        return evicted
+
+    def stats(self) -> dict:
+        """Hit/miss/upload counters plus the number of staged images."""
+        with self._connect() as conn:
+            entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM staged").fetchone()
+        with self._lock:
+            return {**self._stats, "pending": len(self._pending), "entries": entries, "bytes": size}
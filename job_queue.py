@@ -0,0 +1,247 @@
+"""
+Job queue for the Virtual Try-On web UI
+A bounded, per-user fair queue in front of a fixed worker pool, so the number
+of concurrent Vertex AI calls follows quota rather than the number of UI threads.
+"""
+
+import heapq
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import Future, wait
+from typing import Callable, Iterator, Optional
+
+import config
+import metrics
+
+
+class QueueFull(Exception):
+    """The queue (or the user's share of it) has no room for another job."""
+
+
+class Job:
+    """One queued call; its outcome is available through ``result()``."""
+
+    def __init__(self, queue: "JobQueue", user: str, fn: Callable, args: tuple, kwargs: dict):
+        self.id = uuid.uuid4().hex
+        self.user = user
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+        self.submitted = time.monotonic()
+        self.started: Optional[float] = None
+        self._queue = queue
+
+    @property
+    def status(self) -> str:
+        if self.future.cancelled():
+            return "cancelled"
+        if self.future.done():
+            return "failed" if self.future.exception() else "done"
+        return "running" if self.started is not None else "queued"
+
+    def done(self) -> bool:
+        return self.future.done()
+
+    def result(self, timeout: Optional[float] = None):
+        """Block until the job finishes and return its result (or raise its error)."""
+        return self.future.result(timeout)
+
+    def cancel(self) -> bool:
+        """Cancel the job; see JobQueue.cancel."""
+        return self._queue.cancel(self)
+
+    def position(self) -> int:
+        """Number of jobs that will start before this one (0 once running)."""
+        return self._queue.position(self)
+
+    def eta(self) -> float:
+        """Estimated seconds until this job finishes."""
+        return self._queue.eta(self)
+
+
+class JobQueue:
+    """Bounded job queue served by a worker pool with round-robin fairness.
+
+    Each user has their own FIFO; workers take the next job from users in
+    turn, so one user submitting many jobs can't starve everyone else. At
+    most ``max_size`` jobs wait in total and ``max_per_user`` per user.
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        max_size: Optional[int] = None,
+        max_per_user: Optional[int] = None,
+        initial_service_time: float = 20.0
+    ):
+        """Create a queue and start its workers.
+
+        Args:
+            workers: Number of jobs run concurrently (default: config.JOB_WORKERS)
+            max_size: Maximum number of waiting jobs (default: config.JOB_QUEUE_MAX_SIZE)
+            max_per_user: Maximum waiting jobs per user (default: config.JOB_QUEUE_MAX_PER_USER)
+            initial_service_time: Job duration assumed for ETAs until real ones are measured
+        """
+        self.workers = workers or config.JOB_WORKERS
+        self.max_size = max_size or config.JOB_QUEUE_MAX_SIZE
+        self.max_per_user = max_per_user or config.JOB_QUEUE_MAX_PER_USER
+
+        self._lock = threading.Condition()
+        # user -> that user's waiting jobs; order is the round-robin order
+        self._queues: "OrderedDict[str, deque[Job]]" = OrderedDict()
+        self._size = 0
+        self._running: set[Job] = set()
+        self._service_time = initial_service_time
+        self._stats = {"submitted": 0, "completed": 0, "failed": 0, "cancelled": 0, "rejected": 0}
+
+        for i in range(self.workers):
+            threading.Thread(target=self._work, name=f"vto-job-{i}", daemon=True).start()
+
+    def submit(self, user: str, fn: Callable, *args, **kwargs) -> Job:
+        """Queue ``fn(*args, **kwargs)`` on behalf of ``user``.
+
+        Raises:
+            QueueFull: If the queue or the user's share of it is full
+        """
+        job = Job(self, user, fn, args, kwargs)
+        with self._lock:
+            user_queue = self._queues.get(user)
+            if self._size >= self.max_size:
+                self._stats["rejected"] += 1
+                raise QueueFull("The service is busy; please try again in a minute.")
+            if user_queue is not None and len(user_queue) >= self.max_per_user:
+                self._stats["rejected"] += 1
+                raise QueueFull(f"You already have {len(user_queue)} requests waiting.")
+            if user_queue is None:
+                user_queue = self._queues[user] = deque()
+            user_queue.append(job)
+            self._size += 1
+            self._stats["submitted"] += 1
+            self._lock.notify()
+        return job
+
+    def cancel(self, job: Job) -> bool:
+        """Cancel a job.
+
+        A waiting job is removed from the queue. A running job can't be
+        interrupted mid-call; it is marked cancelled and its result dropped.
+
+        Returns:
+            False if the job had already finished
+        """
+        with self._lock:
+            if job.future.done():
+                return False
+            user_queue = self._queues.get(job.user)
+            if user_queue is not None and job in user_queue:
+                user_queue.remove(job)
+                self._size -= 1
+                if not user_queue:
+                    del self._queues[job.user]
+            self._stats["cancelled"] += 1
+            # Works for running jobs too: workers never mark the future running
+            return job.future.cancel()
+
+    def _next_job(self) -> Job:
+        """Pop the next job in round-robin order; must hold the lock."""
+        user, user_queue = next(iter(self._queues.items()))
+        job = user_queue.popleft()
+        self._size -= 1
+        if user_queue:
+            self._queues.move_to_end(user)
+        else:
+            del self._queues[user]
+        return job
+
+    def _work(self) -> None:
+        while True:
+            with self._lock:
+                while not self._size:
+                    self._lock.wait()
+                job = self._next_job()
+                job.started = time.monotonic()
+                self._running.add(job)
+            metrics.registry.observe("queue_wait", job.started - job.submitted)
+
+            error = result = None
+            try:
+                result = job.fn(*job.args, **job.kwargs)
+            except BaseException as e:
+                error = e
+
+            with self._lock:
+                self._running.discard(job)
+                elapsed = time.monotonic() - job.started
+                self._service_time += 0.2 * (elapsed - self._service_time)
+                if job.future.cancelled():
+                    continue
+                self._stats["failed" if error else "completed"] += 1
+                if error is None:
+                    job.future.set_result(result)
+                else:
+                    job.future.set_exception(error)
+
+    def position(self, job: Job) -> int:
+        """Number of jobs that will be dispatched before ``job``."""
+        with self._lock:
+            user_queue = self._queues.get(job.user)
+            if user_queue is None or job not in user_queue:
+                return 0
+            index = user_queue.index(job)
+            ahead = index
+            # Every other user gets one turn per round; users earlier in the
+            # rotation also get their turn in the round this job is picked
+            before = True
+            for user, other_queue in self._queues.items():
+                if user == job.user:
+                    before = False
+                    continue
+                ahead += min(len(other_queue), index + 1 if before else index)
+            return ahead
+
+    def eta(self, job: Job) -> float:
+        """Estimated seconds until ``job`` finishes, from the average job duration.
+
+        A queued job starts when a worker frees up: the running jobs are
+        assumed to take ``service_time`` in total, so one that has already
+        run for a while frees its worker sooner.
+        """
+        if job.future.done():
+            return 0.0
+        position = self.position(job)
+        with self._lock:
+            service_time = self._service_time
+            now = time.monotonic()
+            if job.started is not None:
+                return max(0.0, service_time - (now - job.started))
+            remaining = [max(0.0, service_time - (now - other.started)) for other in self._running]
+        # When each worker is next free: idle workers now, busy ones after
+        # their current job; then hand out the jobs ahead of this one in turn
+        free_at = remaining + [0.0] * max(0, self.workers - len(remaining))
+        heapq.heapify(free_at)
+        for _ in range(position):
+            heapq.heapreplace(free_at, free_at[0] + service_time)
+        return free_at[0] + service_time
+
+    def progress(self, job: Job, poll_interval: float = 1.0) -> Iterator[str]:
+        """Yield human-readable status lines until ``job`` finishes."""
+        while not job.future.done():
+            if job.started is None:
+                yield f"⏳ Queued (position {job.position() + 1}), about {job.eta():.0f}s to go..."
+            else:
+                yield f"⚙️ Generating... about {job.eta():.0f}s to go"
+            wait([job.future], timeout=poll_interval)
+
+    def stats(self) -> dict:
+        """Queue depth, running jobs, outcome counters and mean job duration."""
+        with self._lock:
+            return {
+                **self._stats,
+                "queued": self._size,
+                "running": len(self._running),
+                "users_waiting": len(self._queues),
+                "service_time": round(self._service_time, 2),
+            }
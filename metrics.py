@@ -0,0 +1,408 @@
+"""
+Pipeline metrics for Virtual Try-On
+Per-stage latency histograms and counters, tagged by method, region and
+outcome, readable in-process or as Prometheus text over HTTP.
+"""
+
+import contextvars
+import functools
+import inspect
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Iterator, Optional
+from uuid import uuid4
+
+import config
+
+
+# Upper bounds (seconds) of the latency histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+# Labels set by the enclosing request (e.g. method) and inherited by its stages
+_context_labels: contextvars.ContextVar[dict] = contextvars.ContextVar("vto_metric_labels", default={})
+# ID and start time of the enclosing request, for output metadata (never a label)
+_context_request: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar(
+    "vto_request", default=None
+)
+
+
+def _outcome(error: Optional[BaseException]) -> str:
+    if error is None:
+        return "ok"
+    if isinstance(error, (GeneratorExit, KeyboardInterrupt)) or type(error).__name__ == "CancelledError":
+        return "cancelled"
+    return "error"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(pairs: tuple) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+class _Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Bucket upper bound below which a fraction ``q`` of observations fall."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(BUCKETS + (float("inf"),), self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class MetricsRegistry:
+    """Thread-safe store of stage histograms, counters and gauge collectors."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms: dict[tuple, _Histogram] = {}
+        self._counters: dict[tuple, float] = {}
+        self._collectors: dict[str, Callable[[], dict]] = {}
+        self._readiness: dict[str, Callable[[], bool]] = {}
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> tuple:
+        merged = {**_context_labels.get(), **labels}
+        return (name, tuple(sorted((k, str(v)) for k, v in merged.items() if v not in (None, ""))))
+
+    def observe(self, stage: str, seconds: float, **labels) -> None:
+        """Record one duration for ``stage``."""
+        key = self._key(stage, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram()
+            histogram.observe(seconds)
+
+    def inc(self, name: str, amount: float = 1, **labels) -> None:
+        """Add ``amount`` to counter ``name``."""
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def register_collector(self, prefix: str, collect: Callable[[], dict]) -> None:
+        """Export the numeric values of ``collect()`` as gauges named ``vto_<prefix>_<key>``."""
+        with self._lock:
+            self._collectors[prefix] = collect
+
+    def register_readiness(self, name: str, check: Callable[[], bool]) -> None:
+        """Make ``/ready`` report not ready until ``check()`` returns True."""
+        with self._lock:
+            self._readiness[name] = check
+
+    def readiness(self) -> dict:
+        """Result of every readiness check; a check that raises counts as not ready."""
+        with self._lock:
+            checks = dict(self._readiness)
+        results = {}
+        for name, check in checks.items():
+            try:
+                results[name] = bool(check())
+            except Exception:
+                results[name] = False
+        return results
+
+    def snapshot(self) -> dict:
+        """Current values: per-stage count/sum/p50/p95/p99, counters and gauges."""
+        with self._lock:
+            stages = [
+                {
+                    "stage": name,
+                    "labels": dict(labels),
+                    "count": h.count,
+                    "sum_seconds": round(h.sum, 6),
+                    "p50": h.quantile(0.5),
+                    "p95": h.quantile(0.95),
+                    "p99": h.quantile(0.99),
+                }
+                for (name, labels), h in self._histograms.items()
+            ]
+            counters = [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in self._counters.items()
+            ]
+            collectors = dict(self._collectors)
+        return {"stages": stages, "counters": counters, "gauges": self._collect(collectors)}
+
+    @staticmethod
+    def _collect(collectors: dict) -> dict:
+        gauges = {}
+        for prefix, collect in collectors.items():
+            try:
+                values = collect()
+            except Exception:
+                continue
+            for key, value in values.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    gauges[f"{prefix}_{key}"] = value
+        return gauges
+
+    def render_prometheus(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            histograms = [(name, labels, list(h.counts), h.sum, h.count)
+                          for (name, labels), h in sorted(self._histograms.items())]
+            counters = sorted(self._counters.items())
+            collectors = dict(self._collectors)
+
+        lines = [
+            "# HELP vto_stage_seconds Time spent in each try-on pipeline stage",
+            "# TYPE vto_stage_seconds histogram",
+        ]
+        for name, labels, counts, total, count in histograms:
+            labels = (("stage", name),) + labels
+            cumulative = 0
+            for bound, n in zip(BUCKETS + (float("inf"),), counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                bucket_labels = _format_labels(labels + (("le", le),))
+                lines.append(f"vto_stage_seconds_bucket{bucket_labels} {cumulative}")
+            lines.append(f"vto_stage_seconds_sum{_format_labels(labels)} {total}")
+            lines.append(f"vto_stage_seconds_count{_format_labels(labels)} {count}")
+
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                lines.append(f"# TYPE vto_{name}_total counter")
+                typed.add(name)
+            lines.append(f"vto_{name}_total{_format_labels(labels)} {value}")
+
+        for name, value in sorted(self._collect(collectors).items()):
+            lines.append(f"# TYPE vto_{name} gauge")
+            lines.append(f"vto_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        """Forget all recorded histograms and counters (collectors stay registered)."""
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+
+registry = MetricsRegistry()
+
+
+@contextmanager
+def labels(**values) -> Iterator[None]:
+    """Tag every stage recorded inside the block (in this thread or task) with ``values``."""
+    token = _context_labels.set({**_context_labels.get(), **values})
+    try:
+        yield
+    finally:
+        _context_labels.reset(token)
+
+
+@contextmanager
+def request_id(value: str) -> Iterator[None]:
+    """Use ``value`` as the ID of the request started inside the block (e.g. a manifest ID)."""
+    token = _context_request.set({"request_id": value, "start": None})
+    try:
+        yield
+    finally:
+        _context_request.reset(token)
+
+
+def _new_request_id() -> str:
+    """The ID set by request_id(), or a fresh random one."""
+    current = _context_request.get()
+    return current["request_id"] if current else uuid4().hex[:16]
+
+
+@contextmanager
+def _request_scope(start: float, request_id: str) -> Iterator[None]:
+    if (_context_request.get() or {}).get("start") is not None:
+        # Nested request (e.g. try_on_multiple_items driving iter_multiple_items)
+        yield
+        return
+    token = _context_request.set({"request_id": request_id, "start": start})
+    try:
+        yield
+    finally:
+        _context_request.reset(token)
+
+
+def current_request() -> Optional[dict]:
+    """ID, method and elapsed seconds of the request running here, or None outside one."""
+    current = _context_request.get()
+    if current is None or current["start"] is None:
+        return None
+    return {
+        "request_id": current["request_id"],
+        "method": _context_labels.get().get("method"),
+        "elapsed_seconds": time.perf_counter() - current["start"],
+    }
+
+
+@contextmanager
+def stage(name: str, **values) -> Iterator[None]:
+    """Time the block as pipeline stage ``name``, tagged with its outcome."""
+    start = time.perf_counter()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        registry.observe(name, time.perf_counter() - start, outcome=_outcome(error), **values)
+
+
+@contextmanager
+def request(method: str) -> Iterator[None]:
+    """Tag the block with ``method`` and record it as one request."""
+    start = time.perf_counter()
+    error = None
+    with labels(method=method), _request_scope(start, _new_request_id()):
+        try:
+            yield
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            _record_request(method, start, error)
+
+
+def instrument(method: str) -> Callable:
+    """Decorator recording each call of a try-on method as a ``method`` request.
+
+    Works for plain and async functions as well as (async) generators; for
+    generators the request spans the whole iteration and the ``method`` tag
+    (and current_request()) applies only while the generator itself is running.
+    """
+    def decorate(fn: Callable) -> Callable:
+        if inspect.isgeneratorfunction(fn):
+            @functools.wraps(fn)
+            def generator_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                rid = _new_request_id()
+                error = None
+                steps = fn(*args, **kwargs)
+                try:
+                    while True:
+                        with labels(method=method), _request_scope(start, rid):
+                            try:
+                                item = next(steps)
+                            except StopIteration as stop:
+                                return stop.value
+                        yield item
+                except BaseException as e:
+                    error = e
+                    raise
+                finally:
+                    steps.close()
+                    _record_request(method, start, error)
+            return generator_wrapper
+
+        if inspect.isasyncgenfunction(fn):
+            @functools.wraps(fn)
+            async def async_generator_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                rid = _new_request_id()
+                error = None
+                steps = fn(*args, **kwargs)
+                try:
+                    while True:
+                        with labels(method=method), _request_scope(start, rid):
+                            try:
+                                item = await steps.__anext__()
+                            except StopAsyncIteration:
+                                return
+                        yield item
+                except BaseException as e:
+                    error = e
+                    raise
+                finally:
+                    await steps.aclose()
+                    _record_request(method, start, error)
+            return async_generator_wrapper
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with request(method):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with request(method):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    return decorate
+
+
+def _record_request(method: str, start: float, error: Optional[BaseException]) -> None:
+    outcome = _outcome(error)
+    registry.observe("request", time.perf_counter() - start, method=method, outcome=outcome)
+    registry.inc("requests", method=method, outcome=outcome)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path == "/ready":
+            self._ready()
+            return
+        if path not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = registry.render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _ready(self):
+        """200 once every registered readiness check passes, else 503 listing the failures."""
+        pending = [name for name, ok in registry.readiness().items() if not ok]
+        body = (f"not ready: {', '.join(pending)}\n" if pending else "ready\n").encode()
+        self.send_response(503 if pending else 200)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port: Optional[int] = None, host: str = "0.0.0.0") -> Optional[ThreadingHTTPServer]:
+    """Serve ``/metrics`` and ``/ready`` in a background thread (default port:
+    config.METRICS_PORT; 0 disables)."""
+    port = config.METRICS_PORT if port is None else port
+    if not port:
+        return None
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        # Another process (e.g. a second app instance) already serves metrics
+        print(f"Metrics endpoint not started on port {port}: {e}")
+        return None
+    threading.Thread(target=server.serve_forever, name="vto-metrics", daemon=True).start()
+    print(f"Metrics available at http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,133 @@
+"""
+Outfit-prefix memoization for multi-item try-on
+Remembers the intermediate images of garment chains so outfits that share a
+prefix (same person, same first garments) only pay for the steps that differ.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from google.genai.types import Image
+
+import config
+
+
+def image_digest(image: Image) -> str:
+    """Content hash of an input image (its bytes, or its URI for GCS images)."""
+    if image.image_bytes:
+        return hashlib.sha256(image.image_bytes).hexdigest()
+    return hashlib.sha256(f"uri:{image.gcs_uri}".encode()).hexdigest()
+
+
+def chain_keys(
+    person_image: Image,
+    garment_images: list[Image],
+    model: str,
+    safety_filter_level: str,
+    number_of_images: int,
+) -> list[tuple]:
+    """Keys for every prefix of a garment chain.
+
+    ``keys[i]`` identifies the result of trying on ``garment_images[:i + 1]``;
+    the first element of every key is a root hash covering the person image
+    and all request settings.
+    """
+    root = hashlib.sha256(
+        f"{image_digest(person_image)}|{model}|{safety_filter_level}|{number_of_images}".encode()
+    ).hexdigest()
+    prefix = (root,)
+    keys = []
+    for garment_image in garment_images:
+        prefix = prefix + (image_digest(garment_image),)
+        keys.append(prefix)
+    return keys
+
+
+class OutfitPrefixCache:
+    """In-memory LRU of chain intermediates keyed by (person, garment prefix).
+
+    Whenever a key is used, all of its shorter prefixes are refreshed after it,
+    so a prefix is always more recently used than its extensions. Eviction
+    therefore removes the longest chains first and the cache stays
+    prefix-closed: if a chain is cached, every step leading up to it is too.
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None):
+        """Create a cache holding at most ``max_bytes`` of image data
+        (default: config.OUTFIT_CACHE_MAX_BYTES)."""
+        self.max_bytes = max_bytes or config.OUTFIT_CACHE_MAX_BYTES
+        self._entries: "OrderedDict[tuple, list[Image]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _entry_size(images: list[Image]) -> int:
+        return sum(len(image.image_bytes or b"") for image in images)
+
+    def _touch(self, key: tuple) -> None:
+        # Shortest prefix ends up most recent
+        for length in range(len(key), 1, -1):
+            prefix = key[:length]
+            if prefix in self._entries:
+                self._entries.move_to_end(prefix)
+
+    def longest_prefix(self, keys: list[tuple]) -> list[list[Image]]:
+        """Return the cached step results for the longest cached prefix of ``keys``.
+
+        Returns:
+            One list of generated images per cached step, in chain order
+            (empty if not even the first step is cached)
+        """
+        with self._lock:
+            steps = []
+            for key in keys:
+                images = self._entries.get(key)
+                if images is None:
+                    break
+                steps.append(images)
+            if steps:
+                self._touch(keys[len(steps) - 1])
+            self.hits += len(steps)
+            self.misses += int(len(steps) < len(keys))
+            return steps
+
+    def get(self, key: tuple) -> Optional[list[Image]]:
+        """Cached result for one chain prefix, or None."""
+        with self._lock:
+            images = self._entries.get(key)
+            if images is None:
+                self.misses += 1
+                return None
+            self._touch(key)
+            self.hits += 1
+            return images
+
+    def put(self, key: tuple, images: list[Image]) -> None:
+        """Remember the result of one chain step."""
+        size = self._entry_size(images)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= self._entry_size(previous)
+            self._entries[key] = images
+            self._size += size
+            self._touch(key)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= self._entry_size(evicted)
+
+    def stats(self) -> dict:
+        """Hit/miss counters and current memory use."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "bytes": self._size,
+            }
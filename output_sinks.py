@@ -0,0 +1,231 @@
+"""
+Output sinks for generated try-on images
+A sink decides where (and whether) generated images are persisted.
+"""
+
+import io
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Iterable, Optional, Protocol
+
+from PIL import Image as PIL_Image
+from PIL import features as PIL_features
+
+import config
+import metrics
+
+
+# Re-encoding targets: Pillow format, file extension and Pillow feature to check
+OUTPUT_FORMATS = {
+    "jpeg": ("JPEG", ".jpeg", "jpg"),
+    "webp": ("WEBP", ".webp", "webp"),
+    "avif": ("AVIF", ".avif", "avif"),
+}
+
+
+class OutputSink(Protocol):
+    """Anything VirtualTryOn can hand generated images to."""
+
+    def save(self, image_bytes: bytes, name: str, metadata: Optional[dict] = None) -> str:
+        """Persist one encoded image and return where it ended up."""
+        ...
+
+
+class DirectorySink:
+    """Write generated images, byte for byte, into a local directory."""
+
+    def __init__(self, directory: Optional[Path] = None):
+        """Create a sink writing to ``directory`` (default: config.OUTPUT_DIR)."""
+        self.directory = Path(directory or config.OUTPUT_DIR)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def save(self, image_bytes: bytes, name: str, metadata: Optional[dict] = None) -> str:
+        """Persist one image.
+
+        Args:
+            image_bytes: Encoded image as returned by the API
+            name: Suggested file name
+            metadata: Request details (model, safety level, mime type, ...)
+
+        Returns:
+            Path of the written file
+        """
+        path = self.directory / name
+        path.write_bytes(image_bytes)
+        return str(path)
+
+
+class BackgroundWriter:
+    """Write generated images from a thread pool, optionally re-encoded.
+
+    ``save()`` queues the write and returns the final path straight away, so
+    the request thread never waits for encoding or disk I/O. At most
+    ``max_pending`` writes are queued; beyond that ``save()`` blocks, so a
+    slow disk applies backpressure instead of growing memory. Call
+    ``wait()``/``flush()`` before reading a returned path. Pending writes
+    are finished at interpreter exit.
+    """
+
+    def __init__(
+        self,
+        directory: Optional[Path] = None,
+        format: Optional[str] = None,
+        quality: Optional[int] = None,
+        workers: Optional[int] = None,
+        max_pending: Optional[int] = None,
+        fsync: bool = False
+    ):
+        """Create a writer.
+
+        Args:
+            directory: Directory for relative names (default: config.OUTPUT_DIR)
+            format: "original" to write the API's bytes untouched, or "jpeg",
+                "webp" or "avif" to re-encode (default: config.OUTPUT_FORMAT)
+            quality: Encoder quality when re-encoding (default: config.OUTPUT_QUALITY)
+            workers: Concurrent writes (default: config.OUTPUT_WRITE_WORKERS)
+            max_pending: Queued writes before save() blocks (default: config.OUTPUT_MAX_PENDING)
+            fsync: Flush each file to stable storage before it counts as written
+        """
+        self.directory = Path(directory or config.OUTPUT_DIR)
+        self.format = (format or config.OUTPUT_FORMAT).lower()
+        if self.format != "original":
+            if self.format not in OUTPUT_FORMATS:
+                raise ValueError(
+                    f"Unknown output format {self.format!r}; use original, {', '.join(OUTPUT_FORMATS)}"
+                )
+            if not PIL_features.check(OUTPUT_FORMATS[self.format][2]):
+                raise ValueError(f"This Pillow build cannot write {self.format}")
+        self.quality = quality or config.OUTPUT_QUALITY
+        self.fsync = fsync
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers or config.OUTPUT_WRITE_WORKERS, thread_name_prefix="vto-writer"
+        )
+        self._slots = threading.BoundedSemaphore(max_pending or config.OUTPUT_MAX_PENDING)
+        self._lock = threading.Lock()
+        self._pending: dict[str, Future] = {}
+        # Failed writes not yet reported by wait()/flush()
+        self._failed: dict[str, Future] = {}
+        # Failed writes wait() reported before their done callback ran
+        self._reported: set[Future] = set()
+        self._stats = {"written": 0, "failed": 0, "bytes": 0}
+
+    def path_for(self, name: str) -> Path:
+        """Where ``save(..., name)`` will write (the extension follows the format)."""
+        path = self.directory / name
+        if self.format != "original":
+            path = path.with_suffix(OUTPUT_FORMATS[self.format][1])
+        return path
+
+    def save(self, image_bytes: bytes, name: str, metadata: Optional[dict] = None) -> str:
+        """Queue one image for writing and return the path it will have.
+
+        ``name`` is relative to the writer's directory (absolute paths are
+        used as is); an existing file is replaced.
+        """
+        path = str(self.path_for(name))
+        key = os.path.abspath(path)
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(self._write, path, image_bytes)
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._pending[key] = future
+        future.add_done_callback(lambda f: self._done(key, f))
+        return path
+
+    def _write(self, path: str, data: bytes) -> None:
+        start = time.perf_counter()
+        if self.format != "original":
+            pil_format = OUTPUT_FORMATS[self.format][0]
+            with PIL_Image.open(io.BytesIO(data)) as img:
+                if pil_format == "JPEG" and img.mode not in ("RGB", "L"):
+                    img = img.convert("RGB")
+                buffer = io.BytesIO()
+                img.save(buffer, format=pil_format, quality=self.quality)
+            data = buffer.getvalue()
+
+        # Written under a temporary name and renamed, so readers never see a partial file
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp_")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+                if self.fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        metrics.registry.observe("write", time.perf_counter() - start, format=self.format)
+        with self._lock:
+            self._stats["bytes"] += len(data)
+
+    def _done(self, path: str, future: Future) -> None:
+        self._slots.release()
+        error = future.exception()
+        with self._lock:
+            if self._pending.get(path) is future:
+                del self._pending[path]
+            if error is None:
+                self._stats["written"] += 1
+            else:
+                self._stats["failed"] += 1
+                if future in self._reported:
+                    self._reported.discard(future)
+                else:
+                    self._failed[path] = future
+        if error is not None:
+            print(f"⚠️ Could not write {path}: {error}")
+
+    def wait(self, paths: Optional[Iterable[str]] = None, timeout: Optional[float] = None) -> None:
+        """Block until the given paths (default: every queued write) are on disk.
+
+        Raises:
+            TimeoutError: If writes are still pending after ``timeout`` seconds
+            Exception: The first write error among the paths waited for
+        """
+        with self._lock:
+            if paths is None:
+                keys = list(self._pending) + list(self._failed)
+            else:
+                keys = [os.path.abspath(p) for p in paths]
+            futures = {self._pending.get(key) or self._failed.get(key) for key in keys} - {None}
+        done, not_done = wait(futures, timeout)
+        if not_done:
+            raise TimeoutError(f"{len(not_done)} image write(s) still pending")
+        failed = [future for future in done if future.exception() is not None]
+        with self._lock:
+            for key in keys:
+                self._failed.pop(key, None)
+            # wait() can return before a done callback has run; tell it the
+            # failure is reported so it isn't raised again by a later flush()
+            for future in failed:
+                if any(self._pending.get(key) is future for key in keys):
+                    self._reported.add(future)
+        if failed:
+            raise failed[0].exception()
+
+    def flush(self, timeout: Optional[float] = None) -> None:
+        """Block until every queued write is done; see wait()."""
+        self.wait(None, timeout)
+
+    def close(self) -> None:
+        """Finish pending writes and stop the worker threads."""
+        self._executor.shutdown(wait=True)
+
+    def stats(self) -> dict:
+        """Write counters and the number of writes still queued."""
+        with self._lock:
+            return {**self._stats, "pending": len(self._pending)}
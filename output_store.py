@@ -0,0 +1,290 @@
+"""
+Content-addressed output store for Virtual Try-On
+Generated images are sharded into subdirectories by content hash and described
+in an SQLite index (input hashes, model, safety level, latency, request ID), so
+results can be found by input, garment or date without listing directories.
+
+Usage:
+    python output_store.py --garment input_images/clothing/shirt.jpg
+    python output_store.py --since 2025-06-01 --until 2025-06-02
+"""
+
+import argparse
+import hashlib
+import json
+import sqlite3
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+import config
+from output_sinks import BackgroundWriter
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outputs (
+    id INTEGER PRIMARY KEY,
+    digest TEXT NOT NULL,
+    path TEXT NOT NULL,
+    name TEXT,
+    created REAL NOT NULL,
+    request_id TEXT,
+    method TEXT,
+    person_digest TEXT,
+    garment_digest TEXT,
+    source_digest TEXT,
+    model TEXT,
+    safety_filter_level TEXT,
+    mime_type TEXT,
+    image_index INTEGER,
+    latency_seconds REAL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS outputs_digest ON outputs (digest);
+CREATE INDEX IF NOT EXISTS outputs_created ON outputs (created);
+CREATE INDEX IF NOT EXISTS outputs_request ON outputs (request_id);
+CREATE INDEX IF NOT EXISTS outputs_person ON outputs (person_digest, created);
+CREATE INDEX IF NOT EXISTS outputs_garment ON outputs (garment_digest, created);
+CREATE INDEX IF NOT EXISTS outputs_source ON outputs (source_digest, created);
+"""
+
+_COLUMNS = (
+    "digest", "path", "name", "created", "request_id", "method", "person_digest",
+    "garment_digest", "source_digest", "model", "safety_filter_level", "mime_type",
+    "image_index", "latency_seconds", "size",
+)
+
+
+class OutputStore:
+    """An OutputSink that files images by content hash and indexes their metadata.
+
+    An image is stored at ``<directory>/<ab>/<cd>/<sha256>.<ext>``, so no
+    directory grows past a few thousand entries and identical images are
+    stored once. Every save adds an index row, even for a duplicate image, so
+    each request that produced it can be found. The index records paths
+    relative to the store directory, so it can be queried from anywhere. Files are written in the
+    background by a BackgroundWriter; call ``wait()`` before reading one. The
+    index is shared by every process using the same directory.
+    """
+
+    def __init__(
+        self,
+        directory: Optional[Path] = None,
+        writer: Optional[BackgroundWriter] = None
+    ):
+        """Open (or create) a store.
+
+        Args:
+            directory: Root of the shards and the index (default: config.OUTPUT_STORE_DIR)
+            writer: Writer for the image files (default: a BackgroundWriter
+                using config.OUTPUT_FORMAT and OUTPUT_QUALITY)
+        """
+        self.directory = Path(directory or config.OUTPUT_STORE_DIR).resolve()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.directory / "index.sqlite3"
+        self.writer = writer or BackgroundWriter(self.directory)
+
+        with self._connect() as conn:
+            # WAL lets readers query while request threads insert
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(str(self.index_path), timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _relative(self, path: str) -> str:
+        """``path`` as stored in the index: relative to the store if it is inside it."""
+        try:
+            return Path(path).resolve().relative_to(self.directory).as_posix()
+        except ValueError:
+            return str(Path(path).resolve())
+
+    def resolve(self, path: str) -> Path:
+        """Absolute location of a ``path`` from the index."""
+        return self.directory / path
+
+    def save(self, image_bytes: bytes, name: str, metadata: Optional[dict] = None) -> str:
+        """Store one image and index it.
+
+        Args:
+            image_bytes: Encoded image as returned by the API
+            name: Suggested file name; only its extension is used for the
+                file, the name itself is kept in the index
+            metadata: Request details; ``person_digest``, ``garment_digest``,
+                ``source_digest``, ``request_id``, ``method``,
+                ``latency_seconds``, ``model``, ``safety_filter_level``,
+                ``mime_type`` and ``index`` are indexed
+
+        Returns:
+            Path of the stored file
+        """
+        metadata = metadata or {}
+        digest = hashlib.sha256(image_bytes).hexdigest()
+        with self._connect() as conn:
+            row = conn.execute("SELECT path FROM outputs WHERE digest = ? LIMIT 1", (digest,)).fetchone()
+        if row is not None and self.resolve(row["path"]).exists():
+            relative = row["path"]
+        else:
+            suffix = Path(name).suffix or ".jpeg"
+            relative = self._relative(
+                self.writer.save(image_bytes, f"{digest[:2]}/{digest[2:4]}/{digest}{suffix}")
+            )
+
+        values = {
+            "digest": digest,
+            "path": relative,
+            "name": name,
+            "created": time.time(),
+            "request_id": metadata.get("request_id"),
+            "method": metadata.get("method"),
+            "person_digest": metadata.get("person_digest"),
+            "garment_digest": metadata.get("garment_digest"),
+            "source_digest": metadata.get("source_digest"),
+            "model": metadata.get("model"),
+            "safety_filter_level": metadata.get("safety_filter_level"),
+            "mime_type": metadata.get("mime_type"),
+            "image_index": metadata.get("index"),
+            "latency_seconds": metadata.get("latency_seconds"),
+            "size": len(image_bytes),
+        }
+        with self._connect() as conn:
+            conn.execute(
+                f"INSERT INTO outputs ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})",
+                [values[column] for column in _COLUMNS],
+            )
+        return str(self.resolve(relative))
+
+    def wait(self, paths: Optional[Iterable[str]] = None, timeout: Optional[float] = None) -> None:
+        """Block until stored files are on disk; see BackgroundWriter.wait."""
+        self.writer.wait(paths, timeout)
+
+    def find(
+        self,
+        person: Optional[str] = None,
+        garment: Optional[str] = None,
+        source: Optional[str] = None,
+        request_id: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        limit: Optional[int] = 100
+    ) -> list[dict]:
+        """Indexed lookup of stored outputs, newest first.
+
+        Args:
+            person: Hash of the person image a step was applied to
+            garment: Hash of the garment image
+            source: Hash of the original person image of a chain or outfit
+                (the same as ``person`` for single-item try-ons)
+            request_id: ID of the request that produced the output
+            since: Earliest creation time (Unix seconds, inclusive)
+            until: Latest creation time (Unix seconds, exclusive)
+            limit: Maximum number of rows (None for all)
+
+        Returns:
+            One dict of index columns per output, with ``path`` made absolute
+        """
+        clauses, params = [], []
+        for column, value in (
+            ("person_digest", person),
+            ("garment_digest", garment),
+            ("source_digest", source),
+            ("request_id", request_id),
+        ):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if since is not None:
+            clauses.append("created >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("created < ?")
+            params.append(until)
+
+        query = "SELECT * FROM outputs"
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY created DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        with self._connect() as conn:
+            rows = [dict(row) for row in conn.execute(query, params).fetchall()]
+        for row in rows:
+            row["path"] = str(self.resolve(row["path"]))
+        return rows
+
+    def by_input(self, digest: str, **kwargs) -> list[dict]:
+        """Outputs generated from a person image, directly or as the start of a chain."""
+        return self.find(source=digest, **kwargs)
+
+    def by_garment(self, digest: str, **kwargs) -> list[dict]:
+        """Outputs generated with a garment image."""
+        return self.find(garment=digest, **kwargs)
+
+    def between(self, since: float, until: float, **kwargs) -> list[dict]:
+        """Outputs created in ``[since, until)`` (Unix seconds)."""
+        return self.find(since=since, until=until, **kwargs)
+
+    def stats(self) -> dict:
+        """Indexed outputs, distinct files and their total size (scans the index)."""
+        with self._connect() as conn:
+            rows, files, size = conn.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT digest), "
+                "COALESCE((SELECT SUM(size) FROM (SELECT MAX(size) AS size FROM outputs GROUP BY digest)), 0) "
+                "FROM outputs"
+            ).fetchone()
+        return {"outputs": rows, "files": files, "bytes": size}
+
+
+def _file_digest(path: str, preprocess: bool) -> str:
+    """Hash of an input image file, as recorded in the index (see outfit_cache.image_digest)."""
+    from outfit_cache import image_digest
+    from virtual_tryon import load_image
+    image = load_image(path)
+    if preprocess:
+        from image_preprocess import ImagePreprocessor
+        image = ImagePreprocessor().process(image)
+    return image_digest(image)
+
+
+def _timestamp(value: str) -> float:
+    return datetime.fromisoformat(value).timestamp()
+
+
+def main():
+    """Command-line entry point: print matching outputs as JSON lines."""
+    parser = argparse.ArgumentParser(description="Look up stored try-on outputs.")
+    parser.add_argument("--person", help="Person image file (matches chains started from it too)")
+    parser.add_argument("--garment", help="Garment image file")
+    parser.add_argument("--request-id", help="Request ID")
+    parser.add_argument("--since", type=_timestamp, help="Earliest creation time (ISO date/time)")
+    parser.add_argument("--until", type=_timestamp, help="Latest creation time (ISO date/time, exclusive)")
+    parser.add_argument("--limit", type=int, default=100, help="Maximum results (default: 100)")
+    parser.add_argument("--preprocess", action="store_true",
+                        help="Hash inputs after ImagePreprocessor, as the web apps send them")
+    parser.add_argument("--store", type=Path, default=None,
+                        help="Store directory (default: config.OUTPUT_STORE_DIR)")
+    args = parser.parse_args()
+
+    store = OutputStore(args.store)
+    for row in store.find(
+        source=_file_digest(args.person, args.preprocess) if args.person else None,
+        garment=_file_digest(args.garment, args.preprocess) if args.garment else None,
+        request_id=args.request_id,
+        since=args.since,
+        until=args.until,
+        limit=args.limit,
+    ):
+        print(json.dumps(row))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,459 @@
+"""
+Adaptive rate limiting for Vertex AI calls
+A token bucket caps requests per minute and an AIMD controller adapts the
+number of concurrent calls to how the service is coping. Queued calls are
+served by priority class, so interactive traffic goes ahead of batch work.
+"""
+
+import asyncio
+import contextvars
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Iterator, Optional
+
+import config
+import metrics
+
+
+# Priority classes, highest first
+PRIORITIES = ("interactive", "near_line", "bulk")
+
+_context_priority: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("vto_priority", default=None)
+_context_scope: contextvars.ContextVar[Optional["WaitScope"]] = contextvars.ContextVar("vto_wait_scope", default=None)
+
+# HTTP status codes that mean "slow down" rather than "this request is bad"
+OVERLOAD_STATUS_CODES = (429, 503)
+
+
+def is_overload_error(error: BaseException) -> bool:
+    """True if ``error`` is a quota (429) or unavailable (503) response."""
+    code = getattr(error, "code", None)
+    if callable(code):
+        # google.api_core exceptions expose the status as a method on some versions
+        code = None
+    if code is None:
+        code = getattr(error, "status_code", None)
+    return code in OVERLOAD_STATUS_CODES
+
+
+class DeadlineExceeded(TimeoutError):
+    """The request did not succeed before its deadline."""
+
+
+def _check_priority(name: str) -> str:
+    if name not in PRIORITIES:
+        raise ValueError(f"Unknown priority {name!r}; use {', '.join(PRIORITIES)}")
+    return name
+
+
+@contextmanager
+def priority(name: str) -> Iterator[None]:
+    """Make the block's upstream calls (in this thread or task) priority class ``name``.
+
+    Metrics recorded inside the block are tagged with ``priority`` too.
+    """
+    token = _context_priority.set(_check_priority(name))
+    try:
+        with metrics.labels(priority=name):
+            yield
+    finally:
+        _context_priority.reset(token)
+
+
+def current_priority(default: Optional[str] = None) -> str:
+    """The class set by priority(), else ``default``, else config.DEFAULT_PRIORITY."""
+    return _check_priority(_context_priority.get() or default or config.DEFAULT_PRIORITY)
+
+
+class WaitScope:
+    """Bounds how long one attempt waits for a slot and records when it got one.
+
+    Inside ``wait_scope(scope)``, acquire() gives up with DeadlineExceeded at
+    ``deadline`` (monotonic seconds) or as soon as cancel() is called, so an
+    abandoned attempt leaves the queue instead of later making a call whose
+    result nobody uses. ``granted_at`` is when the slot was granted, so
+    callers can time the upstream call without the queueing.
+    """
+
+    def __init__(self, deadline: Optional[float] = None):
+        self.deadline = deadline
+        self.granted_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._cancelled = False
+        self._waiters: set["_Waiter"] = set()
+
+    def cancel(self) -> None:
+        """Make a queued acquire() give up now (a granted slot is kept)."""
+        with self._lock:
+            self._cancelled = True
+            waiters = list(self._waiters)
+        for waiter in waiters:
+            waiter.wake()
+
+    def expired(self) -> bool:
+        """True once cancelled or past the deadline."""
+        return self._cancelled or (self.deadline is not None and time.monotonic() >= self.deadline)
+
+    def remaining(self) -> Optional[float]:
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    @contextmanager
+    def _watching(self, waiter: "_Waiter") -> Iterator[None]:
+        with self._lock:
+            self._waiters.add(waiter)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._waiters.discard(waiter)
+
+
+@contextmanager
+def wait_scope(scope: WaitScope) -> Iterator[WaitScope]:
+    """Apply ``scope`` to every slot acquired in the block (in this thread or task)."""
+    token = _context_scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _context_scope.reset(token)
+
+
+class _Waiter:
+    """A caller queued for a slot; either a thread or an asyncio task."""
+
+    __slots__ = ("event", "loop", "future", "granted", "priority", "queued_at")
+
+    def __init__(self, priority: str, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.priority = priority
+        self.queued_at = time.monotonic()
+        self.loop = loop
+        self.event = None if loop else threading.Event()
+        self.future = loop.create_future() if loop else None
+        self.granted = False
+
+    def wake(self) -> None:
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self) -> None:
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class AdaptiveLimiter:
+    """Token bucket plus AIMD concurrency limit, shared by threads and asyncio tasks.
+
+    Callers wait until both a token (requests per minute) and a concurrency
+    slot are free, in one FIFO queue per priority class. With the "strict"
+    policy the highest class with a waiting caller is always served first;
+    with "weighted" the waiting classes share grants in proportion to their
+    weights. A caller queued longer than ``max_wait`` seconds is served next
+    whatever its class, and bulk calls hold at most ``bulk_share`` of the
+    concurrency limit, so interactive calls find a slot quickly.
+
+    Every successful call raises the concurrency limit by ``1 / limit``
+    (about +1 per round of calls); a 429 or 503
+    multiplies it by ``decrease_factor``. Overload errors that arrive within
+    ``decrease_cooldown`` seconds of a cut are treated as part of the same
+    congestion event and do not cut again.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[float] = None,
+        initial_concurrency: Optional[float] = None,
+        min_concurrency: float = 1,
+        max_concurrency: Optional[float] = None,
+        decrease_factor: float = 0.5,
+        decrease_cooldown: float = 2.0,
+        policy: Optional[str] = None,
+        weights: Optional[dict] = None,
+        max_wait: Optional[float] = None,
+        bulk_share: Optional[float] = None
+    ):
+        """Create a limiter.
+
+        Args:
+            requests_per_minute: Token bucket rate (default: config.RATE_LIMIT_RPM)
+            initial_concurrency: Starting concurrency limit
+                (default: config.RATE_LIMIT_INITIAL_CONCURRENCY)
+            min_concurrency: Floor for the concurrency limit
+            max_concurrency: Ceiling for the concurrency limit
+                (default: config.MAX_CONCURRENT_REQUESTS)
+            decrease_factor: Multiplier applied to the limit on overload
+            decrease_cooldown: Seconds during which further overloads don't cut again
+            policy: "strict" or "weighted" (default: config.PRIORITY_POLICY)
+            weights: Share of grants per class under "weighted"
+                (default: config.PRIORITY_WEIGHTS)
+            max_wait: Queueing time after which a caller is served next
+                regardless of class; 0 disables (default: config.PRIORITY_MAX_WAIT_SECONDS)
+            bulk_share: Largest share of the concurrency limit bulk calls may
+                hold; 1 disables the cap (default: config.PRIORITY_BULK_SHARE)
+        """
+        self.requests_per_minute = requests_per_minute or config.RATE_LIMIT_RPM
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency or config.MAX_CONCURRENT_REQUESTS
+        self.decrease_factor = decrease_factor
+        self.decrease_cooldown = decrease_cooldown
+        self.policy = (policy or config.PRIORITY_POLICY).lower()
+        if self.policy not in ("strict", "weighted"):
+            raise ValueError(f"Unknown priority policy {self.policy!r}; use strict or weighted")
+        self.weights = {name: float((weights or config.PRIORITY_WEIGHTS).get(name, 1)) for name in PRIORITIES}
+        self.max_wait = config.PRIORITY_MAX_WAIT_SECONDS if max_wait is None else max_wait
+        self.bulk_share = config.PRIORITY_BULK_SHARE if bulk_share is None else bulk_share
+
+        self._limit = float(initial_concurrency or config.RATE_LIMIT_INITIAL_CONCURRENCY)
+        self._limit = min(max(self._limit, self.min_concurrency), self.max_concurrency)
+        # Allow short bursts of up to ~10 seconds' worth of requests
+        self._capacity = max(1.0, self.requests_per_minute / 6)
+        self._tokens = self._capacity
+        self._refilled_at = time.monotonic()
+        self._last_decrease = float("-inf")
+
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+        self._waiters: dict[str, "deque[_Waiter]"] = {name: deque() for name in PRIORITIES}
+        self._in_flight = 0
+        self._in_flight_by_class = dict.fromkeys(PRIORITIES, 0)
+        self._granted = dict.fromkeys(PRIORITIES, 0)
+        # Grants that went to an overdue caller ahead of a higher class
+        self._starvation_grants = 0
+        # Smooth weighted round-robin credit per class ("weighted" policy)
+        self._credit = dict.fromkeys(PRIORITIES, 0.0)
+        self._successes = 0
+        self._overloads = 0
+        # Callers that gave up waiting (deadline or cancellation)
+        self._abandoned = 0
+
+    # -- scheduling ---------------------------------------------------------
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._refilled_at
+        self._tokens = min(self._capacity, self._tokens + elapsed * self.requests_per_minute / 60)
+        self._refilled_at = now
+
+    def _may_start(self, name: str) -> bool:
+        """False while bulk calls hold their share of the limit; must hold the lock."""
+        if name != "bulk" or self.bulk_share >= 1:
+            return True
+        return self._in_flight_by_class[name] < max(1, int(self._limit * self.bulk_share))
+
+    def _choose(self, eligible: list[str], now: float) -> str:
+        """Class to serve next among those with an eligible waiter; must hold the lock."""
+        if self.max_wait:
+            overdue = [name for name in eligible if now - self._waiters[name][0].queued_at >= self.max_wait]
+            if overdue:
+                chosen = min(overdue, key=lambda name: self._waiters[name][0].queued_at)
+                if chosen != eligible[0]:
+                    self._starvation_grants += 1
+                return chosen
+        if self.policy == "strict" or len(eligible) == 1:
+            return eligible[0]
+        # Smooth weighted round-robin: every waiting class earns its weight and
+        # the one with the most credit is served and pays back the total, so
+        # grants interleave in proportion to the weights
+        total = 0.0
+        for name in eligible:
+            self._credit[name] += self.weights[name]
+            total += self.weights[name]
+        chosen = max(eligible, key=self._credit.__getitem__)
+        self._credit[chosen] -= total
+        return chosen
+
+    def _dispatch(self) -> None:
+        """Grant slots to queued callers by priority; must hold the lock."""
+        now = time.monotonic()
+        self._refill(now)
+        while self._in_flight < int(self._limit):
+            eligible = [name for name in PRIORITIES if self._waiters[name] and self._may_start(name)]
+            if not eligible:
+                return
+            if self._tokens < 1:
+                # Out of tokens: come back when the next one is due
+                self._arm_timer((1 - self._tokens) * 60 / self.requests_per_minute)
+                return
+            waiter = self._waiters[self._choose(eligible, now)].popleft()
+            self._tokens -= 1
+            self._in_flight += 1
+            self._in_flight_by_class[waiter.priority] += 1
+            self._granted[waiter.priority] += 1
+            waiter.granted = True
+            waiter.wake()
+
+    def _arm_timer(self, delay: float) -> None:
+        if self._timer is None:
+            self._timer = threading.Timer(delay, self._on_timer)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _on_timer(self) -> None:
+        with self._lock:
+            self._timer = None
+            self._dispatch()
+
+    @staticmethod
+    def _observe_wait(waiter: _Waiter) -> None:
+        # Recorded by the caller, so the wait carries its method and priority tags
+        metrics.registry.observe("quota_wait", time.monotonic() - waiter.queued_at, priority=waiter.priority)
+
+    def acquire(self, priority: Optional[str] = None) -> str:
+        """Block the calling thread until a slot is granted.
+
+        Inside a wait_scope(), gives up when the scope expires.
+
+        Args:
+            priority: Class to queue in (default: current_priority())
+
+        Returns:
+            The slot's class, to pass to release()
+
+        Raises:
+            DeadlineExceeded: The wait scope expired before a slot was granted
+        """
+        scope = _context_scope.get()
+        waiter = _Waiter(_check_priority(priority) if priority else current_priority())
+        with self._lock:
+            self._waiters[waiter.priority].append(waiter)
+            self._dispatch()
+        if scope is None:
+            waiter.event.wait()
+        else:
+            with scope._watching(waiter):
+                while not waiter.event.is_set() and not scope.expired():
+                    waiter.event.wait(scope.remaining())
+            if scope.expired() or not waiter.granted:
+                self._abandon(waiter)
+                raise DeadlineExceeded("gave up waiting for a rate limit slot")
+            scope.granted_at = time.monotonic()
+        self._observe_wait(waiter)
+        return waiter.priority
+
+    def _abandon(self, waiter: _Waiter) -> None:
+        """Take a caller that gave up out of the queue, or return the slot it just got."""
+        with self._lock:
+            if waiter.granted:
+                # Granted as the caller gave up: the call is never made
+                self._in_flight -= 1
+                self._in_flight_by_class[waiter.priority] -= 1
+                self._tokens = min(self._capacity, self._tokens + 1)
+            else:
+                self._waiters[waiter.priority].remove(waiter)
+            self._abandoned += 1
+            self._dispatch()
+
+    async def acquire_async(self, priority: Optional[str] = None) -> str:
+        """Wait (without blocking the event loop) until a slot is granted; see acquire()."""
+        waiter = _Waiter(
+            _check_priority(priority) if priority else current_priority(), asyncio.get_running_loop()
+        )
+        with self._lock:
+            self._waiters[waiter.priority].append(waiter)
+            self._dispatch()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter.granted:
+                    self._in_flight -= 1
+                    self._in_flight_by_class[waiter.priority] -= 1
+                    self._dispatch()
+                else:
+                    self._waiters[waiter.priority].remove(waiter)
+            raise
+        scope = _context_scope.get()
+        if scope is not None:
+            scope.granted_at = time.monotonic()
+        self._observe_wait(waiter)
+        return waiter.priority
+
+    def queued(self) -> int:
+        """Callers currently waiting for a slot."""
+        with self._lock:
+            return sum(len(waiters) for waiters in self._waiters.values())
+
+    def release(self, error: Optional[BaseException] = None, priority: Optional[str] = None) -> None:
+        """Return a slot and feed the call's outcome into the AIMD controller.
+
+        ``priority`` is the class acquire() returned (default: current_priority()).
+        """
+        with self._lock:
+            self._in_flight -= 1
+            self._in_flight_by_class[priority or current_priority()] -= 1
+            if error is None:
+                self._successes += 1
+                self._limit = min(self.max_concurrency, self._limit + 1 / self._limit)
+            elif is_overload_error(error):
+                self._overloads += 1
+                now = time.monotonic()
+                if now - self._last_decrease >= self.decrease_cooldown:
+                    self._limit = max(self.min_concurrency, self._limit * self.decrease_factor)
+                    self._last_decrease = now
+            self._dispatch()
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        """``with limiter.slot(): ...`` around one upstream call."""
+        granted = self.acquire()
+        try:
+            yield
+        except BaseException as e:
+            self.release(e, granted)
+            raise
+        self.release(priority=granted)
+
+    @asynccontextmanager
+    async def aslot(self) -> AsyncIterator[None]:
+        """``async with limiter.aslot(): ...`` around one upstream call."""
+        granted = await self.acquire_async()
+        try:
+            yield
+        except BaseException as e:
+            self.release(e, granted)
+            raise
+        self.release(priority=granted)
+
+    # -- observability ------------------------------------------------------
+
+    def snapshot(self) -> dict:
+        """Current limits, queue depth and outcome counters, in total and per class."""
+        with self._lock:
+            self._refill(time.monotonic())
+            snapshot = {
+                "requests_per_minute": self.requests_per_minute,
+                "concurrency_limit": round(self._limit, 2),
+                "in_flight": self._in_flight,
+                "queue_depth": sum(len(waiters) for waiters in self._waiters.values()),
+                "tokens": round(self._tokens, 2),
+                "successes": self._successes,
+                "overloads": self._overloads,
+                "abandoned": self._abandoned,
+                "policy": self.policy,
+                "starvation_grants": self._starvation_grants,
+            }
+            for name in PRIORITIES:
+                snapshot[f"queue_depth_{name}"] = len(self._waiters[name])
+                snapshot[f"in_flight_{name}"] = self._in_flight_by_class[name]
+                snapshot[f"granted_{name}"] = self._granted[name]
+            return snapshot
+
+
+_default_limiters: dict = {}
+_default_lock = threading.Lock()
+
+
+def default_limiter(name: str = "default") -> AdaptiveLimiter:
+    """Process-wide limiter shared by every VirtualTryOn that doesn't get its own.
+
+    Separate quotas (e.g. one per project and region) get separate limiters by
+    passing a ``name``.
+    """
+    with _default_lock:
+        if name not in _default_limiters:
+            _default_limiters[name] = AdaptiveLimiter()
+        return _default_limiters[name]
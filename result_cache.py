@@ -0,0 +1,239 @@
+"""
+Content-addressed result cache for Virtual Try-On
+Stores generated images on disk, keyed by a hash of everything that determines the request.
+"""
+
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+
+import config
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    mime_type TEXT,
+    image_count INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed);
+"""
+
+
+def make_key(
+    person_bytes: bytes,
+    garment_bytes: bytes,
+    model: str,
+    safety_filter_level: str,
+    number_of_images: int,
+) -> str:
+    """Build the cache key for a single try-on request.
+
+    Every part is length-prefixed so that no two different requests can
+    produce the same byte stream.
+    """
+    digest = hashlib.sha256()
+    for part in (
+        person_bytes,
+        garment_bytes,
+        model.encode(),
+        safety_filter_level.encode(),
+        str(number_of_images).encode(),
+    ):
+        digest.update(len(part).to_bytes(8, "big"))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """On-disk LRU cache of generated try-on images.
+
+    Image payloads live as individual files under ``cache_dir`` and an
+    SQLite index tracks their size, age and last access. SQLite's file
+    locking makes the index safe to share between processes; payload files
+    are written to a temporary name and renamed into place, so readers never
+    see a partial file.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Optional[Path] = None,
+        max_bytes: Optional[int] = None,
+        max_age_seconds: Optional[float] = None,
+    ):
+        """Open (or create) a result cache.
+
+        Args:
+            cache_dir: Directory for payloads and the index (default: config.RESULT_CACHE_DIR)
+            max_bytes: Total payload size above which least recently used entries are evicted
+            max_age_seconds: Entries older than this are treated as missing and evicted
+        """
+        self.cache_dir = Path(cache_dir or config.RESULT_CACHE_DIR)
+        self.max_bytes = config.RESULT_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self.max_age_seconds = (
+            config.RESULT_CACHE_MAX_AGE_SECONDS if max_age_seconds is None else max_age_seconds
+        )
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._index_path = self.cache_dir / "index.sqlite3"
+
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # A short-lived connection per operation keeps the cache safe to use
+        # from any thread and across fork().
+        conn = sqlite3.connect(str(self._index_path), timeout=30, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _payload_path(self, key: str, idx: int) -> Path:
+        return self.cache_dir / key[:2] / f"{key}_{idx}"
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def get(self, key: str) -> Optional[tuple[list[bytes], Optional[str]]]:
+        """Look up a cached result.
+
+        Returns:
+            ``(image_bytes_list, mime_type)`` on a hit, otherwise None
+        """
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT mime_type, image_count, created FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self._count("misses")
+                return None
+
+            mime_type, image_count, created = row
+            if self.max_age_seconds and now - created > self.max_age_seconds:
+                self._delete(conn, key, image_count)
+                self._count("misses")
+                return None
+
+            try:
+                images = [
+                    self._payload_path(key, idx).read_bytes() for idx in range(image_count)
+                ]
+            except FileNotFoundError:
+                # Payload removed behind our back (e.g. by another process' eviction)
+                self._delete(conn, key, image_count)
+                self._count("misses")
+                return None
+
+            conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+
+        self._count("hits")
+        return images, mime_type
+
+    def put(self, key: str, images: list[bytes], mime_type: Optional[str] = None) -> None:
+        """Store a result and evict old entries if the cache is over budget."""
+        if not images:
+            return
+
+        for idx, data in enumerate(images):
+            path = self._payload_path(key, idx)
+            path.parent.mkdir(exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".tmp_")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except BaseException:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+                raise
+
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries "
+                "(key, mime_type, image_count, size, created, accessed) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, mime_type, len(images), sum(len(d) for d in images), now, now),
+            )
+            self._evict(conn, now)
+
+    def _delete(self, conn: sqlite3.Connection, key: str, image_count: int) -> None:
+        conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+        for idx in range(image_count):
+            try:
+                os.remove(self._payload_path(key, idx))
+            except OSError:
+                pass
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            victims = []
+            if self.max_age_seconds:
+                victims.extend(conn.execute(
+                    "SELECT key, image_count FROM entries WHERE created < ?",
+                    (now - self.max_age_seconds,),
+                ).fetchall())
+
+            if self.max_bytes:
+                total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+                if total > self.max_bytes:
+                    for key, image_count, size in conn.execute(
+                        "SELECT key, image_count, size FROM entries ORDER BY accessed"
+                    ).fetchall():
+                        if total <= self.max_bytes:
+                            break
+                        victims.append((key, image_count))
+                        total -= size
+
+            for key, image_count in dict(victims).items():
+                self._delete(conn, key, image_count)
+                self._count("evictions")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def clear(self) -> None:
+        """Remove every cached entry."""
+        with self._connect() as conn:
+            for key, image_count in conn.execute(
+                "SELECT key, image_count FROM entries"
+            ).fetchall():
+                self._delete(conn, key, image_count)
+
+    def stats(self) -> dict:
+        """Hit/miss counters for this process plus the shared on-disk totals."""
+        with self._connect() as conn:
+            entries, size = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": entries,
+                "bytes": size,
+            }
@@ -0,0 +1,166 @@
+"""
+Two-tier result delivery for the Virtual Try-On web UI
+Each generated image is stored once as a small preview, sent to the browser
+straight away, and as the full-resolution original, fetched only on demand.
+"""
+
+import hashlib
+import io
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+from PIL import Image as PIL_Image
+from PIL import features as PIL_features
+
+import config
+import metrics
+
+
+class Tiers(NamedTuple):
+    """Files serving one generated image."""
+
+    digest: str
+    preview: str
+    full: str
+
+
+class ResultTiers:
+    """Content-addressed preview and full-resolution files for generated images.
+
+    The full-resolution tier is the API's encoded image, written byte for byte,
+    so it is never re-encoded; the preview is decoded in JPEG draft mode,
+    shrunk to ``preview_edge`` and encoded once. Both are keyed by the hash
+    of the image, so a result shown again (e.g. from the result cache) reuses
+    its files. Least recently used pairs are deleted once the directory holds
+    more than ``max_bytes``.
+    """
+
+    def __init__(
+        self,
+        directory: Optional[Path] = None,
+        preview_edge: Optional[int] = None,
+        preview_quality: Optional[int] = None,
+        max_bytes: Optional[int] = None
+    ):
+        """Create (or reopen) a tier store.
+
+        Args:
+            directory: Where the files live (default: config.RESULT_TIERS_DIR)
+            preview_edge: Longest preview edge in pixels (default: config.PREVIEW_MAX_EDGE)
+            preview_quality: Preview encoder quality (default: config.PREVIEW_QUALITY)
+            max_bytes: Total size above which old pairs are deleted
+                (default: config.RESULT_TIERS_MAX_BYTES)
+        """
+        self.directory = Path(directory or config.RESULT_TIERS_DIR)
+        self.preview_edge = preview_edge or config.PREVIEW_MAX_EDGE
+        self.preview_quality = preview_quality or config.PREVIEW_QUALITY
+        self.max_bytes = config.RESULT_TIERS_MAX_BYTES if max_bytes is None else max_bytes
+        # WebP previews are smaller; fall back to JPEG on Pillow builds without it
+        webp = config.PREVIEW_FORMAT.lower() == "webp" and PIL_features.check("webp")
+        self._preview_format, self._preview_suffix = ("WEBP", ".webp") if webp else ("JPEG", ".jpeg")
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        # digest -> (preview path, full path, bytes), least recently used first
+        self._entries: OrderedDict[str, tuple[str, str, int]] = OrderedDict()
+        self._bytes = 0
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+        self._load()
+
+    def _load(self) -> None:
+        """Index pairs left by a previous run, oldest first."""
+        previews = sorted(
+            self.directory.glob(f"*_preview{self._preview_suffix}"), key=lambda p: p.stat().st_mtime
+        )
+        for preview in previews:
+            digest = preview.name.split("_", 1)[0]
+            full = next(self.directory.glob(f"{digest}.*"), None)
+            if full is None:
+                continue
+            size = preview.stat().st_size + full.stat().st_size
+            self._entries[digest] = (str(preview), str(full), size)
+            self._bytes += size
+
+    def add(self, image_bytes: bytes, mime_type: Optional[str] = None) -> Tiers:
+        """Store both tiers of one encoded image (once) and return their paths."""
+        digest = hashlib.sha256(image_bytes).hexdigest()[:32]
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                self._entries.move_to_end(digest)
+                self._stats["hits"] += 1
+                return Tiers(digest, entry[0], entry[1])
+            self._stats["misses"] += 1
+
+        # Two threads adding the same image write identical files; the rename makes that harmless
+        start = time.perf_counter()
+        suffix = ".png" if mime_type == "image/png" else ".jpeg"
+        full = self.directory / f"{digest}{suffix}"
+        preview = self.directory / f"{digest}_preview{self._preview_suffix}"
+        self._write(full, image_bytes)
+        preview_bytes = self._encode_preview(image_bytes)
+        self._write(preview, preview_bytes)
+        metrics.registry.observe("preview", time.perf_counter() - start)
+
+        size = len(image_bytes) + len(preview_bytes)
+        with self._lock:
+            if digest not in self._entries:
+                self._entries[digest] = (str(preview), str(full), size)
+                self._bytes += size
+            victims = self._evict()
+        for victim in victims:
+            for path in victim:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        return Tiers(digest, str(preview), str(full))
+
+    def full(self, digest: str) -> Optional[str]:
+        """Full-resolution path of a stored image, or None if it was evicted."""
+        with self._lock:
+            entry = self._entries.get(digest)
+            return entry[1] if entry else None
+
+    def _encode_preview(self, image_bytes: bytes) -> bytes:
+        with PIL_Image.open(io.BytesIO(image_bytes)) as img:
+            # JPEG draft mode decodes at a reduced scale, skipping most of the work
+            img.draft("RGB", (self.preview_edge, self.preview_edge))
+            img = img.convert("RGB")
+            img.thumbnail((self.preview_edge, self.preview_edge), PIL_Image.Resampling.LANCZOS)
+            buffer = io.BytesIO()
+            img.save(buffer, format=self._preview_format, quality=self.preview_quality)
+        return buffer.getvalue()
+
+    def _write(self, path: Path, data: bytes) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".tmp_")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def _evict(self) -> list[tuple[str, str]]:
+        """Drop least recently used pairs over budget; returns their paths (call with the lock)."""
+        victims = []
+        while self.max_bytes and self._bytes > self.max_bytes and len(self._entries) > 1:
+            _, (preview, full, size) = self._entries.popitem(last=False)
+            self._bytes -= size
+            self._stats["evictions"] += 1
+            victims.append((preview, full))
+        return victims
+
+    def stats(self) -> dict:
+        """Hit/miss/eviction counters plus the stored pairs and bytes."""
+        with self._lock:
+            return {**self._stats, "entries": len(self._entries), "bytes": self._bytes}
@@ -0,0 +1,317 @@
+"""
+Retries and hedged requests for Vertex AI calls
+Retries transient failures with decorrelated-jitter backoff inside a
+per-request deadline, and optionally hedges slow calls with a second copy.
+"""
+
+import asyncio
+import contextvars
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional, TypeVar
+
+import httpx
+
+import config
+from rate_limiter import OVERLOAD_STATUS_CODES, DeadlineExceeded, WaitScope, wait_scope
+
+
+T = TypeVar("T")
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """How often and how patiently to retry one class of error."""
+
+    max_attempts: int
+    base_delay: float
+    max_delay: float
+
+
+# Error classes and their default policies. Quota errors back off the longest
+# so the rate limiter has time to adapt; anything unclassified is not retried.
+DEFAULT_RETRY_POLICIES = {
+    "overload": RetryPolicy(max_attempts=5, base_delay=1.0, max_delay=30.0),
+    "server": RetryPolicy(max_attempts=3, base_delay=0.5, max_delay=10.0),
+    "network": RetryPolicy(max_attempts=3, base_delay=0.25, max_delay=5.0),
+}
+
+
+def classify_error(error: BaseException) -> Optional[str]:
+    """Map an exception to a retry class ("overload", "server", "network") or None."""
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        if code in OVERLOAD_STATUS_CODES:
+            return "overload"
+        if code >= 500:
+            return "server"
+        return None
+    if isinstance(error, (httpx.TransportError, ConnectionError, TimeoutError)):
+        return "network"
+    return None
+
+
+@dataclass
+class HedgePolicy:
+    """When to fire a second copy of a slow request.
+
+    A hedge is sent once the primary has been running longer than the
+    ``percentile`` of recent latencies (never sooner than ``min_delay``).
+    Every primary request earns ``budget_ratio`` hedge tokens, so at most
+    that fraction of requests is ever duplicated.
+    """
+
+    percentile: float = 0.95
+    min_delay: float = 2.0
+    budget_ratio: float = 0.1
+    min_samples: int = 20
+    window: int = 200
+
+
+class _LatencyTracker:
+    """Sliding window of successful attempt latencies."""
+
+    def __init__(self, window: int):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q: float, min_samples: int) -> Optional[float]:
+        with self._lock:
+            if len(self._samples) < min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Retrier:
+    """Runs upstream calls with retries, a deadline and optional hedging."""
+
+    def __init__(
+        self,
+        policies: Optional[dict] = None,
+        deadline: Optional[float] = None,
+        hedge: Optional[HedgePolicy] = None,
+        busy: Optional[Callable[[], bool]] = None
+    ):
+        """Create a retrier.
+
+        Args:
+            policies: Retry policy per error class (default: DEFAULT_RETRY_POLICIES)
+            deadline: Seconds a request may take across all attempts
+                (default: config.REQUEST_DEADLINE_SECONDS)
+            hedge: Hedging policy; None disables hedging
+            busy: Returns True while the rate limiter has callers waiting;
+                no hedges are sent then, since a hedge would only queue for
+                a slot behind them (e.g. ClientPool.busy)
+        """
+        self.policies = dict(DEFAULT_RETRY_POLICIES if policies is None else policies)
+        self.deadline = deadline or config.REQUEST_DEADLINE_SECONDS
+        self.hedge = hedge
+        self.busy = busy
+
+        self._latencies = _LatencyTracker(hedge.window if hedge else 200)
+        self._lock = threading.Lock()
+        self._hedge_tokens = 0.0
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._stats = {"calls": 0, "retries": 0, "hedges": 0, "hedge_wins": 0, "deadline_exceeded": 0}
+
+    # -- bookkeeping --------------------------------------------------------
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def _hedge_delay(self) -> Optional[float]:
+        """Delay before hedging this request, or None if it should not be hedged."""
+        if self.hedge is None:
+            return None
+        with self._lock:
+            self._hedge_tokens = min(10.0, self._hedge_tokens + self.hedge.budget_ratio)
+        p = self._latencies.percentile(self.hedge.percentile, self.hedge.min_samples)
+        if p is None:
+            return None
+        return max(self.hedge.min_delay, p)
+
+    def _spend_hedge_token(self) -> bool:
+        if self.busy is not None and self.busy():
+            return False
+        with self._lock:
+            if self._hedge_tokens < 1:
+                return False
+            self._hedge_tokens -= 1
+            self._stats["hedges"] += 1
+            return True
+
+    def _next_delay(self, error: BaseException, attempt: int, previous: float, remaining: float):
+        """Backoff before the next attempt, or None if ``error`` should be raised."""
+        policy = self.policies.get(classify_error(error))
+        if policy is None or attempt >= policy.max_attempts:
+            return None
+        # Decorrelated jitter: random between the base and 3x the previous sleep
+        delay = min(policy.max_delay, random.uniform(policy.base_delay, max(policy.base_delay, previous * 3)))
+        if delay >= remaining:
+            return None
+        return delay
+
+    def _timed(self, fn: Callable[[], T], scope: WaitScope) -> T:
+        start = time.monotonic()
+        with wait_scope(scope):
+            result = fn()
+        # Hedge delays follow upstream latency only: time spent queueing for a
+        # rate limit slot says nothing about how slow the service is
+        self._latencies.add(time.monotonic() - (scope.granted_at or start))
+        return result
+
+    def stats(self) -> dict:
+        """Counters for calls, retries, hedges and deadline failures."""
+        with self._lock:
+            return dict(self._stats)
+
+    # -- synchronous --------------------------------------------------------
+
+    def call(self, fn: Callable[[], T]) -> T:
+        """Run ``fn`` until it succeeds, a non-retryable error occurs or the deadline passes."""
+        self._count("calls")
+        deadline_at = time.monotonic() + self.deadline
+        attempt = 0
+        delay = 0.0
+        while True:
+            attempt += 1
+            try:
+                return self._attempt(fn, deadline_at)
+            except DeadlineExceeded:
+                self._count("deadline_exceeded")
+                raise
+            except Exception as e:
+                delay = self._next_delay(e, attempt, delay, deadline_at - time.monotonic())
+                if delay is None:
+                    raise
+                self._count("retries")
+                print(f"  Retrying after {type(e).__name__} (attempt {attempt + 1}, waiting {delay:.1f}s)")
+                time.sleep(delay)
+
+    def _attempt(self, fn: Callable[[], T], deadline_at: float) -> T:
+        hedge_delay = self._hedge_delay()
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    # Room for a primary and a hedge per concurrent request, plus
+                    # calls abandoned at their deadline that are still running
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=4 * config.MAX_CONCURRENT_REQUESTS,
+                        thread_name_prefix="vto-call",
+                    )
+
+        # Every attempt runs in the pool, hedged or not, so a hung call can't
+        # outlive the deadline. The caller's context is copied so metric labels
+        # and the priority class follow the call into the pool.
+        scopes = []
+
+        def submit():
+            scope = WaitScope(deadline_at)
+            scopes.append(scope)
+            return self._executor.submit(contextvars.copy_context().run, self._timed, fn, scope)
+
+        try:
+            primary = submit()
+            pending = {primary}
+            remaining = deadline_at - time.monotonic()
+            first_wait = remaining if hedge_delay is None else min(hedge_delay, remaining)
+            done, pending = wait(pending, timeout=max(0.0, first_wait))
+            hedge = not done and hedge_delay is not None and deadline_at - time.monotonic() > 0
+            if hedge and self._spend_hedge_token():
+                pending.add(submit())
+
+            error = None
+            while True:
+                for future in done:
+                    if future.exception() is None:
+                        if future is not primary:
+                            self._count("hedge_wins")
+                        # The slower copy finishes in the background; its result is dropped
+                        return future.result()
+                    error = future.exception()
+                if not pending:
+                    raise error
+                remaining = deadline_at - time.monotonic()
+                if remaining <= 0:
+                    raise DeadlineExceeded(f"no response within {self.deadline:g}s")
+                done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+        finally:
+            # Copies still queued for a slot give up instead of making a call
+            # nobody waits for; threads already upstream can't be interrupted
+            # and finish in the background
+            for scope in scopes:
+                scope.cancel()
+
+    # -- asyncio ------------------------------------------------------------
+
+    async def call_async(self, fn: Callable[[], Awaitable[T]]) -> T:
+        """Async version of call(); ``fn`` returns a fresh awaitable per attempt."""
+        self._count("calls")
+        deadline_at = time.monotonic() + self.deadline
+        attempt = 0
+        delay = 0.0
+        while True:
+            attempt += 1
+            try:
+                return await self._attempt_async(fn, deadline_at)
+            except DeadlineExceeded:
+                self._count("deadline_exceeded")
+                raise
+            except Exception as e:
+                delay = self._next_delay(e, attempt, delay, deadline_at - time.monotonic())
+                if delay is None:
+                    raise
+                self._count("retries")
+                await asyncio.sleep(delay)
+
+    async def _timed_async(self, fn: Callable[[], Awaitable[T]]) -> T:
+        # Losing and timed-out copies are cancelled, which also takes them out
+        # of the limiter's queue; the scope only records when the slot came
+        scope = WaitScope()
+        start = time.monotonic()
+        with wait_scope(scope):
+            result = await fn()
+        self._latencies.add(time.monotonic() - (scope.granted_at or start))
+        return result
+
+    async def _attempt_async(self, fn: Callable[[], Awaitable[T]], deadline_at: float) -> T:
+        remaining = deadline_at - time.monotonic()
+        hedge_delay = self._hedge_delay()
+        primary = asyncio.ensure_future(self._timed_async(fn))
+        pending = {primary}
+        try:
+            first_wait = remaining if hedge_delay is None else min(hedge_delay, remaining)
+            done, pending = await asyncio.wait(pending, timeout=first_wait)
+            if not done and hedge_delay is not None and self._spend_hedge_token():
+                pending.add(asyncio.ensure_future(self._timed_async(fn)))
+
+            error = None
+            while True:
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self._count("hedge_wins")
+                        return task.result()
+                    error = task.exception()
+                if not pending:
+                    raise error
+                remaining = deadline_at - time.monotonic()
+                if remaining <= 0:
+                    raise DeadlineExceeded(f"no response within {self.deadline:g}s")
+                done, pending = await asyncio.wait(
+                    pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED
+                )
+        finally:
+            # Unlike threads, losing or timed-out coroutines can be cancelled
+            for task in pending:
+                task.cancel()
@@ -0,0 +1,119 @@
+"""
+Per-session input payload cache for the Virtual Try-On web UI
+A shopper uploads one photo and tries on many garments; the normalized,
+encoded person image is built once per session and reused for every click.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from google.genai.types import Image
+from PIL import Image as PIL_Image
+
+import config
+
+
+def pixel_digest(img: PIL_Image.Image) -> str:
+    """Content hash of a decoded image (size, mode and pixels).
+
+    Gradio hands uploads to the handlers as new PIL images on every click,
+    so the pixels are the only stable identity of a photo.
+    """
+    digest = hashlib.sha256(f"{img.size}|{img.mode}|".encode())
+    digest.update(img.tobytes())
+    return digest.hexdigest()
+
+
+class SessionPayloadCache:
+    """LRU of prepared input payloads, per session, with a global byte budget.
+
+    Each session keeps at most ``per_session`` payloads; across all sessions
+    the least recently used payloads are dropped once their encoded size
+    exceeds ``max_bytes``. Call ``drop()`` when a session ends.
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None, per_session: Optional[int] = None):
+        """Create a cache.
+
+        Args:
+            max_bytes: Total encoded payload size kept (default: config.SESSION_CACHE_MAX_BYTES)
+            per_session: Payloads kept per session (default: config.SESSION_CACHE_PER_SESSION)
+        """
+        self.max_bytes = max_bytes or config.SESSION_CACHE_MAX_BYTES
+        self.per_session = per_session or config.SESSION_CACHE_PER_SESSION
+        # (session, digest) -> payload, least recently used first
+        self._entries: "OrderedDict[tuple[str, str], Image]" = OrderedDict()
+        self._per_session: dict[str, int] = {}
+        self._size = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    @staticmethod
+    def _entry_size(image: Image) -> int:
+        return len(image.image_bytes or b"")
+
+    def get_or_prepare(
+        self,
+        session: str,
+        img: PIL_Image.Image,
+        prepare: Callable[[PIL_Image.Image], Image]
+    ) -> Image:
+        """The session's payload for ``img``, calling ``prepare(img)`` on a miss.
+
+        Two concurrent clicks with a new image may both prepare it; the
+        results are identical and only one is kept.
+        """
+        key = (session, pixel_digest(img))
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is not None:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return payload
+            self._stats["misses"] += 1
+
+        payload = prepare(img)
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = payload
+                self._size += self._entry_size(payload)
+                self._per_session[session] = self._per_session.get(session, 0) + 1
+                self._evict(session)
+        return payload
+
+    def _remove(self, key: tuple[str, str]) -> None:
+        payload = self._entries.pop(key)
+        self._size -= self._entry_size(payload)
+        remaining = self._per_session[key[0]] - 1
+        if remaining:
+            self._per_session[key[0]] = remaining
+        else:
+            del self._per_session[key[0]]
+
+    def _evict(self, session: str) -> None:
+        """Enforce the per-session and global limits (call with the lock held)."""
+        if self._per_session.get(session, 0) > self.per_session:
+            oldest = next(key for key in self._entries if key[0] == session)
+            self._remove(oldest)
+            self._stats["evictions"] += 1
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            self._remove(next(iter(self._entries)))
+            self._stats["evictions"] += 1
+
+    def drop(self, session: str) -> None:
+        """Forget every payload of a session (e.g. when its tab closes)."""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == session]:
+                self._remove(key)
+
+    def stats(self) -> dict:
+        """Hit/miss/eviction counters plus the held payloads, bytes and sessions."""
+        with self._lock:
+            return {
+                **self._stats,
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "sessions": len(self._per_session),
+            }
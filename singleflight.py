@@ -0,0 +1,88 @@
+"""
+Single-flight request coalescing
+Concurrent callers asking for the same key share one upstream call instead of
+each making their own. Works across threads and asyncio tasks alike.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Awaitable, Callable, Hashable, TypeVar
+
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Deduplicates in-flight calls by key.
+
+    The first caller for a key (the leader) runs the call; anyone asking for
+    the same key before it finishes waits for and shares the leader's result
+    or exception. Once the call completes the key is forgotten, so later
+    callers start a fresh call (or, typically, hit a cache the leader filled).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict[Hashable, Future] = {}
+        self._stats = {"calls": 0, "coalesced": 0}
+
+    def _join(self, key: Hashable) -> tuple[Future, bool]:
+        """Return the future for ``key`` and whether the caller leads the call."""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self._stats["coalesced"] += 1
+                return future, False
+            future = Future()
+            # A running future can't be cancelled, so one impatient waiter
+            # can't cancel the result for everyone else
+            future.set_running_or_notify_cancel()
+            self._calls[key] = future
+            self._stats["calls"] += 1
+            return future, True
+
+    def _finish(self, key: Hashable, future: Future, result=None, error=None) -> None:
+        with self._lock:
+            del self._calls[key]
+        if error is None:
+            future.set_result(result)
+        else:
+            future.set_exception(error)
+
+    def do(self, key: Hashable, fn: Callable[[], T]) -> T:
+        """Run ``fn`` unless a call for ``key`` is already in flight; share its result."""
+        future, leader = self._join(key)
+        if not leader:
+            return future.result()
+        try:
+            result = fn()
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result=result)
+        return result
+
+    async def do_async(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """Async version of do(); ``fn`` returns the awaitable to run if leading."""
+        future, leader = self._join(key)
+        if not leader:
+            return await asyncio.wrap_future(future)
+
+        async def lead():
+            try:
+                result = await fn()
+            except BaseException as e:
+                self._finish(key, future, error=e)
+                raise
+            self._finish(key, future, result=result)
+            return result
+
+        # Shielded so that cancelling the leading task doesn't cancel the
+        # call the other waiters depend on
+        return await asyncio.shield(asyncio.ensure_future(lead()))
+
+    def stats(self) -> dict:
+        """Upstream calls made, callers coalesced onto them and calls in flight."""
+        with self._lock:
+            return {**self._stats, "in_flight": len(self._calls)}
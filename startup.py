@@ -0,0 +1,137 @@
+"""
+Startup helpers for the Virtual Try-On web apps
+Background initialization of slow dependencies, startup phase timings, and an
+import-time profile to see where a cold start goes.
+
+Usage:
+    python startup.py app_deploy --top 15
+"""
+
+import argparse
+import re
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Callable, Generic, Optional, TypeVar
+
+T = TypeVar("T")
+
+# Taken when this module is first imported; the apps import it before anything else
+STARTED = time.monotonic()
+
+_phases: dict[str, float] = {}
+_phases_lock = threading.Lock()
+
+
+def mark(phase: str) -> float:
+    """Record that ``phase`` is done and return the seconds since startup."""
+    elapsed = time.monotonic() - STARTED
+    with _phases_lock:
+        _phases[phase] = elapsed
+    print(f"⏱️  {phase}: {elapsed:.2f}s after start")
+    return elapsed
+
+
+def phases() -> dict:
+    """Seconds from startup to each recorded phase (exported as metrics)."""
+    with _phases_lock:
+        return {phase: round(elapsed, 3) for phase, elapsed in _phases.items()}
+
+
+class LazyInit(Generic[T]):
+    """A value built once, optionally on a background thread.
+
+    ``start()`` kicks off the build and returns immediately; ``get()`` waits
+    for it (starting it if nobody has) and re-raises the build's error.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], T]):
+        self.name = name
+        self._factory = factory
+        self._future: Future = Future()
+        self._started = False
+        self._lock = threading.Lock()
+
+    def start(self) -> "LazyInit[T]":
+        """Begin building in a daemon thread (no-op if already started)."""
+        with self._lock:
+            if self._started:
+                return self
+            self._started = True
+        threading.Thread(target=self._run, name=f"vto-init-{self.name}", daemon=True).start()
+        return self
+
+    def _run(self) -> None:
+        try:
+            value = self._factory()
+        except BaseException as e:
+            mark(f"{self.name}_failed")
+            self._future.set_exception(e)
+        else:
+            mark(f"{self.name}_ready")
+            self._future.set_result(value)
+
+    def get(self, timeout: Optional[float] = None) -> T:
+        """Wait for the value and return it."""
+        self.start()
+        return self._future.result(timeout)
+
+    def done(self) -> bool:
+        """True once the build has finished, successfully or not."""
+        return self._future.done()
+
+
+# "import time: <self us> | <cumulative us> | <indent><module>"
+_IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+
+
+def import_profile(module: str) -> dict:
+    """Import ``module`` in a fresh interpreter under ``-X importtime``.
+
+    Returns the total import time of ``module`` and the self time of every
+    imported module summed per top-level package, both in seconds. Importing
+    an app module also builds its UI, which is counted in the total.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=Path(__file__).parent, capture_output=True, text=True,
+    )
+    total = None
+    packages: dict[str, float] = {}
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0.0) + int(self_us) / 1e6
+        if name == module and not indent:
+            total = int(cumulative_us) / 1e6
+    if result.returncode != 0 or total is None:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+    return {
+        "module": module,
+        "total": total,
+        "packages": dict(sorted(packages.items(), key=lambda item: item[1], reverse=True)),
+    }
+
+
+def main():
+    """Command-line entry point: print an import-time profile."""
+    parser = argparse.ArgumentParser(description="Show where import time goes for a module.")
+    parser.add_argument("module", nargs="?", default="app", help="Module to import (default: app)")
+    parser.add_argument("--top", type=int, default=15, help="Packages to list (default: 15)")
+    args = parser.parse_args()
+
+    profile = import_profile(args.module)
+    print(f"import {profile['module']}: {profile['total']:.2f}s")
+    for package, seconds in list(profile["packages"].items())[:args.top]:
+        share = seconds / profile["total"] * 100 if profile["total"] else 0
+        print(f"  {package:<30} {seconds:6.2f}s  {share:5.1f}%")
+
+
+if __name__ == "__main__":
+    main()
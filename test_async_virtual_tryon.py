@@ -0,0 +1,51 @@
+"""
+Tests for async_virtual_tryon.AsyncVirtualTryOn
+"""
+
+import asyncio
+
+from backends import FakeBackend
+from async_virtual_tryon import AsyncVirtualTryOn
+
+
+def test_concurrent_requests_are_bounded(make_vto, make_jpeg):
+    backend = FakeBackend(latency_median=0.05, latency_sigma=0.1, error_rate=0, quota_rpm=0)
+    client = AsyncVirtualTryOn(vto=make_vto(backend=backend), max_concurrency=2)
+    person = make_jpeg((10, 10, 10))
+    garments = [make_jpeg((40 * i, 0, 0)) for i in range(6)]
+
+    async def run():
+        return await asyncio.gather(*(
+            client.try_on_single_item(person, garment, return_type="bytes") for garment in garments
+        ))
+
+    results = asyncio.run(run())
+    assert [len(images) for images in results] == [1] * 6
+    assert len({images[0] for images in results}) == 6
+    stats = backend.stats()
+    assert stats["calls"] == 6
+    assert stats["peak_in_flight"] == 2
+
+
+def test_identical_requests_share_one_call(make_vto, make_jpeg, fake_backend):
+    client = AsyncVirtualTryOn(vto=make_vto(), max_concurrency=4)
+    person, garment = make_jpeg((10, 10, 10)), make_jpeg((90, 0, 0))
+
+    async def run():
+        return await asyncio.gather(*(
+            client.try_on_single_item(person, garment, return_type="bytes") for _ in range(3)
+        ))
+
+    results = asyncio.run(run())
+    assert results[0] == results[1] == results[2]
+    assert fake_backend.stats()["calls"] == 1
+
+
+def test_multiple_items_chain_in_order(make_vto, make_jpeg, fake_backend):
+    client = AsyncVirtualTryOn(vto=make_vto())
+    garments = [make_jpeg((0, 80, 0)), make_jpeg((0, 0, 80))]
+
+    outputs = asyncio.run(client.try_on_multiple_items(make_jpeg(), garments, return_type="pil"))
+    assert len(outputs) == 2
+    assert all(image.size == fake_backend.image_size for image in outputs)
+    assert fake_backend.stats()["calls"] == 2
@@ -0,0 +1,100 @@
+"""
+Tests for backends.FakeBackend
+"""
+
+import asyncio
+
+import pytest
+from google.genai import errors
+from google.genai.types import (
+    Image,
+    ProductImage,
+    RecontextImageConfig,
+    RecontextImageSource,
+)
+
+import config
+from backends import FakeBackend
+from virtual_tryon import VirtualTryOn
+
+
+def _request(person: bytes = b"person", garment: bytes = b"garment", count: int = 1) -> dict:
+    return dict(
+        model="virtual-try-on",
+        source=RecontextImageSource(
+            person_image=Image(image_bytes=person, mime_type="image/jpeg"),
+            product_images=[ProductImage(product_image=Image(image_bytes=garment, mime_type="image/jpeg"))],
+        ),
+        config=RecontextImageConfig(number_of_images=count),
+    )
+
+
+def _fake(**kwargs) -> FakeBackend:
+    kwargs = {"latency_median": 0.001, "latency_sigma": 0.01, "error_rate": 0, "quota_rpm": 0, **kwargs}
+    return FakeBackend(**kwargs)
+
+
+def _outcomes(backend: FakeBackend, calls: int) -> list:
+    outcomes = []
+    for _ in range(calls):
+        try:
+            backend.models.recontext_image(**_request())
+            outcomes.append(200)
+        except errors.APIError as e:
+            outcomes.append(e.code)
+    return outcomes
+
+
+def test_outputs_are_deterministic_per_request():
+    backend = _fake(image_size=(32, 48))
+    first = backend.models.recontext_image(**_request(count=2))
+    again = backend.models.recontext_image(**_request(count=2))
+    other = backend.models.recontext_image(**_request(garment=b"other"))
+
+    images = [g.image.image_bytes for g in first.generated_images]
+    assert len(images) == 2 and images[0] != images[1]
+    assert images == [g.image.image_bytes for g in again.generated_images]
+    assert other.generated_images[0].image.image_bytes != images[0]
+    assert backend.stats()["render_cpu_seconds"] > 0
+
+
+def test_seeded_errors_repeat():
+    first = _outcomes(_fake(error_rate=0.5, seed=7), 20)
+    assert set(first) == {200, 503}
+    assert _outcomes(_fake(error_rate=0.5, seed=7), 20) == first
+
+
+def test_quota_runs_dry():
+    # 60 requests per minute allows a burst of 10
+    backend = _fake(quota_rpm=60)
+    assert _outcomes(backend, 12) == [200] * 10 + [429, 429]
+    assert backend.stats()["throttled"] == 2
+
+
+def test_bursts_throttle_everything():
+    backend = _fake(burst_every=60, burst_duration=30)
+    assert _outcomes(backend, 3) == [429] * 3
+
+
+def test_async_surface():
+    backend = _fake()
+
+    async def main():
+        await backend.aio.models.get(model="virtual-try-on")
+        return await backend.aio.models.recontext_image(**_request())
+
+    response = asyncio.run(main())
+    assert response.generated_images[0].image.mime_type == "image/jpeg"
+    assert backend.stats()["in_flight"] == 0
+
+
+def test_virtual_tryon_uses_the_fake_when_configured(make_jpeg):
+    assert config.BACKEND == "fake"
+    vto = VirtualTryOn()
+    assert isinstance(vto.client, FakeBackend)
+    assert vto.try_on_single_item(make_jpeg(), make_jpeg((1, 2, 3)), return_type="bytes")
+
+
+def test_errors_are_genai_errors():
+    with pytest.raises(errors.ServerError):
+        _fake(error_rate=1).models.recontext_image(**_request())
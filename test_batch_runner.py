@@ -0,0 +1,67 @@
+"""
+Tests for batch_runner.run_manifest
+"""
+
+import json
+from pathlib import Path
+
+from batch_runner import run_manifest
+
+
+def _write_inputs(tmp_path: Path, make_jpeg) -> tuple[str, list[str]]:
+    person = tmp_path / "person.jpg"
+    person.write_bytes(make_jpeg((10, 20, 30)))
+    garments = []
+    for i in range(3):
+        garment = tmp_path / f"garment{i}.jpg"
+        garment.write_bytes(make_jpeg((60 * i, 100, 0)))
+        garments.append(str(garment))
+    return str(person), garments
+
+
+def _write_manifest(path: Path, lines: list) -> None:
+    path.write_text("\n".join(line if isinstance(line, str) else json.dumps(line) for line in lines) + "\n")
+
+
+def test_runs_manifest_and_resumes(tmp_path, make_jpeg, make_vto, fake_backend, limiter):
+    person, garments = _write_inputs(tmp_path, make_jpeg)
+    manifest = tmp_path / "manifest.jsonl"
+    _write_manifest(manifest, [
+        {"request_id": "single", "person": person, "garments": [garments[0]]},
+        {"request_id": "chain", "person": person, "garments": garments[1:]},
+        "not json",
+        {"request_id": "no-garments", "person": person},
+    ])
+    results = tmp_path / "results.jsonl"
+    vto = make_vto(write_behind=True)
+
+    summary = run_manifest(manifest, results, output_dir=tmp_path / "out", workers=2, vto=vto)
+    assert summary == {"succeeded": 2, "failed": 2, "skipped": 0}
+    records = {r.get("request_id", r.get("line")): r for r in map(json.loads, results.read_text().splitlines())}
+    assert records["single"]["status"] == "ok"
+    assert len(records["chain"]["outputs"]) == 2
+    assert all(Path(p).exists() for r in ("single", "chain") for p in records[r]["outputs"])
+    assert records[3]["status"] == "error"
+    calls = fake_backend.stats()["calls"]
+    assert calls == 3
+    # Batch calls queue as bulk on the shared limiter
+    assert limiter.snapshot()["granted_bulk"] == 3
+
+    # A re-run skips what already succeeded and does not call the backend again
+    summary = run_manifest(manifest, results, output_dir=tmp_path / "out", workers=2, vto=vto)
+    assert summary == {"succeeded": 0, "failed": 2, "skipped": 2}
+    assert fake_backend.stats()["calls"] == calls
+
+
+def test_failed_requests_are_retried_on_the_next_run(tmp_path, make_jpeg, make_vto):
+    person, garments = _write_inputs(tmp_path, make_jpeg)
+    manifest = tmp_path / "manifest.jsonl"
+    missing = str(tmp_path / "missing.jpg")
+    _write_manifest(manifest, [{"request_id": "late", "person": person, "garments": [missing]}])
+    results = tmp_path / "results.jsonl"
+    vto = make_vto(write_behind=True)
+
+    assert run_manifest(manifest, results, output_dir=tmp_path / "out", vto=vto)["failed"] == 1
+
+    Path(missing).write_bytes(make_jpeg((1, 2, 3)))
+    assert run_manifest(manifest, results, output_dir=tmp_path / "out", vto=vto)["succeeded"] == 1
@@ -0,0 +1,65 @@
+"""
+Tests for the benchmark harness
+"""
+
+import argparse
+import threading
+import time
+
+from benchmark import Harness, make_inputs, percentile, run_cell
+
+
+def test_percentile_is_nearest_rank():
+    values = [float(v) for v in range(1, 101)]
+    assert percentile(values, 0.50) == 50
+    assert percentile(values, 0.95) == 95
+    assert percentile(values, 0.99) == 99
+    assert percentile([1.0, 2.0, 3.0], 0.5) == 2.0
+    assert percentile([3.0], 0.95) == 3.0
+    assert percentile([], 0.5) is None
+
+
+def test_run_cell_counts_errors_and_latencies():
+    def fn(inputs, idx):
+        time.sleep(0.01)
+        if idx % 4 == 0:
+            raise RuntimeError("failed")
+
+    cell = run_cell(fn, list(range(16)), concurrency=4)
+    assert cell["requests"] == 16
+    assert cell["errors"] == 4
+    assert cell["latency_p50_ms"] >= 10
+
+
+def _burn(seconds: float) -> None:
+    end = time.thread_time() + seconds
+    while time.thread_time() < end:
+        pass
+
+
+def test_run_cell_leaves_out_simulator_cpu():
+    lock = threading.Lock()
+    simulated = 0.0
+
+    def fn(inputs, idx):
+        nonlocal simulated
+        # All of this request's CPU is the stand-in for remote work
+        start = time.thread_time()
+        _burn(0.02)
+        with lock:
+            simulated += time.thread_time() - start
+
+    cell = run_cell(fn, list(range(8)), concurrency=2, simulator_cpu=lambda: simulated)
+    assert cell["cpu_ms_per_request"] < 10
+
+
+def test_single_scenario_end_to_end():
+    args = argparse.Namespace(
+        latency=0.01, latency_sigma=0.1, error_rate=0.0, seed=0, return_type="bytes",
+        concurrency=[2], requests=4,
+    )
+    harness = Harness(args)
+    fn = harness.request_fn("single", concurrency=2, variations=1)
+    cell = run_cell(fn, make_inputs(4, 128), 2, harness.simulator_cpu)
+    assert cell["errors"] == 0
+    assert harness.simulator_cpu() > 0
@@ -0,0 +1,74 @@
+"""
+Tests for client_pool.ClientPool routing and failover
+"""
+
+import pytest
+
+from backends import FakeBackend
+from client_pool import ClientPool, Endpoint
+from rate_limiter import AdaptiveLimiter
+
+
+def _endpoint(location: str, latency: float = 0.01, error_rate: float = 0.0) -> Endpoint:
+    return Endpoint(
+        "test", location,
+        limiter=AdaptiveLimiter(requests_per_minute=60000, initial_concurrency=4, max_concurrency=4),
+        backend=FakeBackend(latency_median=latency, latency_sigma=0.01, error_rate=error_rate, quota_rpm=0),
+    )
+
+
+def _routed(pool: ClientPool) -> dict:
+    return {stats["endpoint"]: stats["routed"] for stats in pool.stats()}
+
+
+def test_routes_to_the_faster_endpoint(make_vto, make_jpeg):
+    fast, slow = _endpoint("fast", 0.01), _endpoint("slow", 0.1)
+    pool = ClientPool([slow, fast])
+    vto = make_vto(pool=pool)
+    person = make_jpeg()
+
+    for i in range(10):
+        vto.try_on_single_item(person, make_jpeg((i * 20, 0, 0)), return_type="bytes")
+    routed = _routed(pool)
+    # Each endpoint is probed; afterwards the fast one gets the traffic
+    assert routed["test/slow"] <= 2
+    assert routed["test/fast"] >= 8
+
+
+def test_fails_over_from_an_erroring_endpoint(make_vto, make_jpeg):
+    broken, healthy = _endpoint("broken", error_rate=1.0), _endpoint("healthy")
+    pool = ClientPool([broken, healthy])
+    vto = make_vto(pool=pool)
+    vto.retrier.policies["overload"] = vto.retrier.policies["overload"].__class__(3, 0.01, 0.02)
+
+    for i in range(5):
+        assert vto.try_on_single_item(make_jpeg(), make_jpeg((0, i * 30, 0)), return_type="bytes")
+    stats = {s["endpoint"]: s for s in pool.stats()}
+    assert not stats["test/broken"]["healthy"]
+    assert stats["test/broken"]["routed"] == 1
+    assert broken.client.stats()["errors"] == 1
+
+
+def test_from_spec():
+    with pytest.raises(ValueError):
+        ClientPool.from_spec("project-without-location")
+    with pytest.raises(ValueError):
+        ClientPool.from_spec(" , ")
+
+
+def test_busy_only_when_every_endpoint_has_waiters():
+    a, b = _endpoint("a"), _endpoint("b")
+    pool = ClientPool([a, b])
+    assert not pool.busy()
+    for endpoint in (a, b):
+        endpoint.limiter._waiters["bulk"].append(object())
+        assert pool.busy() is (endpoint is b)
+
+
+def test_limiter_snapshot_sums_distinct_limiters():
+    shared = AdaptiveLimiter(requests_per_minute=600, initial_concurrency=2, max_concurrency=2)
+    endpoints = [
+        Endpoint("test", location, limiter=shared, backend=FakeBackend()) for location in ("a", "b")
+    ]
+    pool = ClientPool(endpoints + [_endpoint("c")])
+    assert pool.limiter_snapshot()["requests_per_minute"] == 600 + 60000
@@ -0,0 +1,138 @@
+"""
+Tests for garment_catalog: ingestion, lookups and staleness
+"""
+
+import io
+import os
+
+from PIL import Image as PIL_Image
+
+from garment_catalog import GarmentCatalog, ingest, trim_borders
+
+
+def _write(path, data: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return path
+
+
+def _bordered_jpeg(size=(200, 200), inner=(80, 120)) -> bytes:
+    """A dark garment centred on a plain white background."""
+    img = PIL_Image.new("RGB", size, (255, 255, 255))
+    left, top = (size[0] - inner[0]) // 2, (size[1] - inner[1]) // 2
+    img.paste((20, 40, 160), (left, top, left + inner[0], top + inner[1]))
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=95)
+    return buffer.getvalue()
+
+
+def test_open_returns_none_without_a_pack(tmp_path):
+    assert GarmentCatalog.open(tmp_path / "missing.pack") is None
+
+
+def test_ingested_garments_are_served_from_the_pack(tmp_path, make_jpeg):
+    root = tmp_path / "clothing"
+    shirt = _write(root / "tops" / "shirt.jpg", make_jpeg((10, 200, 10)))
+    _write(root / "notes.txt", b"not an image")
+    pack = tmp_path / "catalog.pack"
+
+    summary = ingest(root, pack, workers=2)
+    assert summary["processed"] == 1
+    assert summary["garments"] == 1
+
+    catalog = GarmentCatalog(pack)
+    assert catalog.names() == ["tops/shirt.jpg"]
+    image = catalog.image(shirt)
+    assert image is not None
+    assert image.mime_type == "image/jpeg"
+    assert catalog.stats()["hits"] == 1
+
+
+def test_borders_are_trimmed_at_ingestion(tmp_path):
+    img = PIL_Image.open(io.BytesIO(_bordered_jpeg()))
+    assert trim_borders(img, 12).size == (80, 120)
+
+    root = tmp_path / "clothing"
+    garment = _write(root / "dress.jpg", _bordered_jpeg())
+    ingest(root, tmp_path / "catalog.pack")
+    view, _ = GarmentCatalog(tmp_path / "catalog.pack").payload(garment)
+    assert PIL_Image.open(io.BytesIO(bytes(view))).size == (80, 120)
+
+
+def test_changed_source_is_stale_until_reingested(tmp_path, make_jpeg):
+    root = tmp_path / "clothing"
+    shirt = _write(root / "shirt.jpg", make_jpeg((10, 200, 10)))
+    skirt = _write(root / "skirt.jpg", make_jpeg((200, 10, 10)))
+    pack = tmp_path / "catalog.pack"
+    ingest(root, pack)
+
+    # Edited after ingestion: the old payload must not stand in for it
+    _write(shirt, make_jpeg((10, 10, 200), size=(96, 96)))
+    catalog = GarmentCatalog(pack)
+    assert catalog.image(shirt) is None
+    assert catalog.image(skirt) is not None
+    assert catalog.stats()["misses"] == 1
+
+    summary = ingest(root, pack)
+    assert summary["processed"] == 1
+    assert summary["reused"] == 1
+    assert GarmentCatalog(pack).image(shirt) is not None
+
+
+def test_removed_source_still_served(tmp_path, make_jpeg):
+    root = tmp_path / "clothing"
+    shirt = _write(root / "shirt.jpg", make_jpeg())
+    pack = tmp_path / "catalog.pack"
+    ingest(root, pack)
+    os.remove(shirt)
+    assert GarmentCatalog(pack).image(shirt) is not None
+
+
+def test_files_outside_the_root_miss(tmp_path, make_jpeg):
+    data = make_jpeg()
+    root = tmp_path / "clothing"
+    _write(root / "shirt.jpg", data)
+    # Same relative name and content, different directory
+    elsewhere = _write(tmp_path / "other" / "shirt.jpg", data)
+    pack = tmp_path / "catalog.pack"
+    ingest(root, pack)
+    assert GarmentCatalog(pack).image(elsewhere) is None
+
+
+def test_identical_garments_are_stored_once(tmp_path, make_jpeg):
+    root = tmp_path / "clothing"
+    data = make_jpeg()
+    _write(root / "a.jpg", data)
+    _write(root / "copy" / "a.jpg", data)
+    summary = ingest(root, tmp_path / "catalog.pack")
+    assert summary["garments"] == 2
+    assert summary["payloads"] == 1
+    assert summary["duplicates"] == 1
+
+
+def test_open_catalog_survives_reingestion(tmp_path, make_jpeg):
+    root = tmp_path / "clothing"
+    shirt = _write(root / "shirt.jpg", make_jpeg())
+    pack = tmp_path / "catalog.pack"
+    ingest(root, pack)
+    catalog = GarmentCatalog(pack)
+    before = bytes(catalog.payload(shirt)[0])
+
+    ingest(root, pack, rebuild=True, jpeg_quality=50)
+    assert bytes(catalog.payload(shirt)[0]) == before
+
+
+def test_only_garments_come_from_the_catalog(tmp_path, make_jpeg, make_vto):
+    root = tmp_path / "clothing"
+    shirt = _write(root / "shirt.jpg", make_jpeg((10, 200, 10), size=(300, 300)))
+    pack = tmp_path / "catalog.pack"
+    ingest(root, pack, max_edge=64)
+    catalog = GarmentCatalog(pack)
+    vto = make_vto(catalog=catalog)
+
+    garment = vto.prepare_input(shirt, garment=True)
+    assert garment.image_bytes == bytes(catalog.payload(shirt)[0])
+    hits = catalog.stats()["hits"]
+    person = vto.prepare_input(shirt)
+    assert person.image_bytes != garment.image_bytes
+    assert catalog.stats()["hits"] == hits
@@ -0,0 +1,64 @@
+"""
+Tests for image_preprocess.ImagePreprocessor
+"""
+
+import io
+
+from google.genai.types import Image
+from PIL import Image as PIL_Image
+
+from image_preprocess import ImagePreprocessor
+
+
+def _encode(img: PIL_Image.Image, fmt: str = "JPEG", **params) -> Image:
+    buffer = io.BytesIO()
+    img.save(buffer, format=fmt, **params)
+    return Image(image_bytes=buffer.getvalue(), mime_type=f"image/{fmt.lower()}")
+
+
+def _decode(image: Image) -> PIL_Image.Image:
+    return PIL_Image.open(io.BytesIO(image.image_bytes))
+
+
+def test_large_images_are_downsized():
+    preprocessor = ImagePreprocessor(max_edge=256)
+    out = preprocessor.process(_encode(PIL_Image.new("RGB", (1200, 900), (10, 120, 200))))
+    assert out.mime_type == "image/jpeg"
+    assert _decode(out).size == (256, 192)
+    assert preprocessor.stats()["bytes_out"] < preprocessor.stats()["bytes_in"]
+
+
+def test_small_upright_jpeg_passes_through():
+    preprocessor = ImagePreprocessor(max_edge=256)
+    source = _encode(PIL_Image.new("RGB", (200, 100)))
+    assert preprocessor.process(source) is source
+    assert preprocessor.stats()["passthrough"] == 1
+
+
+def test_exif_orientation_is_applied():
+    exif = PIL_Image.Exif()
+    exif[0x0112] = 6  # rotate 90 degrees clockwise to display
+    source = _encode(PIL_Image.new("RGB", (120, 60)), exif=exif.tobytes())
+
+    out = ImagePreprocessor(max_edge=256).process(source)
+    img = _decode(out)
+    assert img.size == (60, 120)
+    assert img.getexif().get(0x0112, 1) == 1
+
+
+def test_alpha_is_kept_as_png():
+    source = _encode(PIL_Image.new("RGBA", (600, 300), (0, 0, 0, 0)), "PNG")
+    out = ImagePreprocessor(max_edge=300).process(source)
+    assert out.mime_type == "image/png"
+    assert _decode(out).mode == "RGBA"
+
+
+def test_prepared_output_is_stable():
+    preprocessor = ImagePreprocessor(max_edge=256)
+    once = preprocessor.process(_encode(PIL_Image.new("RGB", (1000, 1000)), "PNG"))
+    assert preprocessor.process(once) is once
+
+
+def test_gcs_references_are_untouched():
+    source = Image(gcs_uri="gs://bucket/person.jpg")
+    assert ImagePreprocessor().process(source) is source
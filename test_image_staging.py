@@ -0,0 +1,85 @@
+"""
+Tests for image_staging.ImageStaging
+"""
+
+import time
+
+from google.genai.types import Image
+
+from image_staging import ImageStaging, LocalStagingStore
+
+
+def _image(data: bytes = b"person-bytes") -> Image:
+    return Image(image_bytes=data, mime_type="image/jpeg")
+
+
+def _wait_for(staging: ImageStaging, counter: str, value: int) -> None:
+    deadline = time.monotonic() + 5
+    while staging.stats()[counter] < value and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def _staging(tmp_path, **kwargs) -> ImageStaging:
+    return ImageStaging(LocalStagingStore(tmp_path / "bucket"), index_path=tmp_path / "staging.sqlite3", **kwargs)
+
+
+def test_first_use_is_inline_then_by_uri(tmp_path):
+    staging = _staging(tmp_path)
+    image = _image()
+
+    assert staging.resolve(image) is image
+    _wait_for(staging, "uploads", 1)
+    staged = staging.resolve(image)
+    assert staged.image_bytes is None
+    assert staged.gcs_uri.startswith("file://") and staged.gcs_uri.endswith(".jpg")
+    assert staging.stats()["hits"] == 1
+
+
+def test_index_is_shared_between_instances(tmp_path):
+    uri = _staging(tmp_path).stage(_image()).gcs_uri
+    assert _staging(tmp_path).resolve(_image()).gcs_uri == uri
+
+
+def test_expired_entries_are_uploaded_again_and_evicted(tmp_path):
+    staging = _staging(tmp_path, ttl_seconds=0.05)
+    staging.stage(_image(b"old"))
+    time.sleep(0.1)
+
+    assert staging.resolve(_image(b"old")).image_bytes == b"old"
+    _wait_for(staging, "uploads", 2)
+    # The re-upload evicted the stale row and indexed a fresh one
+    assert staging.stats()["entries"] == 1
+    assert staging.resolve(_image(b"old")).gcs_uri
+
+    time.sleep(0.1)
+    assert staging.evict_expired() == 1
+    assert staging.stats()["entries"] == 0
+
+
+def test_failed_uploads_fall_back_to_inline(tmp_path):
+    class BrokenStore:
+        def upload(self, name, data, mime_type):
+            raise OSError("bucket unavailable")
+
+    staging = ImageStaging(BrokenStore(), index_path=tmp_path / "staging.sqlite3")
+    image = _image()
+    assert staging.resolve(image) is image
+    _wait_for(staging, "upload_errors", 1)
+    while staging.stats()["pending"]:
+        time.sleep(0.01)
+    # Nothing was indexed, so the next use tries again
+    assert staging.resolve(image) is image
+    _wait_for(staging, "upload_errors", 2)
+    assert staging.stats()["upload_errors"] == 2
+
+
+def test_reused_inputs_are_sent_by_uri(tmp_path, make_vto, make_jpeg):
+    staging = _staging(tmp_path)
+    vto = make_vto(staging=staging)
+    person = make_jpeg()
+
+    vto.try_on_single_item(person, make_jpeg((0, 0, 50)), return_type="bytes")
+    _wait_for(staging, "uploads", 2)
+    vto.try_on_single_item(person, make_jpeg((0, 50, 0)), return_type="bytes")
+    # The person photo is referenced by URI; the new garment goes inline
+    assert staging.stats()["hits"] == 1
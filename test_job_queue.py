@@ -0,0 +1,99 @@
+"""
+Tests for job_queue.JobQueue
+"""
+
+import threading
+
+import pytest
+
+from job_queue import JobQueue, QueueFull
+
+
+def _blocked_queue(**kwargs) -> tuple[JobQueue, threading.Event]:
+    """A one-worker queue whose worker is busy until the returned event is set."""
+    queue = JobQueue(workers=1, **kwargs)
+    release, started = threading.Event(), threading.Event()
+
+    def gate():
+        started.set()
+        release.wait(5)
+
+    queue.submit("gate", gate)
+    started.wait(5)
+    return queue, release
+
+
+def test_users_are_served_round_robin():
+    queue, release = _blocked_queue(max_size=10, max_per_user=5)
+    order = []
+    jobs = [queue.submit(user, order.append, f"{user}{i}") for user, i in
+            (("alice", 1), ("alice", 2), ("alice", 3), ("bob", 1))]
+    assert [job.position() for job in jobs] == [0, 2, 3, 1]
+
+    release.set()
+    for job in jobs:
+        job.result(5)
+    assert order == ["alice1", "bob1", "alice2", "alice3"]
+
+
+def test_queue_and_per_user_limits():
+    queue, release = _blocked_queue(max_size=3, max_per_user=2)
+    queue.submit("alice", lambda: None)
+    queue.submit("alice", lambda: None)
+    with pytest.raises(QueueFull):
+        queue.submit("alice", lambda: None)
+    queue.submit("bob", lambda: None)
+    with pytest.raises(QueueFull):
+        queue.submit("carol", lambda: None)
+    assert queue.stats()["rejected"] == 2
+    release.set()
+
+
+def test_eta_counts_running_and_queued_jobs():
+    queue, release = _blocked_queue(initial_service_time=10.0)
+    first = queue.submit("alice", lambda: None)
+    second = queue.submit("bob", lambda: None)
+
+    # The running job frees the worker in under 10s; each queued job adds 10s
+    assert 19 < first.eta() <= 20
+    assert 29 < second.eta() <= 30
+    release.set()
+    first.result(5)
+    second.result(5)
+    assert first.eta() == 0.0
+    # Jobs that finish almost instantly pull the average service time down
+    assert queue.stats()["service_time"] < 10
+
+
+def test_cancelled_jobs_never_run():
+    queue, release = _blocked_queue()
+    ran = []
+    job = queue.submit("alice", ran.append, "x")
+    assert job.cancel()
+    release.set()
+    queue.submit("alice", lambda: None).result(5)
+    assert ran == []
+    assert job.status == "cancelled"
+    assert queue.stats()["cancelled"] == 1
+
+
+def test_errors_reach_the_caller():
+    queue = JobQueue(workers=1)
+
+    def boom():
+        raise ValueError("bad input")
+
+    job = queue.submit("alice", boom)
+    with pytest.raises(ValueError):
+        job.result(5)
+    assert job.status == "failed"
+
+
+def test_progress_reports_until_done():
+    queue, release = _blocked_queue()
+    job = queue.submit("alice", lambda: "ok")
+    updates = queue.progress(job, poll_interval=0.01)
+    assert next(updates).startswith("⏳ Queued (position 1)")
+    release.set()
+    list(updates)
+    assert job.result() == "ok"
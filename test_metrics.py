@@ -0,0 +1,114 @@
+"""
+Tests for the metrics registry, stage timing and the HTTP endpoint
+"""
+
+import socket
+import urllib.error
+import urllib.request
+
+import pytest
+
+import metrics
+
+
+@pytest.fixture(autouse=True)
+def clean_registry():
+    metrics.registry.reset()
+    yield
+    metrics.registry.reset()
+
+
+def _stages(name: str) -> list[dict]:
+    return [s for s in metrics.registry.snapshot()["stages"] if s["stage"] == name]
+
+
+def test_stages_inherit_request_labels_and_outcome():
+    @metrics.instrument("single")
+    def run(fail: bool):
+        with metrics.stage("upstream", region="eu"):
+            if fail:
+                raise RuntimeError("boom")
+
+    run(False)
+    with pytest.raises(RuntimeError):
+        run(True)
+
+    upstream = {s["labels"]["outcome"]: s for s in _stages("upstream")}
+    assert upstream["ok"]["labels"] == {"method": "single", "outcome": "ok", "region": "eu"}
+    assert upstream["error"]["count"] == 1
+    counters = {c["labels"]["outcome"]: c["value"] for c in metrics.registry.snapshot()["counters"]}
+    assert counters == {"ok": 1, "error": 1}
+
+
+def test_generator_request_spans_the_iteration():
+    seen = []
+
+    @metrics.instrument("multiple")
+    def steps():
+        for i in range(3):
+            seen.append(metrics.current_request()["method"])
+            yield i
+
+    with metrics.request_id("look-1"):
+        assert list(steps()) == [0, 1, 2]
+    assert seen == ["multiple"] * 3
+    assert [s["count"] for s in _stages("request")] == [1]
+    # Outside the generator body the method tag doesn't leak
+    assert metrics.current_request() is None
+
+
+def test_request_id_is_visible_to_the_request():
+    @metrics.instrument("single")
+    def run():
+        return metrics.current_request()["request_id"]
+
+    with metrics.request_id("manifest-42"):
+        assert run() == "manifest-42"
+    assert len(run()) == 16
+
+
+def test_collectors_export_numbers_only():
+    metrics.registry.register_collector("test_ok", lambda: {"depth": 3, "policy": "strict", "ready": True})
+    metrics.registry.register_collector("test_broken", lambda: 1 / 0)
+    try:
+        gauges = metrics.registry.snapshot()["gauges"]
+    finally:
+        metrics.registry._collectors.pop("test_ok")
+        metrics.registry._collectors.pop("test_broken")
+    assert gauges["test_ok_depth"] == 3
+    assert not any(key.startswith("test_broken") or key in ("test_ok_policy", "test_ok_ready") for key in gauges)
+
+
+def test_prometheus_text():
+    metrics.registry.observe("upstream", 0.2, method="single", outcome="ok")
+    metrics.registry.inc("requests", method="single", outcome="ok")
+    text = metrics.registry.render_prometheus()
+    assert 'vto_stage_seconds_bucket{stage="upstream",method="single",outcome="ok",le="0.25"} 1' in text
+    assert 'vto_stage_seconds_bucket{stage="upstream",method="single",outcome="ok",le="0.1"} 0' in text
+    assert 'vto_requests_total{method="single",outcome="ok"} 1' in text
+
+
+def test_http_endpoint_serves_metrics_and_readiness():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    ready = []
+    metrics.registry.register_readiness("test_client", lambda: bool(ready))
+    server = metrics.start_http_server(port, host="127.0.0.1")
+    try:
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/ready")
+        assert error.value.code == 503
+        ready.append(True)
+        assert urllib.request.urlopen(f"http://127.0.0.1:{port}/ready").status == 200
+        body = urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics").read().decode()
+        assert "# TYPE vto_stage_seconds histogram" in body
+    finally:
+        server.shutdown()
+        metrics.registry._readiness.pop("test_client")
+
+
+def test_try_on_records_pipeline_stages(make_vto, make_jpeg):
+    make_vto().try_on_single_item(make_jpeg(), make_jpeg((0, 0, 60)), return_type="bytes")
+    recorded = {s["stage"] for s in metrics.registry.snapshot()["stages"] if s["labels"].get("method") == "single"}
+    assert {"load", "build", "upstream", "request"} <= recorded
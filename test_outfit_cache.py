@@ -0,0 +1,62 @@
+"""
+Tests for outfit_cache.OutfitPrefixCache and outfit try-ons
+"""
+
+from google.genai.types import Image
+
+from outfit_cache import OutfitPrefixCache, chain_keys
+
+
+def _image(data: bytes) -> Image:
+    return Image(image_bytes=data, mime_type="image/jpeg")
+
+
+def _keys(*garments: bytes) -> list[tuple]:
+    return chain_keys(_image(b"person"), [_image(g) for g in garments], "model", "level", 1)
+
+
+def test_chain_keys_share_prefixes():
+    top_bottom = _keys(b"top", b"bottom")
+    top_skirt = _keys(b"top", b"skirt")
+    assert top_bottom[0] == top_skirt[0]
+    assert top_bottom[1] != top_skirt[1]
+    assert chain_keys(_image(b"other"), [_image(b"top")], "model", "level", 1)[0] != top_bottom[0]
+
+
+def test_longest_prefix():
+    cache = OutfitPrefixCache(max_bytes=1000)
+    keys = _keys(b"top", b"bottom", b"shoes")
+    cache.put(keys[0], [_image(b"step1")])
+    cache.put(keys[1], [_image(b"step2")])
+
+    steps = cache.longest_prefix(keys)
+    assert [s[0].image_bytes for s in steps] == [b"step1", b"step2"]
+    assert cache.longest_prefix(_keys(b"shoes")) == []
+
+
+def test_eviction_drops_longest_chains_first():
+    cache = OutfitPrefixCache(max_bytes=20)
+    keys = _keys(b"top", b"bottom", b"shoes")
+    for key, data in zip(keys, (b"a" * 6, b"b" * 6, b"c" * 6)):
+        cache.put(key, [_image(data)])
+    cache.put(_keys(b"hat")[0], [_image(b"d" * 6)])
+
+    # The longest chain goes; its prefixes stay usable
+    assert cache.get(keys[2]) is None
+    assert len(cache.longest_prefix(keys)) == 2
+    assert cache.stats()["bytes"] == 18
+
+
+def test_outfits_share_generated_prefixes(make_vto, make_jpeg, fake_backend):
+    vto = make_vto(outfit_cache=OutfitPrefixCache())
+    top, bottom, shoes, boots = (make_jpeg((40 * i, 0, 0)) for i in range(1, 5))
+
+    results = vto.try_on_outfits(make_jpeg(), [[top, bottom, shoes], [top, bottom, boots]], return_type="bytes")
+    assert [len(outfit) for outfit in results] == [3, 3]
+    assert results[0][:2] == results[1][:2]
+    # top, bottom, shoes, boots: the shared prefix is generated once
+    assert fake_backend.stats()["calls"] == 4
+
+    # A later chain resumes after the cached prefix
+    vto.try_on_multiple_items(make_jpeg(), [top, bottom, make_jpeg((0, 0, 99))], return_type="bytes")
+    assert fake_backend.stats()["calls"] == 5
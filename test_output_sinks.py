@@ -0,0 +1,84 @@
+"""
+Tests for output_sinks.DirectorySink and BackgroundWriter
+"""
+
+import io
+import threading
+from pathlib import Path
+
+import pytest
+from PIL import Image as PIL_Image
+from PIL import features as PIL_features
+
+from output_sinks import BackgroundWriter, DirectorySink
+
+
+def test_directory_sink_writes_bytes_untouched(tmp_path, make_jpeg):
+    data = make_jpeg()
+    path = DirectorySink(tmp_path / "out").save(data, "a.jpeg")
+    assert Path(path).read_bytes() == data
+
+
+def test_original_format_keeps_the_api_bytes(tmp_path, make_jpeg):
+    writer = BackgroundWriter(tmp_path, format="original")
+    data = make_jpeg()
+    path = writer.save(data, "a.jpeg")
+    writer.flush()
+    assert path == str(tmp_path / "a.jpeg")
+    assert Path(path).read_bytes() == data
+    assert writer.stats() == {"written": 1, "failed": 0, "bytes": len(data), "pending": 0}
+
+
+@pytest.mark.skipif(not PIL_features.check("webp"), reason="Pillow built without WebP")
+def test_reencodes_to_the_configured_format(tmp_path, make_jpeg):
+    writer = BackgroundWriter(tmp_path, format="webp", quality=60)
+    path = writer.save(make_jpeg(size=(200, 300)), "a.jpeg")
+    assert path.endswith("a.webp")
+    writer.wait([path])
+    with PIL_Image.open(path) as img:
+        assert (img.format, img.size) == ("WEBP", (200, 300))
+
+
+def test_unknown_format_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        BackgroundWriter(tmp_path, format="bmp")
+
+
+def test_save_blocks_when_too_many_writes_are_pending(tmp_path, make_jpeg):
+    writer = BackgroundWriter(tmp_path, workers=1, max_pending=2)
+    release = threading.Event()
+    write = writer._write
+    writer._write = lambda path, data: (release.wait(5), write(path, data))
+
+    writer.save(make_jpeg(), "a.jpeg")
+    writer.save(make_jpeg(), "b.jpeg")
+    third = threading.Thread(target=writer.save, args=(make_jpeg(), "c.jpeg"))
+    third.start()
+    third.join(0.1)
+    assert third.is_alive()
+
+    release.set()
+    third.join(5)
+    writer.flush(5)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["a.jpeg", "b.jpeg", "c.jpeg"]
+
+
+def test_write_errors_are_raised_once(tmp_path, make_jpeg):
+    (tmp_path / "blocked").write_text("a file where a directory should be")
+    writer = BackgroundWriter(tmp_path)
+    path = writer.save(make_jpeg(), "blocked/a.jpeg")
+    with pytest.raises(OSError):
+        writer.wait([path])
+    writer.flush()
+    assert writer.stats()["failed"] == 1
+
+
+def test_write_behind_paths_exist_after_flush(tmp_path, make_vto, make_jpeg):
+    vto = make_vto(write_behind=True)
+    paths = vto.try_on_single_item(
+        make_jpeg(), make_jpeg((9, 9, 9)), output_path=str(tmp_path / "r.jpeg"), number_of_images=2
+    )
+    vto.flush(paths)
+    for path in paths:
+        with PIL_Image.open(io.BytesIO(Path(path).read_bytes())) as img:
+            assert img.format == "JPEG"
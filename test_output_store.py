@@ -0,0 +1,79 @@
+"""
+Tests for output_store.OutputStore
+"""
+
+import hashlib
+import os
+import time
+from pathlib import Path
+
+import metrics
+from outfit_cache import image_digest
+from output_store import OutputStore
+from virtual_tryon import load_image
+
+
+def test_files_are_sharded_by_content_hash(tmp_path, make_jpeg):
+    store = OutputStore(tmp_path / "store")
+    data = make_jpeg()
+    digest = hashlib.sha256(data).hexdigest()
+
+    path = store.save(data, "tryon_0.jpeg")
+    store.wait([path])
+    assert Path(path) == store.directory / digest[:2] / digest[2:4] / f"{digest}.jpeg"
+    assert Path(path).read_bytes() == data
+
+
+def test_duplicates_share_one_file_but_each_save_is_indexed(tmp_path, make_jpeg):
+    store = OutputStore(tmp_path / "store")
+    first = store.save(make_jpeg(), "a.jpeg", {"request_id": "r1"})
+    store.wait()
+    second = store.save(make_jpeg(), "b.jpeg", {"request_id": "r2"})
+    assert first == second
+    assert store.stats()["outputs"] == 2
+    assert store.stats()["files"] == 1
+    assert [row["name"] for row in store.find(request_id="r2")] == ["b.jpeg"]
+
+
+def test_lookup_by_input_garment_and_date(tmp_path, make_jpeg):
+    store = OutputStore(tmp_path / "store")
+    store.save(make_jpeg((1, 0, 0)), "a.jpeg", {"source_digest": "p1", "garment_digest": "g1"})
+    store.save(make_jpeg((2, 0, 0)), "b.jpeg", {"source_digest": "p1", "garment_digest": "g2"})
+    cutoff = time.time()
+    time.sleep(0.01)
+    store.save(make_jpeg((3, 0, 0)), "c.jpeg", {"source_digest": "p2", "garment_digest": "g1"})
+
+    assert [row["name"] for row in store.by_input("p1")] == ["b.jpeg", "a.jpeg"]
+    assert [row["name"] for row in store.by_garment("g1")] == ["c.jpeg", "a.jpeg"]
+    assert [row["name"] for row in store.between(cutoff, time.time() + 1)] == ["c.jpeg"]
+    assert len(store.find(limit=1)) == 1
+
+
+def test_index_holds_relative_paths(tmp_path, make_jpeg, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    store = OutputStore(Path("store"))
+    path = store.save(make_jpeg(), "a.jpeg")
+    store.wait()
+
+    with store._connect() as conn:
+        stored = conn.execute("SELECT path FROM outputs").fetchone()["path"]
+    assert not os.path.isabs(stored)
+    # Another process in another working directory finds the same file
+    monkeypatch.chdir(tmp_path.parent)
+    assert store.find()[0]["path"] == path
+    assert Path(path).exists()
+
+
+def test_try_on_results_are_indexed_with_request_metadata(tmp_path, make_vto, make_jpeg):
+    store = OutputStore(tmp_path / "store")
+    vto = make_vto(sink=store)
+    person, garment = make_jpeg(), make_jpeg((0, 0, 77))
+
+    with metrics.request_id("look-7"):
+        paths = vto.try_on_single_item(person, garment)
+    rows = store.find(request_id="look-7")
+    assert [row["path"] for row in rows] == paths
+    assert rows[0]["garment_digest"] == image_digest(load_image(garment))
+    assert rows[0]["method"] == "single"
+    assert rows[0]["latency_seconds"] is not None
+    assert Path(paths[0]).exists()
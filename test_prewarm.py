@@ -0,0 +1,93 @@
+"""
+Tests for credential and connection pre-warming (ClientPool.warm / keep-warm)
+"""
+
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+
+import config
+import client_pool
+from backends import FakeBackend
+from client_pool import ClientPool, Endpoint
+from rate_limiter import AdaptiveLimiter
+
+
+class _Credentials:
+    """Stands in for google-auth credentials: a token that expires."""
+
+    def __init__(self, expires_in: float):
+        self.token = "token"
+        self.refreshes = 0
+        self._set_expiry(expires_in)
+
+    def _set_expiry(self, seconds: float) -> None:
+        self.expiry = datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(seconds=seconds)
+
+    def refresh(self, request) -> None:
+        self.refreshes += 1
+        self.token = "fresh-token"
+        self._set_expiry(3600)
+
+
+class _BrokenModels:
+    def get(self, model, config=None):
+        raise ConnectionError("unreachable")
+
+
+def _endpoint(location: str, backend=None) -> Endpoint:
+    return Endpoint(
+        "test", location,
+        limiter=AdaptiveLimiter(requests_per_minute=60000, initial_concurrency=2, max_concurrency=2),
+        backend=backend or FakeBackend(latency_median=0.001, error_rate=0, quota_rpm=0),
+    )
+
+
+def test_warm_marks_pool_ready(make_vto):
+    vto = make_vto()
+    assert not vto.ready()
+    assert vto.warm()
+    assert vto.pool.keep_warm_stats()["warmed"] == 1
+
+
+def test_one_failing_endpoint_does_not_block_readiness():
+    broken = _endpoint("broken")
+    broken.client.models = _BrokenModels()
+    pool = ClientPool([broken, _endpoint("ok")])
+    assert pool.warm()
+    assert [e.warmed for e in pool.endpoints] == [False, True]
+
+
+def test_async_warm():
+    pool = ClientPool([_endpoint("a")])
+    assert asyncio.run(pool.warm_async())
+
+
+def test_warm_fetches_a_missing_token():
+    endpoint = _endpoint("a")
+    endpoint.credentials = _Credentials(expires_in=3600)
+    endpoint.credentials.token = None
+    endpoint.warm()
+    assert endpoint.credentials.refreshes == 1
+    assert 3590 < endpoint.token_expires_in() <= 3600
+
+
+def test_keep_warm_refreshes_tokens_and_pings_idle_endpoints(monkeypatch):
+    monkeypatch.setattr(client_pool, "_KEEP_WARM_TICK", 0.01)
+    monkeypatch.setattr(config, "TOKEN_REFRESH_MARGIN_SECONDS", 300)
+    monkeypatch.setattr(config, "KEEPALIVE_INTERVAL_SECONDS", 0.01)
+    endpoint = _endpoint("a")
+    endpoint.credentials = _Credentials(expires_in=60)
+    pool = ClientPool([endpoint])
+    pool.warm()
+
+    pool.start_keep_warm()
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        stats = pool.keep_warm_stats()
+        if stats["token_refreshes"] and stats["keepalive_pings"]:
+            break
+        time.sleep(0.01)
+    assert endpoint.credentials.refreshes == 1
+    assert pool.keep_warm_stats()["keepalive_pings"] >= 1
+    assert pool.keep_warm_stats()["keep_warm_errors"] == 0
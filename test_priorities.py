@@ -0,0 +1,131 @@
+"""
+Tests for priority classes on the shared limiter
+"""
+
+import threading
+import time
+
+import pytest
+
+import config
+import rate_limiter
+from rate_limiter import AdaptiveLimiter
+
+
+def _one_slot(**kwargs) -> tuple[AdaptiveLimiter, str]:
+    """A single-slot limiter with its slot taken; returns it and the held slot's class."""
+    kwargs.setdefault("max_wait", 0)
+    kwargs.setdefault("bulk_share", 1)
+    limiter = AdaptiveLimiter(requests_per_minute=60000, initial_concurrency=1, max_concurrency=1, **kwargs)
+    return limiter, limiter.acquire("interactive")
+
+
+def _queue(limiter: AdaptiveLimiter, classes: list[str], order: list) -> list[threading.Thread]:
+    """Queue one caller per class, in order; each records its class once granted and releases."""
+    threads = []
+    for name in classes:
+        def call(name=name):
+            granted = limiter.acquire(name)
+            order.append(granted)
+            limiter.release(priority=granted)
+
+        queued = limiter.queued()
+        thread = threading.Thread(target=call)
+        thread.start()
+        while limiter.queued() == queued:
+            time.sleep(0.001)
+        threads.append(thread)
+    return threads
+
+
+def _drain(limiter: AdaptiveLimiter, held: str, threads: list[threading.Thread]) -> None:
+    limiter.release(priority=held)
+    for thread in threads:
+        thread.join(2)
+
+
+def test_strict_serves_higher_classes_first():
+    limiter, held = _one_slot(policy="strict")
+    order = []
+    threads = _queue(limiter, ["bulk", "near_line", "interactive", "bulk", "interactive"], order)
+    assert limiter.snapshot()["queue_depth_bulk"] == 2
+
+    _drain(limiter, held, threads)
+    assert order == ["interactive", "interactive", "near_line", "bulk", "bulk"]
+
+
+def test_weighted_interleaves_by_weight():
+    limiter, held = _one_slot(policy="weighted", weights={"interactive": 3, "near_line": 1, "bulk": 1})
+    order = []
+    threads = _queue(limiter, ["bulk"] * 4 + ["interactive"] * 4, order)
+
+    _drain(limiter, held, threads)
+    # Bulk is not starved behind interactive, but gets a quarter of the grants
+    assert order[:4].count("interactive") == 3
+    assert order[:4].count("bulk") == 1
+    snapshot = limiter.snapshot()
+    assert snapshot["granted_bulk"] == 4
+    assert snapshot["granted_interactive"] == 5
+
+
+def test_caller_waiting_past_max_wait_goes_next():
+    limiter, held = _one_slot(policy="strict", max_wait=0.1)
+    order = []
+    threads = _queue(limiter, ["bulk"], order)
+    time.sleep(0.15)
+    threads += _queue(limiter, ["interactive", "interactive"], order)
+
+    _drain(limiter, held, threads)
+    assert order == ["bulk", "interactive", "interactive"]
+    assert limiter.snapshot()["starvation_grants"] == 1
+
+
+def test_bulk_share_keeps_slots_for_other_classes():
+    limiter = AdaptiveLimiter(
+        requests_per_minute=60000, initial_concurrency=4, max_concurrency=4, bulk_share=0.5
+    )
+    held = [limiter.acquire("bulk"), limiter.acquire("bulk")]
+    order = []
+    # Slots are free, but bulk already holds its half of them
+    threads = _queue(limiter, ["bulk"], order)
+    assert limiter.snapshot()["in_flight_bulk"] == 2
+
+    granted = limiter.acquire("interactive")
+    assert limiter.queued() == 1
+    limiter.release(priority=granted)
+
+    limiter.release(priority=held.pop())
+    threads[0].join(2)
+    assert order == ["bulk"]
+    limiter.release(priority=held.pop())
+    assert limiter.snapshot()["in_flight"] == 0
+
+
+def test_priority_block_sets_the_class():
+    assert rate_limiter.current_priority() == config.DEFAULT_PRIORITY
+    assert rate_limiter.current_priority("bulk") == "bulk"
+    with rate_limiter.priority("near_line"):
+        # The block wins over a client default
+        assert rate_limiter.current_priority("bulk") == "near_line"
+        limiter = AdaptiveLimiter(requests_per_minute=60000, initial_concurrency=2, max_concurrency=2)
+        with limiter.slot():
+            assert limiter.snapshot()["in_flight_near_line"] == 1
+    assert rate_limiter.current_priority() == config.DEFAULT_PRIORITY
+
+    with pytest.raises(ValueError):
+        with rate_limiter.priority("urgent"):
+            pass
+
+
+def test_client_priority_reaches_the_limiter(make_vto, make_jpeg, limiter):
+    vto = make_vto(priority="bulk")
+    vto.try_on_single_item(make_jpeg(), make_jpeg((0, 200, 0)), return_type="bytes")
+    assert limiter.snapshot()["granted_bulk"] >= 1
+    assert limiter.snapshot()["granted_interactive"] == 0
+
+    with rate_limiter.priority("interactive"):
+        vto.try_on_single_item(make_jpeg((0, 0, 200)), make_jpeg((0, 200, 0)), return_type="bytes")
+    assert limiter.snapshot()["granted_interactive"] >= 1
+
+    with pytest.raises(ValueError):
+        make_vto(priority="urgent")
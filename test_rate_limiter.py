@@ -0,0 +1,137 @@
+"""
+Tests for rate_limiter.AdaptiveLimiter
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from rate_limiter import AdaptiveLimiter, DeadlineExceeded, WaitScope, is_overload_error, wait_scope
+
+
+class _Error(Exception):
+    def __init__(self, code):
+        super().__init__(f"HTTP {code}")
+        self.code = code
+
+
+def test_overload_errors():
+    assert is_overload_error(_Error(429))
+    assert is_overload_error(_Error(503))
+    assert not is_overload_error(_Error(400))
+    assert not is_overload_error(ValueError())
+
+
+def test_aimd_adapts_the_concurrency_limit():
+    limiter = AdaptiveLimiter(
+        requests_per_minute=60000, initial_concurrency=4, max_concurrency=8, decrease_cooldown=60
+    )
+    for _ in range(4):
+        limiter.release(priority=limiter.acquire("interactive"))
+    # Additive increase: about +1 per round of calls
+    assert 4.9 < limiter.snapshot()["concurrency_limit"] < 5.1
+
+    limiter.release(_Error(429), limiter.acquire("interactive"))
+    limit = limiter.snapshot()["concurrency_limit"]
+    assert 2.4 < limit < 2.6
+    # Further overloads inside the cooldown are the same congestion event
+    limiter.release(_Error(503), limiter.acquire("interactive"))
+    assert limiter.snapshot()["concurrency_limit"] == limit
+    # Other errors leave the limit alone
+    limiter.release(_Error(400), limiter.acquire("interactive"))
+    assert limiter.snapshot()["concurrency_limit"] == limit
+    assert limiter.snapshot()["overloads"] == 2
+
+
+def test_limit_stays_within_bounds():
+    limiter = AdaptiveLimiter(
+        requests_per_minute=60000, initial_concurrency=2, min_concurrency=1,
+        max_concurrency=3, decrease_cooldown=0,
+    )
+    for _ in range(3):
+        limiter.release(_Error(429), limiter.acquire("interactive"))
+    assert limiter.snapshot()["concurrency_limit"] == 1
+    for _ in range(50):
+        limiter.release(priority=limiter.acquire("interactive"))
+    assert limiter.snapshot()["concurrency_limit"] == 3
+
+
+def test_concurrency_is_bounded():
+    limiter = AdaptiveLimiter(requests_per_minute=60000, initial_concurrency=3, max_concurrency=3)
+    lock = threading.Lock()
+    running = peak = 0
+
+    def call():
+        nonlocal running, peak
+        with limiter.slot():
+            with lock:
+                running += 1
+                peak = max(peak, running)
+            time.sleep(0.02)
+            with lock:
+                running -= 1
+
+    threads = [threading.Thread(target=call) for _ in range(12)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert peak == 3
+    assert limiter.snapshot()["in_flight"] == 0
+
+
+def test_token_bucket_caps_the_request_rate():
+    # 60 requests per minute allows a burst of 10, then one per second
+    limiter = AdaptiveLimiter(requests_per_minute=60, initial_concurrency=16, max_concurrency=16)
+    for _ in range(10):
+        limiter.release(priority=limiter.acquire("interactive"))
+    with wait_scope(WaitScope(time.monotonic() + 0.2)):
+        with pytest.raises(DeadlineExceeded):
+            limiter.acquire("interactive")
+    assert limiter.snapshot()["queue_depth"] == 0
+
+
+def test_cancelled_wait_leaves_the_queue():
+    limiter = AdaptiveLimiter(requests_per_minute=60000, initial_concurrency=1, max_concurrency=1)
+    held = limiter.acquire("interactive")
+    scope = WaitScope()
+    errors = []
+
+    def wait():
+        with wait_scope(scope):
+            try:
+                limiter.acquire("interactive")
+            except DeadlineExceeded as e:
+                errors.append(e)
+
+    thread = threading.Thread(target=wait)
+    thread.start()
+    while not limiter.queued():
+        time.sleep(0.01)
+    scope.cancel()
+    thread.join(1)
+    assert errors and limiter.queued() == 0
+    limiter.release(priority=held)
+    assert limiter.snapshot()["in_flight"] == 0
+
+
+def test_async_callers_share_the_limit():
+    limiter = AdaptiveLimiter(requests_per_minute=60000, initial_concurrency=2, max_concurrency=2)
+    running = peak = 0
+
+    async def call():
+        nonlocal running, peak
+        async with limiter.aslot():
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.02)
+            running -= 1
+
+    async def main():
+        await asyncio.gather(*(call() for _ in range(8)))
+
+    asyncio.run(main())
+    assert peak == 2
+    assert limiter.snapshot()["successes"] == 8
@@ -0,0 +1,67 @@
+"""
+Tests for result_cache.ResultCache and its use by VirtualTryOn
+"""
+
+import time
+
+from result_cache import ResultCache, make_key
+
+
+def test_round_trip(tmp_path):
+    cache = ResultCache(tmp_path, max_bytes=0, max_age_seconds=0)
+    cache.put("k", [b"one", b"two"], "image/jpeg")
+    assert cache.get("k") == ([b"one", b"two"], "image/jpeg")
+    assert cache.get("missing") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_key_covers_every_request_field():
+    base = make_key(b"person", b"garment", "model", "BLOCK_LOW_AND_ABOVE", 1)
+    assert base == make_key(b"person", b"garment", "model", "BLOCK_LOW_AND_ABOVE", 1)
+    assert base != make_key(b"person", b"garment", "model", "BLOCK_LOW_AND_ABOVE", 2)
+    assert base != make_key(b"person", b"other", "model", "BLOCK_LOW_AND_ABOVE", 1)
+    # Length prefixes keep shifted boundaries apart
+    assert make_key(b"ab", b"c", "m", "s", 1) != make_key(b"a", b"bc", "m", "s", 1)
+
+
+def test_evicts_least_recently_used_over_budget(tmp_path):
+    cache = ResultCache(tmp_path, max_bytes=250, max_age_seconds=0)
+    cache.put("a", [b"a" * 100])
+    time.sleep(0.01)
+    cache.put("b", [b"b" * 100])
+    time.sleep(0.01)
+    # Reading "a" makes "b" the least recently used entry
+    assert cache.get("a") is not None
+    time.sleep(0.01)
+    cache.put("c", [b"c" * 100])
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["bytes"] == 200
+
+
+def test_expired_entries_miss(tmp_path):
+    cache = ResultCache(tmp_path, max_bytes=0, max_age_seconds=0.05)
+    cache.put("k", [b"data"])
+    time.sleep(0.1)
+    assert cache.get("k") is None
+    assert not list(tmp_path.glob("*/k_0"))
+
+
+def test_shared_between_instances(tmp_path):
+    ResultCache(tmp_path).put("k", [b"data"], "image/png")
+    assert ResultCache(tmp_path).get("k") == ([b"data"], "image/png")
+
+
+def test_repeated_single_item_served_from_cache(tmp_path, make_vto, make_jpeg, fake_backend):
+    vto = make_vto(cache=ResultCache(tmp_path))
+    person, garment = make_jpeg((10, 20, 30)), make_jpeg((200, 100, 50))
+
+    first = vto.try_on_single_item(person, garment, return_type="bytes")
+    second = vto.try_on_single_item(person, garment, return_type="bytes")
+
+    assert first == second
+    assert fake_backend.stats()["calls"] == 1
@@ -0,0 +1,53 @@
+"""
+Tests for result_tiers.ResultTiers
+"""
+
+from pathlib import Path
+
+from PIL import Image as PIL_Image
+
+from result_tiers import ResultTiers
+
+
+def test_preview_is_small_and_full_is_untouched(tmp_path, make_jpeg):
+    tiers = ResultTiers(tmp_path, preview_edge=64, max_bytes=0)
+    data = make_jpeg(size=(768, 1024))
+
+    stored = tiers.add(data)
+    assert Path(stored.full).read_bytes() == data
+    with PIL_Image.open(stored.preview) as preview:
+        assert max(preview.size) == 64
+    assert Path(stored.preview).stat().st_size < len(data)
+    assert tiers.full(stored.digest) == stored.full
+
+
+def test_same_image_is_stored_once(tmp_path, make_jpeg):
+    tiers = ResultTiers(tmp_path, max_bytes=0)
+    first = tiers.add(make_jpeg())
+    assert tiers.add(make_jpeg()) == first
+    assert tiers.stats()["hits"] == 1
+    assert tiers.stats()["entries"] == 1
+
+
+def test_least_recently_used_pairs_are_evicted(tmp_path, make_jpeg):
+    images = [make_jpeg((60 * i, 0, 0), size=(256, 256)) for i in range(3)]
+    probe = ResultTiers(tmp_path / "probe", preview_edge=64, max_bytes=0)
+    probe.add(images[0])
+    pair_size = probe.stats()["bytes"]
+
+    tiers = ResultTiers(tmp_path / "tiers", preview_edge=64, max_bytes=int(pair_size * 2.5))
+    a, b = tiers.add(images[0]), tiers.add(images[1])
+    tiers.add(images[0])  # "a" is now more recent than "b"
+    tiers.add(images[2])
+
+    assert tiers.full(b.digest) is None
+    assert not Path(b.full).exists() and not Path(b.preview).exists()
+    assert tiers.full(a.digest) == a.full
+    assert tiers.stats()["evictions"] == 1
+
+
+def test_reopening_indexes_existing_files(tmp_path, make_jpeg):
+    stored = ResultTiers(tmp_path, max_bytes=0).add(make_jpeg())
+    reopened = ResultTiers(tmp_path, max_bytes=0)
+    assert reopened.full(stored.digest) == stored.full
+    assert reopened.add(make_jpeg()) == stored
@@ -0,0 +1,141 @@
+"""
+Tests for retries.Retrier: deadlines, retries and hedging
+"""
+
+import threading
+import time
+
+import pytest
+
+from rate_limiter import AdaptiveLimiter
+from retries import DeadlineExceeded, HedgePolicy, Retrier
+
+
+class _Error(Exception):
+    def __init__(self, code):
+        super().__init__(f"HTTP {code}")
+        self.code = code
+
+
+def _saturated_limiter() -> tuple[AdaptiveLimiter, str]:
+    """A limiter with one slot, already taken; returns it and the held slot's class."""
+    limiter = AdaptiveLimiter(requests_per_minute=6000, initial_concurrency=1, max_concurrency=1)
+    return limiter, limiter.acquire("interactive")
+
+
+def test_deadline_applies_without_hedging():
+    retrier = Retrier(deadline=0.2)
+    release = threading.Event()
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        retrier.call(lambda: release.wait(5))
+    release.set()
+    assert time.monotonic() - start < 1
+    assert retrier.stats()["deadline_exceeded"] == 1
+
+
+def test_no_upstream_call_after_deadline_on_saturated_limiter():
+    limiter, held = _saturated_limiter()
+    calls = []
+
+    def upstream():
+        with limiter.slot():
+            calls.append(time.monotonic())
+
+    retrier = Retrier(deadline=0.2)
+    with pytest.raises(DeadlineExceeded):
+        retrier.call(upstream)
+
+    # The abandoned attempt must have left the queue: freeing the slot now
+    # must not let it through to make a call nobody waits for
+    limiter.release(priority=held)
+    time.sleep(0.2)
+    assert calls == []
+    snapshot = limiter.snapshot()
+    assert snapshot["queue_depth"] == 0
+    assert snapshot["in_flight"] == 0
+    assert snapshot["abandoned"] == 1
+
+
+def test_retries_transient_errors_then_succeeds():
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise _Error(503)
+        return "ok"
+
+    retrier = Retrier(deadline=30)
+    retrier.policies["overload"] = retrier.policies["overload"].__class__(5, 0.01, 0.02)
+    assert retrier.call(flaky) == "ok"
+    assert len(attempts) == 3
+    assert retrier.stats()["retries"] == 2
+
+
+def test_does_not_retry_bad_requests():
+    attempts = []
+
+    def bad():
+        attempts.append(1)
+        raise _Error(400)
+
+    with pytest.raises(_Error):
+        Retrier(deadline=5).call(bad)
+    assert len(attempts) == 1
+
+
+def _primed_hedger(**kwargs) -> Retrier:
+    """A retrier that hedges after 50ms, with latency samples and tokens to spend."""
+    retrier = Retrier(
+        deadline=5,
+        hedge=HedgePolicy(percentile=0.5, min_delay=0.05, budget_ratio=1.0, min_samples=1),
+        **kwargs,
+    )
+    retrier._latencies.add(0.01)
+    retrier._hedge_tokens = 5
+    return retrier
+
+
+def test_hedges_slow_primary():
+    retrier = _primed_hedger()
+    calls = []
+
+    def call():
+        calls.append(1)
+        if len(calls) == 1:
+            time.sleep(0.5)
+            return "primary"
+        return "hedge"
+
+    assert retrier.call(call) == "hedge"
+    assert retrier.stats()["hedges"] == 1
+    assert retrier.stats()["hedge_wins"] == 1
+
+
+def test_no_hedge_while_limiter_is_busy():
+    retrier = _primed_hedger(busy=lambda: True)
+    calls = []
+
+    def call():
+        calls.append(1)
+        time.sleep(0.2)
+        return "primary"
+
+    assert retrier.call(call) == "primary"
+    assert retrier.stats()["hedges"] == 0
+    assert len(calls) == 1
+
+
+def test_hedge_delay_ignores_queueing_for_a_slot():
+    limiter, held = _saturated_limiter()
+    threading.Timer(0.3, limiter.release, kwargs={"priority": held}).start()
+
+    def upstream():
+        with limiter.slot():
+            return "ok"
+
+    retrier = Retrier(deadline=5, hedge=HedgePolicy(min_samples=1))
+    assert retrier.call(upstream) == "ok"
+    # About 0.3s were spent queueing, but the recorded latency is the upstream call's
+    assert retrier._latencies.percentile(0.5, 1) < 0.1
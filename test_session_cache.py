@@ -0,0 +1,95 @@
+"""
+Tests for session_cache.SessionPayloadCache
+"""
+
+from google.genai.types import Image
+from PIL import Image as PIL_Image
+
+from session_cache import SessionPayloadCache, pixel_digest
+
+
+def _photo(colour=(200, 30, 30)) -> PIL_Image.Image:
+    return PIL_Image.new("RGB", (32, 40), colour)
+
+
+class _Prepare:
+    """Counting stand-in for VirtualTryOn.prepare_input with fixed-size payloads."""
+
+    def __init__(self, size: int = 100):
+        self.size = size
+        self.calls = 0
+
+    def __call__(self, img: PIL_Image.Image) -> Image:
+        self.calls += 1
+        return Image(image_bytes=b"x" * self.size, mime_type="image/jpeg")
+
+
+def test_digest_follows_pixels_not_objects():
+    assert pixel_digest(_photo()) == pixel_digest(_photo())
+    assert pixel_digest(_photo()) != pixel_digest(_photo((0, 0, 0)))
+
+
+def test_payload_is_prepared_once_per_session():
+    cache = SessionPayloadCache(max_bytes=10_000, per_session=4)
+    prepare = _Prepare()
+
+    first = cache.get_or_prepare("alice", _photo(), prepare)
+    # Gradio passes a new PIL image on every click
+    assert cache.get_or_prepare("alice", _photo(), prepare) is first
+    cache.get_or_prepare("bob", _photo(), prepare)
+    assert prepare.calls == 2
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["sessions"] == 2
+
+
+def test_drop_on_unload_frees_the_session():
+    cache = SessionPayloadCache(max_bytes=10_000, per_session=4)
+    prepare = _Prepare(size=100)
+    cache.get_or_prepare("alice", _photo(), prepare)
+    cache.get_or_prepare("alice", _photo((0, 0, 0)), prepare)
+    cache.get_or_prepare("bob", _photo(), prepare)
+
+    cache.drop("alice")
+    stats = cache.stats()
+    assert stats["entries"] == 1
+    assert stats["bytes"] == 100
+    assert stats["sessions"] == 1
+
+    cache.get_or_prepare("alice", _photo(), prepare)
+    assert prepare.calls == 4
+
+
+def test_per_session_limit_evicts_that_sessions_oldest():
+    cache = SessionPayloadCache(max_bytes=10_000, per_session=2)
+    prepare = _Prepare()
+    cache.get_or_prepare("bob", _photo((9, 9, 9)), prepare)
+    for colour in ((1, 0, 0), (2, 0, 0), (3, 0, 0)):
+        cache.get_or_prepare("alice", _photo(colour), prepare)
+
+    assert cache.stats()["entries"] == 3
+    assert cache.stats()["evictions"] == 1
+    calls = prepare.calls
+    cache.get_or_prepare("bob", _photo((9, 9, 9)), prepare)
+    cache.get_or_prepare("alice", _photo((3, 0, 0)), prepare)
+    assert prepare.calls == calls
+    cache.get_or_prepare("alice", _photo((1, 0, 0)), prepare)
+    assert prepare.calls == calls + 1
+
+
+def test_byte_budget_evicts_least_recently_used():
+    cache = SessionPayloadCache(max_bytes=250, per_session=4)
+    prepare = _Prepare(size=100)
+    cache.get_or_prepare("alice", _photo(), prepare)
+    cache.get_or_prepare("bob", _photo(), prepare)
+    # Touch alice so bob is the least recently used
+    cache.get_or_prepare("alice", _photo(), prepare)
+    cache.get_or_prepare("carol", _photo(), prepare)
+
+    stats = cache.stats()
+    assert stats["bytes"] == 200
+    assert stats["evictions"] == 1
+    calls = prepare.calls
+    cache.get_or_prepare("alice", _photo(), prepare)
+    assert prepare.calls == calls
+    cache.get_or_prepare("bob", _photo(), prepare)
+    assert prepare.calls == calls + 1
@@ -0,0 +1,90 @@
+"""
+Tests for singleflight.SingleFlight
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from backends import FakeBackend
+from singleflight import SingleFlight
+
+
+def test_concurrent_callers_share_one_call():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "result"
+
+    with ThreadPoolExecutor(4) as pool:
+        leader = pool.submit(flight.do, "key", slow)
+        started.wait(5)
+        followers = [pool.submit(flight.do, "key", slow) for _ in range(3)]
+        while flight.stats()["coalesced"] < 3:
+            time.sleep(0.001)
+        release.set()
+        results = [leader.result()] + [f.result() for f in followers]
+
+    assert results == ["result"] * 4
+    assert len(calls) == 1
+    assert flight.stats() == {"calls": 1, "coalesced": 3, "in_flight": 0}
+
+
+def test_errors_are_shared_and_forgotten():
+    flight = SingleFlight()
+
+    def boom():
+        raise RuntimeError("upstream failed")
+
+    with pytest.raises(RuntimeError):
+        flight.do("key", boom)
+    # The key is free again once the call is over
+    assert flight.do("key", lambda: 42) == 42
+
+
+def test_different_keys_do_not_coalesce():
+    flight = SingleFlight()
+    assert [flight.do(k, lambda k=k: k) for k in "ab"] == ["a", "b"]
+    assert flight.stats()["coalesced"] == 0
+
+
+def test_async_waiters_survive_leader_cancellation():
+    flight = SingleFlight()
+    calls = []
+
+    async def slow():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "result"
+
+    async def main():
+        leader = asyncio.ensure_future(flight.do_async("key", slow))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.do_async("key", slow))
+        await asyncio.sleep(0)
+        leader.cancel()
+        return await follower
+
+    assert asyncio.run(main()) == "result"
+    assert len(calls) == 1
+
+
+def test_identical_try_ons_reach_the_backend_once(make_vto, make_jpeg):
+    backend = FakeBackend(latency_median=0.1, latency_sigma=0.01, error_rate=0, quota_rpm=0)
+    vto = make_vto(backend=backend)
+    person, garment = make_jpeg(), make_jpeg((0, 50, 100))
+
+    with ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(
+            lambda _: vto.try_on_single_item(person, garment, return_type="bytes"), range(4)
+        ))
+    assert all(result == results[0] for result in results)
+    assert backend.stats()["calls"] == 1
@@ -0,0 +1,65 @@
+"""
+Tests for startup.LazyInit, startup phases and import-time side effects
+"""
+
+import shutil
+import subprocess
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+import startup
+
+
+def test_lazy_init_builds_once_in_the_background():
+    release = threading.Event()
+    builds = []
+
+    def build():
+        builds.append(threading.current_thread().name)
+        release.wait(5)
+        return object()
+
+    lazy = startup.LazyInit("test_client", build)
+    lazy.start()
+    lazy.start()
+    assert not lazy.done()
+    release.set()
+    value = lazy.get(5)
+    assert lazy.get() is value
+    assert builds == ["vto-init-test_client"]
+    assert "test_client_ready" in startup.phases()
+
+
+def test_lazy_init_reraises_build_errors():
+    def build():
+        raise RuntimeError("no credentials")
+
+    lazy = startup.LazyInit("test_broken", build)
+    with pytest.raises(RuntimeError, match="no credentials"):
+        lazy.get(5)
+    assert lazy.done()
+    assert "test_broken_failed" in startup.phases()
+
+
+def test_get_without_start_builds_on_demand():
+    assert startup.LazyInit("test_on_demand", lambda: 42).get(5) == 42
+
+
+def test_importing_config_creates_no_directories(tmp_path):
+    shutil.copy(Path(__file__).with_name("config.py"), tmp_path / "config.py")
+    subprocess.run([sys.executable, "-c", "import config"], cwd=tmp_path, check=True)
+    assert sorted(p.name for p in tmp_path.iterdir() if p.name != "__pycache__") == ["config.py"]
+
+    subprocess.run([sys.executable, "-c", "import config; config.ensure_directories()"], cwd=tmp_path, check=True)
+    assert (tmp_path / "output_images").is_dir()
+    assert (tmp_path / "input_images" / "person").is_dir()
+
+
+def test_import_profile():
+    profile = startup.import_profile("metrics")
+    assert profile["module"] == "metrics"
+    assert profile["total"] > 0
+    assert "metrics" in profile["packages"]
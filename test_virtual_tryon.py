@@ -0,0 +1,119 @@
+"""
+Tests for virtual_tryon.VirtualTryOn against the fake backend
+"""
+
+import io
+
+import pytest
+from google.genai.types import Image
+from PIL import Image as PIL_Image
+
+from virtual_tryon import describe_image, load_image
+
+
+def test_load_image_accepts_in_memory_sources(tmp_path, make_jpeg):
+    data = make_jpeg()
+    path = tmp_path / "person.jpg"
+    path.write_bytes(data)
+
+    for source in (data, bytearray(data), memoryview(data), str(path), path):
+        image = load_image(source)
+        assert image.image_bytes == data
+        assert image.mime_type == "image/jpeg"
+
+    decoded = load_image(PIL_Image.open(io.BytesIO(data)))
+    assert decoded.mime_type == "image/png"
+    assert PIL_Image.open(io.BytesIO(decoded.image_bytes)).size == (64, 80)
+
+    assert load_image("gs://bucket/person.jpg").gcs_uri == "gs://bucket/person.jpg"
+    ready = Image(image_bytes=data, mime_type="image/jpeg")
+    assert load_image(ready) is ready
+
+
+def test_describe_image_never_dumps_bytes(make_jpeg):
+    assert describe_image(make_jpeg()).endswith("bytes>")
+    assert describe_image(PIL_Image.new("RGB", (3, 4))) == "<PIL image 3x4>"
+
+
+def test_in_memory_inputs_match_file_inputs(tmp_path, make_vto, make_jpeg):
+    person, garment = make_jpeg((10, 20, 30)), make_jpeg((90, 60, 30))
+    (tmp_path / "person.jpg").write_bytes(person)
+    (tmp_path / "garment.jpg").write_bytes(garment)
+    vto = make_vto()
+
+    from_files = vto.try_on_single_item(
+        str(tmp_path / "person.jpg"), str(tmp_path / "garment.jpg"), return_type="bytes"
+    )
+    from_memory = vto.try_on_single_item(person, memoryview(garment), return_type="bytes")
+    assert from_files == from_memory
+
+
+class _RecordingSink:
+    def __init__(self):
+        self.saved = []
+
+    def save(self, image_bytes, name, metadata=None):
+        self.saved.append((image_bytes, name, metadata))
+        return f"memory://{name}"
+
+
+def test_in_memory_results_are_not_written(make_vto, make_jpeg, fake_backend):
+    vto = make_vto()
+    person, garment = make_jpeg(), make_jpeg((0, 0, 200))
+
+    encoded = vto.try_on_single_item(person, garment, number_of_images=2, return_type="bytes")
+    decoded = vto.try_on_single_item(person, garment, number_of_images=2, return_type="pil")
+
+    assert len(encoded) == 2 and all(isinstance(data, bytes) for data in encoded)
+    assert [img.tobytes() for img in decoded] == [
+        PIL_Image.open(io.BytesIO(data)).tobytes() for data in encoded
+    ]
+    # No sink and no "path" result: the default writer is never created
+    assert vto._writer is None
+
+
+def test_sink_receives_the_api_bytes(make_vto, make_jpeg):
+    sink = _RecordingSink()
+    vto = make_vto(sink=sink)
+
+    images = vto.try_on_single_item(make_jpeg(), make_jpeg((0, 200, 0)), return_type="bytes")
+    assert [saved[0] for saved in sink.saved] == images
+    metadata = sink.saved[0][2]
+    assert metadata["mime_type"] == "image/jpeg"
+    assert metadata["index"] == 0
+    assert {"person_digest", "garment_digest", "model"} <= set(metadata)
+
+
+def test_path_results_exist_on_return(tmp_path, make_vto, make_jpeg):
+    vto = make_vto()
+    output = tmp_path / "result.jpeg"
+
+    paths = vto.try_on_single_item(
+        make_jpeg(), make_jpeg((0, 0, 90)), output_path=str(output), number_of_images=2
+    )
+    assert paths == [str(output), str(tmp_path / "result_1.jpeg")]
+    assert all(PIL_Image.open(path).size for path in paths)
+
+
+def test_unknown_return_type_is_rejected(make_vto, make_jpeg, fake_backend):
+    with pytest.raises(ValueError):
+        make_vto().try_on_single_item(make_jpeg(), make_jpeg(), return_type="numpy")
+    assert fake_backend.stats()["calls"] == 0
+
+
+def test_multi_item_steps_stream_as_they_finish(make_vto, make_jpeg, fake_backend):
+    vto = make_vto()
+    person = make_jpeg()
+    garments = [make_jpeg((0, 90, 0)), make_jpeg((0, 0, 90)), make_jpeg((90, 90, 0))]
+
+    steps = vto.iter_multiple_items(person, garments, return_type="bytes")
+    first = next(steps)
+    # Later garments are not tried on until the caller asks for them
+    assert fake_backend.stats()["calls"] == 1
+    rest = list(steps)
+    assert len(rest) == 2
+    assert fake_backend.stats()["calls"] == 3
+
+    # Each step dresses the previous step's output, not the original photo
+    assert vto.try_on_single_item(first[0], garments[1], return_type="bytes") == rest[0]
+    assert vto.try_on_single_item(person, garments[1], return_type="bytes") != rest[0]
@@ -3,12 +3,15 @@ Virtual Try-On using Google Vertex AI
 Demonstrates how to use Google's Virtual Try-On model to generate images of people wearing clothing items.
 """
 
+import hashlib
+import io
+import os
 import sys
 from pathlib import Path
 from datetime import datetime
-from typing import Optional
+from typing import Iterable, Iterator, Optional, Union
+from uuid import uuid4
 
-from google import genai
 from google.genai.types import (
     Image,
     ProductImage,
@@ -16,213 +19,838 @@ from google.genai.types import (
     RecontextImageSource,
 )
 from PIL import Image as PIL_Image
-from PIL import ImageOps as PIL_ImageOps
 
 import config
+import metrics
+import rate_limiter
+from backends import Backend, FakeBackend
+from client_pool import ClientPool, Endpoint
+from garment_catalog import GarmentCatalog
+from image_preprocess import ImagePreprocessor
+from image_staging import ImageStaging
+from outfit_cache import OutfitPrefixCache, chain_keys, image_digest
+from output_sinks import BackgroundWriter, OutputSink
+from rate_limiter import PRIORITIES, AdaptiveLimiter, default_limiter
+from result_cache import ResultCache, make_key
+from retries import HedgePolicy, Retrier
+from singleflight import SingleFlight
+
+# What the try-on methods can hand back: saved file paths, encoded bytes or PIL images
+RETURN_TYPES = ("path", "bytes", "pil")
+
+
+# Anything the try-on methods accept as an input image: a local path or gs://
+# URI, raw encoded bytes, a decoded PIL image, or a ready-made genai Image.
+ImageSource = Union[str, Path, bytes, bytearray, memoryview, PIL_Image.Image, Image]
+
+
+def load_image(source: ImageSource) -> Image:
+    """Turn any supported image source into a genai Image without touching disk.
+
+    Encoded bytes are passed through as-is; PIL images are encoded once in
+    memory. Only paths are read from the filesystem.
+    """
+    if isinstance(source, Image):
+        return source
+
+    if isinstance(source, PIL_Image.Image):
+        buffer = io.BytesIO()
+        source.save(buffer, format="PNG")
+        return Image(image_bytes=buffer.getvalue(), mime_type="image/png")
+
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        data = bytes(source)
+        # Only the header is parsed; the pixel data is not decoded
+        with PIL_Image.open(io.BytesIO(data)) as probe:
+            mime_type = PIL_Image.MIME.get(probe.format, "image/png")
+        return Image(image_bytes=data, mime_type=mime_type)
+
+    location = str(source)
+    if location.startswith("gs://"):
+        return Image(gcs_uri=location)
+    return Image.from_file(location=location)
+
+
+def _output_stamp() -> str:
+    """Timestamp plus a random suffix, so outputs of one second don't collide."""
+    return f"{datetime.now():%Y%m%d_%H%M%S}_{uuid4().hex[:8]}"
+
+
+def describe_image(source: ImageSource) -> str:
+    """Short human-readable description of an image source for log output."""
+    if isinstance(source, (str, Path)):
+        return str(source)
+    if isinstance(source, PIL_Image.Image):
+        return f"<PIL image {source.width}x{source.height}>"
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return f"<{len(source)} bytes>"
+    return source.gcs_uri or f"<{len(source.image_bytes or b'')} bytes>"
 
 
 class VirtualTryOn:
     """Virtual Try-On class for managing try-on operations."""
 
-    def __init__(self, project_id: Optional[str] = None, location: Optional[str] = None):
+    def __init__(
+        self,
+        project_id: Optional[str] = None,
+        location: Optional[str] = None,
+        cache: Optional[ResultCache] = None,
+        sink: Optional[OutputSink] = None,
+        preprocessor: Optional[ImagePreprocessor] = None,
+        outfit_cache: Optional[OutfitPrefixCache] = None,
+        limiter: Optional[AdaptiveLimiter] = None,
+        retrier: Optional[Retrier] = None,
+        pool: Optional[ClientPool] = None,
+        single_flight: Optional[SingleFlight] = None,
+        backend: Optional[Backend] = None,
+        staging: Optional[ImageStaging] = None,
+        catalog: Optional[GarmentCatalog] = None,
+        priority: Optional[str] = None,
+        write_behind: bool = False
+    ):
         """Initialize the Virtual Try-On client.
 
         Args:
             project_id: Google Cloud Project ID
             location: Google Cloud region (default: us-central1)
+            cache: Optional result cache; identical single-item requests are served from it
+            sink: Optional default sink that persists generated images
+            preprocessor: Optional input normalization (EXIF transpose, resize,
+                re-encode) applied to person and garment images before upload
+            outfit_cache: Optional memo of multi-item chain intermediates; chains
+                resume from the longest previously generated garment prefix
+            limiter: Rate limiter for API calls (default: the process-wide limiter
+                shared by every VirtualTryOn, so UI, batch and GCS calls draw
+                from the same quota). Left as None when a ``pool`` or
+                config.ENDPOINTS is used: each endpoint then has its own
+                limiter (see ClientPool.limiters)
+            retrier: Retry/hedging policy for API calls (default: retries with
+                config.REQUEST_DEADLINE_SECONDS, hedging if config.HEDGE_REQUESTS
+                except while every endpoint's limiter has callers waiting)
+            pool: Endpoints to spread calls over (default: config.ENDPOINTS if
+                set and no project_id is given, else a single endpoint for
+                project_id/location using ``limiter``)
+            single_flight: Coalescer for identical concurrent requests
+                (default: one per VirtualTryOn, shared with AsyncVirtualTryOn)
+            backend: Service client to call instead of Vertex AI, e.g. a
+                FakeBackend for offline load tests (default: a FakeBackend if
+                config.BACKEND is "fake"); no project ID is needed then
+            staging: Upload-once staging of person and garment images
+                (default: config.STAGING_URI if set); staged images are sent
+                by URI instead of inline
+            catalog: Pack of preprocessed garments (default: config.CATALOG_PATH
+                if it exists); garment paths found in it are sent from the pack
+                without being read, decoded or re-encoded
+            priority: Priority class of this client's calls on the shared
+                limiter: "interactive", "near_line" or "bulk" (default:
+                config.DEFAULT_PRIORITY); a rate_limiter.priority() block
+                around a call takes precedence
+            write_behind: Return "path" results as soon as their writes are
+                queued instead of once the files are on disk; callers must
+                then call flush() before reading them
         """
         self.project_id = project_id or config.PROJECT_ID
         self.location = location or config.LOCATION
-
-        if not self.project_id:
-            raise ValueError(
-                "Project ID not set. Please set GOOGLE_CLOUD_PROJECT environment variable "
-                "or pass project_id parameter."
-            )
+        self.cache = cache
+        self.sink = sink
+        self.preprocessor = preprocessor
+        self.outfit_cache = outfit_cache
+        self.limiter: Optional[AdaptiveLimiter] = None
+
+        self.single_flight = single_flight or SingleFlight()
+        # Writes "path" results when no sink is given; created on first use
+        self._writer: Optional[BackgroundWriter] = None
+        if staging is None and config.STAGING_URI:
+            staging = ImageStaging.from_uri(config.STAGING_URI)
+        self.staging = staging
+        self.catalog = catalog or GarmentCatalog.open()
+        if priority is not None and priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority {priority!r}; use {', '.join(PRIORITIES)}")
+        self.priority = priority
+        self.write_behind = write_behind
 
         print(f"Initializing Virtual Try-On client...")
-        print(f"Project: {self.project_id}")
-        print(f"Location: {self.location}")
+        if backend is None and config.BACKEND == "fake":
+            backend = FakeBackend()
+        if pool is None and backend is not None:
+            print(f"Backend: {type(backend).__name__}")
+            self.limiter = limiter or default_limiter()
+            pool = ClientPool([Endpoint(
+                self.project_id or "local", self.location, limiter=self.limiter, backend=backend
+            )])
+        if pool is None and config.ENDPOINTS and not project_id:
+            pool = ClientPool.from_spec(config.ENDPOINTS)
+        if pool is None:
+            if not self.project_id:
+                raise ValueError(
+                    "Project ID not set. Please set GOOGLE_CLOUD_PROJECT environment variable "
+                    "or pass project_id parameter."
+                )
+            print(f"Project: {self.project_id}")
+            print(f"Location: {self.location}")
+            self.limiter = limiter or default_limiter()
+            pool = ClientPool([Endpoint(self.project_id, self.location, limiter=self.limiter)])
+        else:
+            print(f"Endpoints: {', '.join(endpoint.name for endpoint in pool.endpoints)}")
 
-        self.client = genai.Client(
-            vertexai=True,
-            project=self.project_id,
-            location=self.location
+        self.pool = pool
+        self.retrier = retrier or Retrier(
+            hedge=HedgePolicy(budget_ratio=config.HEDGE_BUDGET_RATIO) if config.HEDGE_REQUESTS else None,
+            busy=pool.busy,
         )
+        # Client of the primary endpoint, for callers that use it directly
+        self.client = pool.endpoints[0].client
         print("Client initialized successfully!\n")
 
+    def warm(self) -> bool:
+        """Pre-warm the API connection so no request pays for auth or handshakes.
+
+        Fetches access tokens and opens a pooled connection to every endpoint,
+        then keeps both fresh from a background thread (see
+        ClientPool.start_keep_warm). Blocks until warming finishes.
+
+        Returns:
+            ready()
+        """
+        ready = self.pool.warm()
+        self.pool.start_keep_warm()
+        return ready
+
+    def ready(self) -> bool:
+        """True once at least one endpoint has been warmed."""
+        return self.pool.ready()
+
+    @property
+    def writer(self) -> BackgroundWriter:
+        """Background writer for "path" results (config.OUTPUT_FORMAT/OUTPUT_QUALITY)."""
+        if self._writer is None:
+            self._writer = BackgroundWriter(config.OUTPUT_DIR)
+        return self._writer
+
+    def flush(self, paths: Optional[Iterable[str]] = None, timeout: Optional[float] = None) -> None:
+        """Wait until returned output paths are on disk.
+
+        With ``write_behind``, "path" results are returned before their files
+        are written; call this before reading them. Waits for ``paths`` (default:
+        every pending write) of the default writer and of the default sink if
+        that writes in the background (a BackgroundWriter or OutputStore),
+        and raises the first write error.
+        """
+        for writer in (self._writer, self.sink):
+            wait = getattr(writer, "wait", None)
+            if wait is not None:
+                wait(paths, timeout)
+
+    @metrics.instrument("single")
     def try_on_single_item(
         self,
-        person_image_path: str,
-        clothing_image_path: str,
+        person_image_path: ImageSource,
+        clothing_image_path: ImageSource,
         output_path: Optional[str] = None,
         number_of_images: int = 1,
-        safety_filter_level: str = "BLOCK_LOW_AND_ABOVE"
+        safety_filter_level: str = "BLOCK_LOW_AND_ABOVE",
+        return_type: str = "path",
+        sink: Optional[OutputSink] = None
     ) -> list:
         """Try on a single clothing item.
 
         Args:
-            person_image_path: Path to the person image
-            clothing_image_path: Path to the clothing item image
+            person_image_path: Path to the person image, or the image itself
+                (PIL image, encoded bytes or memoryview)
+            clothing_image_path: Path to the clothing item image, or the image itself
             output_path: Optional output path for the generated image
             number_of_images: Number of images to generate (1-4)
             safety_filter_level: Safety filter level
+            return_type: "path" to save and return file paths (the files
+                exist on return unless ``write_behind`` is set; their extension
+                follows config.OUTPUT_FORMAT when that re-encodes), "bytes" for
+                the encoded images or "pil" for decoded PIL images
+            sink: Optional sink that persists the images (default: self.sink;
+                without one, only "path" mode writes to disk)
 
         Returns:
             List of generated images
         """
+        self._check_return_type(return_type)
         print(f"Processing try-on:")
-        print(f"  Person: {person_image_path}")
-        print(f"  Clothing: {clothing_image_path}")
-
-        response = self.client.models.recontext_image(
-            model=config.VIRTUAL_TRY_ON_MODEL,
-            source=RecontextImageSource(
-                person_image=Image.from_file(location=person_image_path),
-                product_images=[
-                    ProductImage(product_image=Image.from_file(location=clothing_image_path))
-                ],
-            ),
-            config=RecontextImageConfig(
-                output_mime_type=config.DEFAULT_OUTPUT_FORMAT,
-                number_of_images=number_of_images,
-                safety_filter_level=safety_filter_level,
-            ),
+        print(f"  Person: {describe_image(person_image_path)}")
+        print(f"  Clothing: {describe_image(clothing_image_path)}")
+
+        person_image = self._prepare_input(person_image_path)
+        clothing_image = self._prepare_input(clothing_image_path, garment=True)
+        images = self._try_on(person_image, clothing_image, number_of_images, safety_filter_level)
+        return self._deliver(
+            images, output_path, "tryon", return_type, sink, safety_filter_level,
+            inputs=(person_image, clothing_image, person_image),
         )
 
-        # Save the generated images
-        generated_images = []
-        for idx, generated_image in enumerate(response.generated_images):
-            if output_path:
-                save_path = output_path
-            else:
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                save_path = str(config.OUTPUT_DIR / f"tryon_{timestamp}_{idx}.jpeg")
-
-            generated_image.image.save(save_path)
-            generated_images.append(save_path)
-            print(f"  Saved: {save_path}")
-
-        return generated_images
-
     def try_on_multiple_items(
         self,
-        person_image_path: str,
-        clothing_items: list[str],
+        person_image_path: ImageSource,
+        clothing_items: list[ImageSource],
         output_prefix: Optional[str] = None,
         number_of_images: int = 1,
-        safety_filter_level: str = "BLOCK_LOW_AND_ABOVE"
+        safety_filter_level: str = "BLOCK_LOW_AND_ABOVE",
+        return_type: str = "path",
+        sink: Optional[OutputSink] = None
     ) -> list:
         """Try on multiple clothing items sequentially.
 
+        Each step's first generated image is handed to the next step in
+        memory; it is never re-read from disk.
+
         Args:
-            person_image_path: Path to the initial person image
-            clothing_items: List of paths to clothing item images
+            person_image_path: Path to the initial person image, or the image itself
+            clothing_items: List of clothing item images (paths or in-memory images)
             output_prefix: Optional prefix for output files
             number_of_images: Number of images to generate per item
             safety_filter_level: Safety filter level
+            return_type: "path", "bytes" or "pil" (see try_on_single_item)
+            sink: Optional sink that persists the images of every step
 
         Returns:
-            List of paths to generated images
+            List of generated images (paths, bytes or PIL images)
+        """
+        all_outputs = []
+        for outputs in self.iter_multiple_items(
+            person_image_path,
+            clothing_items,
+            output_prefix=output_prefix,
+            number_of_images=number_of_images,
+            safety_filter_level=safety_filter_level,
+            return_type=return_type,
+            sink=sink
+        ):
+            all_outputs.extend(outputs)
+
+        print(f"{'='*60}")
+        print(f"Multi-item try-on complete! Generated {len(all_outputs)} images")
+        print(f"{'='*60}\n")
+
+        return all_outputs
+
+    @metrics.instrument("multiple")
+    def iter_multiple_items(
+        self,
+        person_image_path: ImageSource,
+        clothing_items: list[ImageSource],
+        output_prefix: Optional[str] = None,
+        number_of_images: int = 1,
+        safety_filter_level: str = "BLOCK_LOW_AND_ABOVE",
+        return_type: str = "path",
+        sink: Optional[OutputSink] = None
+    ) -> Iterator[list]:
+        """Streaming form of try_on_multiple_items.
+
+        Yields each step's generated images as soon as that step finishes,
+        so callers can show the first garment while the rest are still
+        being tried on. Arguments are the same as for try_on_multiple_items.
+
+        Yields:
+            One list of generated images per clothing item, in order
         """
+        self._check_return_type(return_type)
         print(f"\n{'='*60}")
         print(f"Starting multi-item try-on with {len(clothing_items)} items")
         print(f"{'='*60}\n")
 
-        current_person_image = person_image_path
-        all_outputs = []
+        person_image = current_person_image = self._prepare_input(person_image_path)
+        clothing_images = [self._prepare_input(clothing_item, garment=True) for clothing_item in clothing_items]
+
+        keys = None
+        cached_steps = []
+        if self.outfit_cache is not None:
+            keys = self._chain_keys(
+                current_person_image, clothing_images, number_of_images, safety_filter_level
+            )
+            cached_steps = self.outfit_cache.longest_prefix(keys)
+            if cached_steps:
+                print(f"Resuming after {len(cached_steps)} cached step(s)\n")
 
-        for idx, clothing_item in enumerate(clothing_items, 1):
-            print(f"[{idx}/{len(clothing_items)}] Trying on: {Path(clothing_item).name}")
+        for idx, (clothing_item, clothing_image) in enumerate(zip(clothing_items, clothing_images), 1):
+            print(f"[{idx}/{len(clothing_items)}] Trying on: {describe_image(clothing_item)}")
 
-            if output_prefix:
-                output_path = f"{output_prefix}_item{idx}.jpeg"
+            if idx <= len(cached_steps):
+                images = cached_steps[idx - 1]
             else:
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                output_path = str(config.OUTPUT_DIR / f"multi_tryon_{timestamp}_item{idx}.jpeg")
-
-            outputs = self.try_on_single_item(
-                person_image_path=current_person_image,
-                clothing_image_path=clothing_item,
-                output_path=output_path,
-                number_of_images=number_of_images,
-                safety_filter_level=safety_filter_level
+                images = self._try_on(
+                    current_person_image, clothing_image, number_of_images, safety_filter_level,
+                    stage_person=current_person_image is person_image,
+                )
+                if keys is not None:
+                    self.outfit_cache.put(keys[idx - 1], images)
+
+            outputs = self._deliver(
+                images,
+                self._chain_output_path(output_prefix, idx),
+                "multi_tryon",
+                return_type,
+                sink,
+                safety_filter_level,
+                inputs=(current_person_image, clothing_image, person_image),
             )
 
             # Use the output of this try-on as input for the next one
-            current_person_image = outputs[0]
-            all_outputs.extend(outputs)
+            current_person_image = images[0]
             print()
+            yield outputs
 
-        print(f"{'='*60}")
-        print(f"Multi-item try-on complete! Generated {len(all_outputs)} images")
+    @metrics.instrument("outfits")
+    def try_on_outfits(
+        self,
+        person_image_path: ImageSource,
+        outfits: list[list[ImageSource]],
+        output_prefix: Optional[str] = None,
+        number_of_images: int = 1,
+        safety_filter_level: str = "BLOCK_LOW_AND_ABOVE",
+        return_type: str = "path",
+        sink: Optional[OutputSink] = None
+    ) -> list[list]:
+        """Try on many outfits for one person with as few API calls as possible.
+
+        The outfits are arranged in a trie of garment sequences and walked
+        depth first, so every distinct prefix (e.g. the shared top and
+        bottom of outfits that only differ in shoes) is generated exactly
+        once. With an outfit cache, prefixes generated by earlier calls are
+        reused as well.
+
+        Args:
+            person_image_path: Path to the person image, or the image itself
+            outfits: Garment sequences, each tried on in order
+            output_prefix: Optional prefix for output files
+            number_of_images: Number of images to generate per step
+            safety_filter_level: Safety filter level
+            return_type: "path", "bytes" or "pil" (see try_on_single_item)
+            sink: Optional sink that persists the images of every step
+
+        Returns:
+            One list of generated images per outfit, in the same order and
+            shape as try_on_multiple_items would return
+        """
+        self._check_return_type(return_type)
+        person_image = self._prepare_input(person_image_path)
+
+        # Prepare each distinct garment once, even if it appears in many outfits
+        prepared = {}
+        outfit_images = []
+        for outfit in outfits:
+            images = []
+            for clothing_item in outfit:
+                if isinstance(clothing_item, (str, Path)):
+                    source_id = str(clothing_item)
+                else:
+                    source_id = id(clothing_item)
+                if source_id not in prepared:
+                    prepared[source_id] = self._prepare_input(clothing_item, garment=True)
+                images.append(prepared[source_id])
+            outfit_images.append(images)
+
+        # Trie of chain keys; the None entry lists the outfits ending at a node
+        trie = {}
+        for outfit_idx, images in enumerate(outfit_images):
+            node = trie
+            keys = self._chain_keys(person_image, images, number_of_images, safety_filter_level)
+            for key, clothing_image in zip(keys, images):
+                node = node.setdefault(key, (clothing_image, {}))[1]
+            node.setdefault(None, []).append(outfit_idx)
+
+        print(f"\n{'='*60}")
+        print(f"Trying on {len(outfits)} outfits ({self._count_steps(trie)} distinct steps)")
         print(f"{'='*60}\n")
 
-        return all_outputs
+        results = [None] * len(outfits)
+
+        def walk(node: dict, current_person_image: Image, step_outputs: list) -> None:
+            for key, child in node.items():
+                if key is None:
+                    for outfit_idx in child:
+                        results[outfit_idx] = [
+                            output for outputs in step_outputs for output in outputs
+                        ]
+                    continue
+
+                clothing_image, children = child
+                images = self.outfit_cache.get(key) if self.outfit_cache is not None else None
+                if images is None:
+                    images = self._try_on(
+                        current_person_image, clothing_image, number_of_images, safety_filter_level,
+                        stage_person=current_person_image is person_image,
+                    )
+                    if self.outfit_cache is not None:
+                        self.outfit_cache.put(key, images)
+
+                depth = len(key) - 1
+                outputs = self._deliver(
+                    images,
+                    self._outfit_output_path(output_prefix, key, depth),
+                    "outfit",
+                    return_type,
+                    sink,
+                    safety_filter_level,
+                    inputs=(current_person_image, clothing_image, person_image),
+                )
+                walk(children, images[0], step_outputs + [outputs])
+
+        walk(trie, person_image, [])
+        return results
+
+    def _count_steps(self, trie: dict) -> int:
+        return sum(
+            1 + self._count_steps(child[1]) for key, child in trie.items() if key is not None
+        )
 
+    @metrics.instrument("gcs")
     def try_on_from_gcs(
         self,
-        person_image_path: str,
+        person_image_path: ImageSource,
         clothing_gcs_uri: str,
         output_path: Optional[str] = None,
         number_of_images: int = 1,
-        safety_filter_level: str = "BLOCK_LOW_AND_ABOVE"
+        safety_filter_level: str = "BLOCK_LOW_AND_ABOVE",
+        return_type: str = "path",
+        sink: Optional[OutputSink] = None
     ) -> list:
         """Try on a clothing item from Google Cloud Storage.
 
         Args:
-            person_image_path: Path to the person image (local or GCS)
+            person_image_path: Path to the person image (local or GCS), or the image itself
             clothing_gcs_uri: GCS URI of the clothing item (gs://...)
             output_path: Optional output path for the generated image
             number_of_images: Number of images to generate (1-4)
             safety_filter_level: Safety filter level
+            return_type: "path", "bytes" or "pil" (see try_on_single_item)
+            sink: Optional sink that persists the images
 
         Returns:
             List of generated images
         """
+        self._check_return_type(return_type)
         print(f"Processing try-on from GCS:")
-        print(f"  Person: {person_image_path}")
+        print(f"  Person: {describe_image(person_image_path)}")
         print(f"  Clothing GCS URI: {clothing_gcs_uri}")
 
-        # Load person image (could be local or GCS)
-        if person_image_path.startswith("gs://"):
-            person_img = Image(gcs_uri=person_image_path)
-        else:
-            person_img = Image.from_file(location=person_image_path)
-
-        response = self.client.models.recontext_image(
-            model=config.VIRTUAL_TRY_ON_MODEL,
-            source=RecontextImageSource(
-                person_image=person_img,
-                product_images=[
-                    ProductImage(product_image=Image(gcs_uri=clothing_gcs_uri))
-                ],
-            ),
-            config=RecontextImageConfig(
-                output_mime_type=config.DEFAULT_OUTPUT_FORMAT,
-                number_of_images=number_of_images,
-                safety_filter_level=safety_filter_level,
-            ),
+        # Load person image (could be local, GCS or in memory)
+        person_img = self._prepare_input(person_image_path)
+
+        clothing_image = Image(gcs_uri=clothing_gcs_uri)
+        images = self._try_on(person_img, clothing_image, number_of_images, safety_filter_level)
+        return self._deliver(
+            images, output_path, "tryon_gcs", return_type, sink, safety_filter_level,
+            inputs=(person_img, clothing_image, person_img),
+        )
+
+    def prepare_input(self, source: ImageSource, garment: bool = False) -> Image:
+        """Load and preprocess an input once, e.g. to reuse it in many requests.
+
+        The result can be passed back as ``person_image_path`` or a garment;
+        it is sent as is (see ImagePreprocessor's pass-through). Set
+        ``garment`` for garment images so they can come from the catalog.
+        """
+        return self._prepare_input(source, garment)
+
+    def _prepare_input(self, source: ImageSource, garment: bool = False) -> Image:
+        """Load an input image and run it through the preprocessor, if any.
+
+        Only garments (``garment=True``) are looked up in the catalog, so a
+        person photo is never replaced by a catalog entry.
+        """
+        with metrics.stage("load"):
+            if garment and self.catalog is not None and isinstance(source, (str, Path)):
+                # Catalog payloads are already preprocessed
+                image = self.catalog.image(source)
+                if image is not None:
+                    return image
+            if self.preprocessor is None:
+                return load_image(source)
+            if isinstance(source, PIL_Image.Image):
+                # Already decoded; skip the intermediate encode in load_image
+                return self.preprocessor.process(source)
+            return self.preprocessor.process(load_image(source))
+
+    def _recontext(self, **request_kwargs):
+        """Call recontext_image with retries; every attempt (and hedge) is routed
+        through the client pool and takes a slot on its endpoint's limiter."""
+        with rate_limiter.priority(rate_limiter.current_priority(self.priority)):
+            return self.retrier.call(lambda: self.pool.recontext_image(**request_kwargs))
+
+    def _try_on(
+        self,
+        person_image: Image,
+        clothing_image: Image,
+        number_of_images: int,
+        safety_filter_level: str,
+        stage_person: bool = True
+    ) -> list:
+        """Run one try-on request, consulting the result cache first.
+
+        ``stage_person`` is False when the person image is an intermediate
+        chain result, which is used once and not worth staging.
+
+        Returns:
+            Generated google.genai Image objects
+        """
+        cache_key, images = self._cache_lookup(
+            person_image, clothing_image, number_of_images, safety_filter_level
+        )
+        if images is not None:
+            return images
+
+        def generate() -> list:
+            response = self._recontext(
+                **self._request_kwargs(
+                    person_image, clothing_image, number_of_images, safety_filter_level, stage_person
+                )
+            )
+            generated = [generated_image.image for generated_image in response.generated_images]
+            # Stored before the flight ends so late arrivals hit the cache
+            self._cache_store(cache_key, generated)
+            return generated
+
+        # Identical requests already in flight share that call's result
+        return list(self.single_flight.do(
+            self._flight_key(person_image, clothing_image, number_of_images, safety_filter_level),
+            generate,
+        ))
+
+    def _flight_key(
+        self,
+        person_image: Image,
+        clothing_image: Image,
+        number_of_images: int,
+        safety_filter_level: str
+    ) -> tuple:
+        """Identity of a request for single-flight coalescing (covers GCS inputs too)."""
+        return (
+            image_digest(person_image),
+            image_digest(clothing_image),
+            config.VIRTUAL_TRY_ON_MODEL,
+            safety_filter_level,
+            number_of_images,
         )
 
-        # Save the generated images
-        generated_images = []
-        for idx, generated_image in enumerate(response.generated_images):
-            if output_path:
+    def _chain_output_path(self, output_prefix: Optional[str], idx: int) -> str:
+        """Output path for step ``idx`` of a multi-item try-on."""
+        if output_prefix:
+            return f"{output_prefix}_item{idx}.jpeg"
+        return str(config.OUTPUT_DIR / f"multi_tryon_{_output_stamp()}_item{idx}.jpeg")
+
+    def _outfit_output_path(self, output_prefix: Optional[str], key: tuple, depth: int) -> str:
+        """Output path for one trie node; the key hash keeps sibling branches apart."""
+        branch = hashlib.sha256("|".join(key).encode()).hexdigest()[:12]
+        if output_prefix:
+            return f"{output_prefix}_{branch}_item{depth}.jpeg"
+        return str(config.OUTPUT_DIR / f"outfit_{branch}_item{depth}.jpeg")
+
+    def _chain_keys(
+        self,
+        person_image: Image,
+        clothing_images: list,
+        number_of_images: int,
+        safety_filter_level: str
+    ) -> list:
+        """Outfit cache keys for every prefix of a garment chain."""
+        return chain_keys(
+            person_image,
+            clothing_images,
+            config.VIRTUAL_TRY_ON_MODEL,
+            safety_filter_level,
+            number_of_images,
+        )
+
+    def _request_kwargs(
+        self,
+        person_image: Image,
+        clothing_image: Image,
+        number_of_images: int,
+        safety_filter_level: str,
+        stage_person: bool = True
+    ) -> dict:
+        """Build the keyword arguments for a recontext_image call.
+
+        With staging, inputs already uploaded are referenced by URI and new
+        ones are queued for upload.
+        """
+        with metrics.stage("build"):
+            if self.staging is not None:
+                if stage_person:
+                    person_image = self.staging.resolve(person_image)
+                clothing_image = self.staging.resolve(clothing_image)
+            return dict(
+                model=config.VIRTUAL_TRY_ON_MODEL,
+                source=RecontextImageSource(
+                    person_image=person_image,
+                    product_images=[ProductImage(product_image=clothing_image)],
+                ),
+                config=RecontextImageConfig(
+                    output_mime_type=config.DEFAULT_OUTPUT_FORMAT,
+                    number_of_images=number_of_images,
+                    safety_filter_level=safety_filter_level,
+                ),
+            )
+
+    def _cache_lookup(
+        self,
+        person_image: Image,
+        clothing_image: Image,
+        number_of_images: int,
+        safety_filter_level: str
+    ) -> tuple[Optional[str], Optional[list]]:
+        """Look up a request in the result cache.
+
+        Returns:
+            ``(cache_key, images)``; the key is None when caching is disabled
+            and images is None on a miss
+        """
+        if self.cache is None or not (person_image.image_bytes and clothing_image.image_bytes):
+            return None, None
+
+        cache_key = make_key(
+            person_image.image_bytes,
+            clothing_image.image_bytes,
+            config.VIRTUAL_TRY_ON_MODEL,
+            safety_filter_level,
+            number_of_images,
+        )
+        cached = self.cache.get(cache_key)
+        if cached is None:
+            return cache_key, None
+
+        print("  Cache hit")
+        image_bytes_list, mime_type = cached
+        return cache_key, [Image(image_bytes=data, mime_type=mime_type) for data in image_bytes_list]
+
+    def _cache_store(self, cache_key: Optional[str], images: list) -> None:
+        """Store freshly generated images under ``cache_key`` (if caching is enabled)."""
+        if cache_key is None or not images:
+            return
+        if not all(image is not None and image.image_bytes for image in images):
+            # Filtered or URI-only results can't be replayed from the cache
+            return
+        self.cache.put(cache_key, [image.image_bytes for image in images], images[0].mime_type)
+
+    def _check_return_type(self, return_type: str) -> None:
+        if return_type not in RETURN_TYPES:
+            raise ValueError(
+                f"Unknown return_type {return_type!r}; expected one of {', '.join(RETURN_TYPES)}"
+            )
+
+    def _deliver(
+        self,
+        images: list,
+        output_path: Optional[str],
+        name_prefix: str,
+        return_type: str,
+        sink: Optional[OutputSink],
+        safety_filter_level: str,
+        inputs: tuple = ()
+    ) -> list:
+        """Persist generated images (if requested) and convert them to ``return_type``.
+
+        Images go to ``sink`` (or the instance's default sink) when one is set;
+        otherwise "path" mode falls back to writing files next to
+        ``output_path``/OUTPUT_DIR and the in-memory modes write nothing.
+        ``inputs`` is ``(person, garment, original person)`` of this step; their
+        hashes are passed to the sink with the request ID and latency.
+        Unless ``write_behind`` is set, "path" results are returned only once
+        they are on disk.
+        """
+        sink = sink or self.sink
+        paths = None
+        if sink is not None:
+            with metrics.stage("save"):
+                stamp = _output_stamp()
+                request_metadata = {}
+                if inputs:
+                    person_image, clothing_image, source_image = inputs
+                    request_metadata = {
+                        "person_digest": image_digest(person_image),
+                        "garment_digest": image_digest(clothing_image),
+                        "source_digest": image_digest(source_image),
+                    }
+                current = metrics.current_request()
+                if current is not None:
+                    request_metadata.update(
+                        request_id=current["request_id"],
+                        method=current["method"],
+                        latency_seconds=round(current["elapsed_seconds"], 3),
+                    )
+                paths = []
+                for idx, image in enumerate(images):
+                    if output_path:
+                        base = Path(output_path)
+                        name = base.name if idx == 0 else f"{base.stem}_{idx}{base.suffix}"
+                    else:
+                        name = f"{name_prefix}_{stamp}_{idx}.jpeg"
+                    paths.append(sink.save(image.image_bytes, name, {
+                        "model": config.VIRTUAL_TRY_ON_MODEL,
+                        "safety_filter_level": safety_filter_level,
+                        "mime_type": image.mime_type,
+                        "index": idx,
+                        **request_metadata,
+                    }))
+                    print(f"  Saved: {paths[-1]}")
+        elif return_type == "path":
+            with metrics.stage("save"):
+                paths = self._save_images(images, output_path, name_prefix)
+
+        if return_type == "path":
+            if not self.write_behind:
+                # Callers may open the returned files straight away
+                wait = self.writer.wait if sink is None else getattr(sink, "wait", None)
+                if wait is not None:
+                    wait(paths)
+            return paths
+        if return_type == "bytes":
+            return [image.image_bytes for image in images]
+        with metrics.stage("decode"):
+            decoded = [PIL_Image.open(io.BytesIO(image.image_bytes)) for image in images]
+            for img in decoded:
+                # Decode now so the time is attributed here, not to the UI
+                img.load()
+        return decoded
+
+    def _save_images(self, images: list, output_path: Optional[str], name_prefix: str) -> list:
+        """Queue generated images for writing and return their paths.
+
+        The files are written by ``self.writer`` in the background; _deliver()
+        waits for them unless ``write_behind`` is set (see flush()).
+
+        Args:
+            images: Generated google.genai Image objects
+            output_path: Optional output path (extra variations get an ``_<idx>`` suffix);
+                otherwise a unique timestamped name in OUTPUT_DIR is used
+            name_prefix: Prefix for the timestamped file names
+
+        Returns:
+            List of paths the images are written to (the extension follows
+            config.OUTPUT_FORMAT)
+        """
+        # Default paths (including chain and outfit steps) live in OUTPUT_DIR
+        config.ensure_directories()
+        stamp = _output_stamp()
+        saved_paths = []
+        for idx, image in enumerate(images):
+            if output_path and idx == 0:
                 save_path = output_path
+            elif output_path:
+                # Keep extra variations from overwriting the first one
+                base = Path(output_path)
+                save_path = str(base.with_name(f"{base.stem}_{idx}{base.suffix}"))
             else:
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                save_path = str(config.OUTPUT_DIR / f"tryon_gcs_{timestamp}_{idx}.jpeg")
+                save_path = str(config.OUTPUT_DIR / f"{name_prefix}_{stamp}_{idx}.jpeg")
 
-            generated_image.image.save(save_path)
-            generated_images.append(save_path)
+            written = self.writer.save(image.image_bytes, os.path.abspath(save_path))
+            # Keep the caller's relative path; only the extension may change
+            save_path = str(Path(save_path).with_suffix(Path(written).suffix))
+            saved_paths.append(save_path)
             print(f"  Saved: {save_path}")
 
-        return generated_images
+        return saved_paths
 
 
 def main():
     """Main function demonstrating Virtual Try-On usage."""
+    config.ensure_directories()
 
     # Initialize Virtual Try-On
     try: